@@ -1,3 +1,4 @@
 from . import cli
 from . import h5
+from . import parallel
 from . import windows
\ No newline at end of file
@@ -1,6 +1,10 @@
 from .agg import *
 from .calls2h5 import *
+from .catalog import *
 from .convert import *
 from .delete import *
 from .facet import *
+from .index import *
+from .matrix import *
+from .recompress import *
 from .version import *
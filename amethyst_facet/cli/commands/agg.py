@@ -1,4 +1,5 @@
 import logging
+from pathlib import Path
 from typing import *
 import warnings
 
@@ -17,12 +18,24 @@ class AmethystH5Aggregator():
         skip_barcodes, 
         variable_windows, 
         uniform_windows, 
+        from_windows,
+        max_rows_in_memory,
         compression, 
         compression_opts, 
+        chunk_rows,
+        chunk_cache_mb,
+        compact_dtypes,
+        shared_windows,
+        matrix,
+        matrix_nz,
+        chrom_sizes,
+        validation,
+        nproc,
         h5_out, 
         h5_in
     ):
         import amethyst_facet as fct
+        fct.h5.set_chunk_cache(chunk_cache_mb)
         if not h5_in:
             warnings.warn("No paths supplied for [H5_IN], so no aggregations will be computed.")
         parser = CLIOptionsParser()
@@ -39,6 +52,16 @@ class AmethystH5Aggregator():
 
         if not windows:
             warnings.warn("No window schemes supplied, so no aggregations will be computed.")
+            return
+
+        if from_windows and variable_windows:
+            raise click.UsageError("--from-windows can only be combined with uniform windows (-u), not variable windows (-v).")
+        if from_windows and max_rows_in_memory:
+            raise click.UsageError("--from-windows cannot be combined with --max-rows-in-memory.")
+        if matrix and (variable_windows or not chrom_sizes):
+            raise click.UsageError("--matrix requires --chrom-sizes and can only be used with uniform windows (-u).")
+        # Results are written to matrix stores instead of per-barcode datasets if given.
+        self.matrix = (fct.windows.read_chrom_sizes(chrom_sizes), matrix_nz) if matrix else None
 
         skip = {"barcodes":skip_barcodes}
         only = {
@@ -46,14 +69,92 @@ class AmethystH5Aggregator():
             "contexts": only_contexts,
             "barcodes": only_barcodes
         }
-        reader = fct.h5.ReaderV2(paths=paths, skip=skip, only=only)
+        if from_windows:
+            only["windows"] = [from_windows]
+        reader = fct.h5.ReaderV2(paths=paths, skip=skip, only=only, validation=validation)
+        aggregator = fct.windows.MultiWindowsAggregator(windows)
+
+        # Results are written by a dedicated process when aggregating in parallel into a separate
+        # output file. Output written into the input files is written here instead, as this
+        # process holds the inputs open while reading them.
+        separate_output = h5_out is not None and Path(h5_out).resolve() not in [Path(it).resolve() for it in paths]
+        writer = fct.parallel.DatasetWriter(
+            h5_out, compression, compression_opts, process = nproc > 1 and separate_output,
+            chunk_rows = chunk_rows,
+            compact_dtypes = compact_dtypes,
+            shared_windows = shared_windows
+        )
+
+        if max_rows_in_memory:
+            self.aggregate_streaming(reader, aggregator, max_rows_in_memory, nproc, writer)
+            return
+
+        if from_windows:
+            # Derive schemes from existing windows datasets without reading observations.
+            # Every source is planned from its metadata before any data is read or written,
+            # so an underivable scheme fails before partial results reach the output.
+            sources = [self.with_scheme_attrs(it) for it in reader.windows(lazy=True)]
+            for it in sources:
+                aggregator.windows_plan(it)
+            aggregate = aggregator.aggregate_windows
+        else:
+            sources = reader.observations(lazy=True)
+            aggregate = aggregator.aggregate
+        # Data is read one source at a time, as workers become free.
+        sources = (it.load() for it in sources)
         
-        for window in windows:
-            display_sample = True
-            for observation in reader.observations():
-                result = window.aggregate(observation)
-                result.writev2(h5_out, compression, compression_opts, display_sample = display_sample)
-                display_sample = False
+        # Each source dataset is read once and every window scheme is computed from it.
+        # Aggregation runs in worker processes when nproc > 1, but results come back
+        # in order and are written here, so the output file only has one writer.
+        displayed = set()
+        with writer, fct.parallel.OrderedPool(aggregate, nproc) as pool:
+            for results in pool.map(sources):
+                for result in results:
+                    if self.matrix:
+                        writer.write_matrix(result, *self.matrix)
+                        continue
+                    writer.write(result, display_sample = result.name not in displayed)
+                    displayed.add(result.name)
+
+    def aggregate_streaming(self, reader, aggregator, max_rows_in_memory, nproc, writer):
+        """Aggregate observations in slices of at most max_rows_in_memory rows, appending results.
+
+        Peak memory is roughly (2*nproc + 1) slices of observations, plus the windows of each
+        slice, the few windows held back at slice boundaries and the writer's queue.
+        """
+        import amethyst_facet as fct
+        streaming = fct.windows.StreamingWindowsAggregator(aggregator)
+        # The first slice of each output dataset creates it, so existing datasets raise as in write,
+        # and later slices are appended to it.
+        created, displayed = set(), set()
+        with writer, fct.parallel.OrderedPool(streaming.aggregate, nproc) as pool:
+            for slices in reader.observation_slices(max_rows_in_memory):
+                logging.debug(f"Streaming {slices.path}::{slices.h5path} in slices of {max_rows_in_memory} rows")
+                for item in pool.map(slices):
+                    for result in streaming.merge(item):
+                        if self.matrix:
+                            writer.write_matrix(result, *self.matrix)
+                        elif (result.path, result.h5path) in created:
+                            writer.append(result)
+                        else:
+                            writer.write(result, display_sample = result.name not in displayed, resizable = True)
+                            created.add((result.path, result.h5path))
+                            displayed.add(result.name)
+
+    def with_scheme_attrs(self, windows):
+        """Record the uniform scheme of an existing windows dataset in its attrs.
+
+        Datasets written before schemes were stored as attributes fall back to parsing
+        the dataset name, which works for default names like '10000' or '1000:250+1'.
+        """
+        import amethyst_facet as fct
+        if fct.windows.UniformWindowsAggregator.from_attrs(windows.attrs) is None:
+            try:
+                scheme = UniformWindowsParser().parse(windows.name)
+                windows.attrs.update(scheme.attrs)
+            except Exception:
+                logging.debug(f"Could not determine uniform scheme of {windows.display_path} from its name")
+        return windows
         
 
 @click.command
@@ -90,7 +191,54 @@ class AmethystH5Aggregator():
         "Window name defaults to filename prefix. Examples: -w special_fancy_windows=sfw.tsv -w sfw.tsv"
     )
 )
+@click.option(
+    "--from-windows", "--from",
+    type=str,
+    default=None,
+    help = (
+        "Name of an existing uniform windows dataset at /[context]/[barcode]/[name] to compute "
+        "the uniform windows (-u) from, instead of the observations. Each requested scheme's step must be a "
+        "multiple of the existing window size, with the same offset modulo that size."
+    )
+)
+@click.option(
+    "--max-rows-in-memory",
+    type=int,
+    default=None,
+    help = (
+        "Stream each observations dataset in slices of at most this many rows instead of loading it whole. "
+        "Windows that cross a slice boundary are completed with the next slice, so results are unchanged. "
+        "Requires observations sorted by chr, then pos."
+    )
+)
 @compression
+@chunking
+@compact_dtypes
+@shared_windows
+@click.option(
+    "--matrix",
+    is_flag=True,
+    default=False,
+    help = (
+        "Write uniform windows to a dense cells x windows matrix per context and scheme at "
+        "/metadata/matrices/[context]/[name] instead of per-barcode datasets. Requires --chrom-sizes. "
+        "Suited to coarse genome-wide schemes, as every window of every cell is stored."
+    )
+)
+@click.option(
+    "--matrix-nz",
+    is_flag=True,
+    default=False,
+    help = "Also store c_nz and t_nz matrices with --matrix."
+)
+@click.option(
+    "--chrom-sizes",
+    type=str,
+    default=None,
+    help = "Chromosome names and lengths (UCSC chrom.sizes format) defining the windows of each --matrix column."
+)
+@validation
+@nproc
 @h5_out
 @click.argument("h5-in", nargs=-1)
 def agg(
@@ -101,8 +249,19 @@ def agg(
     skip_barcodes, 
     variable_windows, 
     uniform_windows, 
+    from_windows,
+    max_rows_in_memory,
     compression, 
     compression_opts,
+    chunk_rows,
+    chunk_cache_mb,
+    compact_dtypes,
+    shared_windows,
+    matrix,
+    matrix_nz,
+    chrom_sizes,
+    validation,
+    nproc,
     h5_out, 
     h5_in):
     """Compute window sums over methylation observations stored in Amethyst v2.0.0 format.
@@ -122,6 +281,32 @@ def agg(
     with the first window starting at bp position 1 over all datasets
     at /context/barcode/1 and save in cells.h5 at /context/barcode/10000:5000+1
     facet agg --uniform-windows 10000:5000
+
+    \b
+    Compute 100kb and 1Mb windows from existing 10kb windows, without
+    reading the observations
+    facet agg -u 100000 -u 1000000 --from-windows 10000 cells.h5
+
+    \b
+    Compute 1kb windows over a bulk sample while holding at most 
+    5 million observations in memory per process
+    facet agg -u 1000 --max-rows-in-memory 5000000 bulk.h5
+
+    \b
+    Compute 10kb windows stored with the narrowest integer columns
+    facet agg -u 10000 --compact-dtypes cells.h5
+
+    \b
+    Compute 10kb windows storing their coordinates once for all barcodes
+    facet agg -u 10000 --shared-windows cells.h5
+
+    \b
+    Compute 100kb windows as a cells x windows matrix per context
+    facet agg -u 100000 --matrix --chrom-sizes hg38.chrom.sizes cells.h5
+
+    \b
+    Compute 500bp windows using 16 worker processes
+    facet agg -u 500 -p 16 cells.h5
     """
     aggregator = AmethystH5Aggregator()
     aggregator.aggregate(
@@ -132,8 +317,19 @@ def agg(
         skip_barcodes, 
         variable_windows, 
         uniform_windows, 
+        from_windows,
+        max_rows_in_memory,
         compression, 
         compression_opts, 
+        chunk_rows,
+        chunk_cache_mb,
+        compact_dtypes,
+        shared_windows,
+        matrix,
+        matrix_nz,
+        chrom_sizes,
+        validation,
+        nproc,
         h5_out, 
         h5_in
     )
\ No newline at end of file
@@ -1,11 +1,14 @@
 from dataclasses import dataclass
-import itertools
 from enum import Enum
 from typing import *
 from pathlib import Path
 from contextlib import contextmanager
 from abc import ABC, abstractmethod
+import gzip
+import io
+import itertools
 import sys
+import tempfile
 from warnings import warn
 
 import click
@@ -14,13 +17,19 @@ import parse
 import h5py
 import numpy as np
 from loguru import logger
-from pydantic import BaseModel, FilePath, validate_call, model_validator, Field, BeforeValidator, PlainSerializer, ConfigDict, InstanceOf
+from pydantic import BaseModel, FilePath, validate_call, model_validator, Field, BeforeValidator, PlainSerializer, ConfigDict, InstanceOf, PrivateAttr
 
+from ..decorators import chunking, layout, nproc
+from ..parse import CLIOptionsParser
+import amethyst_facet as fct
 import amethyst_facet.errors
 
 
 AMETHYST_H5_DTYPE: Final = [('chr', 'S10'), ('pos', int), ('t', int), ('c', int)]
 AMETHYST_H5_SORT_BY: Final = ["chr", "pos"]
+# Approximate memory held per .cov row while it is parsed, sorted and converted for writing,
+# used to turn a streaming memory budget into rows.
+COV_ROW_BYTES: Final = 128
 
 class CovSchema(BaseModel):
     chr: int = Field(0, ge=0)
@@ -92,6 +101,8 @@ class AmethystDatasetV2(BaseModel):
         """
     )
     data_source: Optional[Any] = None
+    part: int = Field(default = 0, description = "Index of this part of a dataset streamed in parts. Parts after the first are appended to it.")
+    last_part: bool = Field(default = True, description = "Whether this is the last part of its dataset.")
 
     @staticmethod
     def from_h5_dataset(dataset: h5py.Dataset, load_data: bool = True) -> "AmethystDatasetV2":
@@ -127,35 +138,142 @@ class BaseAmethystDataSource(BaseModel, ABC):
         """
         ...
 
+def cov_polars_schema(cov_schema: CovSchema) -> dict[str, pl.DataType]:
+    """Polars schema of the columns of a .cov file, in file order"""
+    schema = [None]*5
+    schema[cov_schema.chr] = ("chr", pl.String)
+    schema[cov_schema.pos] = ("pos", pl.Int64)
+    schema[cov_schema.pct] = ("pct", pl.Float64)
+    schema[cov_schema.t] = ("t", pl.Int64)
+    schema[cov_schema.c] = ("c", pl.Int64)
+    return {k: v for k, v in schema}
+
+def read_cov_batches(path: Path, cov_schema: CovSchema, batch_bytes: int) -> Generator[pl.DataFrame, None, None]:
+    """Parse a .cov or .cov.gz file in batches of whole lines from about batch_bytes of text.
+
+    Gzipped files are decompressed as they are read, so neither the file nor its decompressed
+    text is ever held in memory whole.
+    """
+    schema = cov_polars_schema(cov_schema)
+    def parse(text: bytes) -> pl.DataFrame:
+        frame = pl.read_csv(io.BytesIO(text), separator = cov_schema.delimiter, schema = schema, has_header = False)
+        return frame.drop("pct")
+
+    with (gzip.open if path.suffix == ".gz" else open)(path, "rb") as file:
+        remainder = b""
+        while block := file.read(batch_bytes):
+            text = remainder + block
+            end = text.rfind(b"\n") + 1
+            text, remainder = text[:end], text[end:]
+            if text:
+                yield parse(text)
+        if remainder.strip():
+            yield parse(remainder)
+
+class ExternalCovSort:
+    """Sort .cov rows by (chr, pos) holding at most about max_rows rows in memory.
+
+    Rows are added in batches. Once max_rows are pending, they are split by chromosome and
+    each chromosome's rows are written sorted by pos to a parquet spill file in directory, a
+    sorted run. Sorted rows are then read back chromosome by chromosome, in chunks of at most
+    about max_rows rows. A chromosome whose runs hold more than that is read in ranges of
+    positions, which only read the row groups of each run that overlap the range. If rows
+    never exceed max_rows, nothing is spilled and the rows are sorted in memory.
+    """
+    # Positions sampled from each run to choose the range boundaries of large chromosomes.
+    samples_per_run: Final = 1024
+
+    def __init__(self, max_rows: int, directory: str | Path):
+        self.max_rows = max(max_rows, 1)
+        self.directory = Path(directory)
+        self.pending: list[pl.DataFrame] = []
+        self.pending_rows = 0
+        # chromosome -> [(spill file, rows, sampled positions)]
+        self.runs: dict[str, list[tuple[Path, int, np.ndarray]]] = {}
+        self.spills = 0
+
+    def add(self, batch: pl.DataFrame):
+        self.pending.append(batch)
+        self.pending_rows += len(batch)
+        if self.pending_rows >= self.max_rows:
+            self.spill()
+
+    def spill(self):
+        """Write pending rows as one sorted run per chromosome"""
+        if not self.pending:
+            return
+        frame = pl.concat(self.pending)
+        self.pending, self.pending_rows = [], 0
+        for (chrom,), rows in frame.partition_by("chr", as_dict = True).items():
+            rows = rows.drop("chr").sort("pos")
+            path = self.directory/f"run{self.spills}.parquet"
+            rows.write_parquet(path, row_group_size = max(self.max_rows//16, 1024))
+            stride = max(len(rows)//self.samples_per_run, 1)
+            self.runs.setdefault(chrom, []).append((path, len(rows), rows["pos"].gather_every(stride).to_numpy()))
+            self.spills += 1
+
+    def chunks(self) -> Generator[pl.DataFrame, None, None]:
+        """Every added row sorted by chr, then pos, in chunks of at most about max_rows rows"""
+        if not self.runs:
+            frame = pl.concat(self.pending) if self.pending else pl.DataFrame(schema = {"chr": pl.String, "pos": pl.Int64, "t": pl.Int64, "c": pl.Int64})
+            self.pending, self.pending_rows = [], 0
+            frame = frame.sort(AMETHYST_H5_SORT_BY)
+            for start in range(0, max(len(frame), 1), self.max_rows):
+                yield frame.slice(start, self.max_rows)
+            return
+        self.spill()
+        for chrom in sorted(self.runs):
+            runs = self.runs[chrom]
+            for lower, upper in self.ranges(runs):
+                scans = [pl.scan_parquet(path) for path, _, _ in runs]
+                if lower is not None:
+                    scans = [it.filter(pl.col.pos >= lower) for it in scans]
+                if upper is not None:
+                    scans = [it.filter(pl.col.pos < upper) for it in scans]
+                rows = pl.concat(scans).collect().sort("pos")
+                yield rows.select(pl.lit(chrom).alias("chr"), pl.all())
+
+    def ranges(self, runs: list[tuple[Path, int, np.ndarray]]) -> list[tuple[int | None, int | None]]:
+        """Position ranges [lower, upper) splitting a chromosome's runs into about max_rows rows each"""
+        total = sum(rows for _, rows, _ in runs)
+        count = -(-total//self.max_rows)
+        if count <= 1:
+            return [(None, None)]
+        samples = np.sort(np.concatenate([positions for _, _, positions in runs]))
+        boundaries = np.unique(samples[(np.arange(1, count)*len(samples))//count])
+        edges = [None, *boundaries.tolist(), None]
+        return list(zip(edges[:-1], edges[1:]))
+
 class CovSource(BaseAmethystDataSource):
     path: FilePath
     context: str
     barcode: str
     name: str
     cov_schema: CovSchema = CovSchema()
+    memory_budget_mb: float | None = None
+    spill_dir: Path | None = None
 
     @validate_call
     def datasets(self, load_data: bool = True) -> Generator[AmethystDatasetV2, None, None]:
         """Extract Amethyst dataset from .cov file
 
+        With a memory_budget_mb, the file is streamed in parts that are appended in order
+        (see streamed_datasets).
+
         Returns:
             Generator[AmethystDatasetV2, None, None]: "chr", "pos", "t", "c" columns from .cov file sorted in ascending order,
             lexicographically by "chr", then numerically by "pos"
         """
-        if load_data:
-            schema = [None]*5
-            schema[self.cov_schema.chr] = ("chr", pl.String)
-            schema[self.cov_schema.pos] = ("pos", pl.Int64)
-            schema[self.cov_schema.pct] = ("pct", pl.Float64)
-            schema[self.cov_schema.t] = ("t", pl.Int64)
-            schema[self.cov_schema.c] = ("c", pl.Int64)
-            schema = {k: v for k, v in schema}
+        if load_data and self.memory_budget_mb is not None:
+            yield from self.streamed_datasets()
+            return
 
+        if load_data:
             data = (
                 pl.read_csv(
                     source = self.path, 
                     separator = self.cov_schema.delimiter, 
-                    schema = schema,
+                    schema = cov_polars_schema(self.cov_schema),
                     has_header = False
                 )
                 .drop("pct")
@@ -174,7 +292,38 @@ class CovSource(BaseAmethystDataSource):
             data = data, 
             data_source = self.data_source
         )
-    
+
+    def streamed_datasets(self) -> Generator[AmethystDatasetV2, None, None]:
+        """Stream the .cov file as sorted parts of one dataset, holding about memory_budget_mb in memory.
+
+        The file is parsed in batches and sorted externally (see ExternalCovSort), spilling
+        to a temporary directory in spill_dir (or the system default) that is removed after.
+        """
+        budget = int(self.memory_budget_mb*2**20)
+        max_rows = budget//COV_ROW_BYTES
+        with tempfile.TemporaryDirectory(prefix = "facet_spill_", dir = self.spill_dir) as directory:
+            sorter = ExternalCovSort(max_rows, directory)
+            for batch in read_cov_batches(self.path, self.cov_schema, max(budget//8, 2**16)):
+                sorter.add(batch)
+            if sorter.runs:
+                logger.info("Sorted {} in {} spill files", self.path, sorter.spills)
+            chunks = sorter.chunks()
+            chunk = next(chunks)
+            for part in itertools.count():
+                following = next(chunks, None)
+                yield AmethystDatasetV2(
+                    context = self.context,
+                    barcode = self.barcode,
+                    name = self.name,
+                    data = fct.h5.dataset.frame_to_numpy(chunk, AMETHYST_H5_DTYPE),
+                    data_source = self.data_source,
+                    part = part,
+                    last_part = following is None
+                )
+                if following is None:
+                    return
+                chunk = following
+
     def source_name(self) -> list[Path]:
         return [self.cov_path]
 
@@ -204,7 +353,7 @@ class ScaleMethylParquetSource(BaseAmethystDataSource):
 
             # Get one dataframe per context
             context_dataset_dfs = data.partition_by("context", as_dict=True)
-            for context, dataset_df in context_dataset_dfs.items():
+            for (context,), dataset_df in context_dataset_dfs.items():
                 # Convert dataframe to sorted numpy array with columns 'chr', 'pos', 't', 'c'
                 data = (
                     dataset_df
@@ -217,12 +366,14 @@ class ScaleMethylParquetSource(BaseAmethystDataSource):
                 # Yield one dataset per context
                 yield AmethystDatasetV2(context = context, barcode = self.barcode, name = self.name, data = data)
         else:
-            # Yield one dataset per context, but don't return the data
+            # Yield one dataset per context, but don't return the data. The projection pushes down
+            # into the scan, so only the context column is read and decoded.
             data = (
-                pl.read_parquet(self.path)
-                .select("context")
+                pl.scan_parquet(self.path)
+                .select(pl.col("context").unique().sort())
+                .collect()
             )
-            for context in data["context"].unique():
+            for context in data["context"]:
                 yield AmethystDatasetV2(
                     context = context, 
                     barcode = self.barcode, 
@@ -240,18 +391,37 @@ class AmethystH5Source(BaseAmethystDataSource):
         def _recursive_yield(group_or_file):
             # Iterate over immediate children
             for name, obj in group_or_file.items():
-                
+                obj = fct.h5.as_dataset(obj)
+
                 if isinstance(obj, h5py.Group):
                     # If Group: Recurse down
                     yield from _recursive_yield(obj)
                     
-                elif isinstance(obj, h5py.Dataset):
+                elif isinstance(obj, fct.h5.DATASET_TYPES):
                     # If Dataset: Check filter and yield
-                    if obj.name != "/metadata/version":
+                    if not obj.name.startswith("/metadata/"):
                         yield AmethystDatasetV2.from_h5_dataset(obj, load_data)
 
         with h5py.File(self.path, "r") as h5_file:
             yield from _recursive_yield(h5_file)
+            for store in fct.h5.consolidated_stores(h5_file):
+                for block in store.datasets():
+                    yield AmethystDatasetV2.from_h5_dataset(block, load_data)
+
+def target_dataset_names(path: Path) -> set[str]:
+    """Absolute names of the datasets in an Amethyst H5 file, from its catalog if it has one.
+
+    Consolidated observations are found from their stores' barcodes. Files without a catalog
+    are traversed, opening each dataset's metadata but reading no data.
+    """
+    with h5py.File(path, "r") as h5_file:
+        catalog = fct.h5.read_catalog(h5_file)
+        if catalog is None:
+            return {it.absolute_name for it in AmethystH5Source(path = path).datasets(load_data = False)}
+        names = {f"/{context}/{barcode}/{name}" for context, barcode, name in catalog.select("context", "barcode", "name").iter_rows()}
+        for store in fct.h5.consolidated_stores(h5_file):
+            names.update(f"/{store.context}/{barcode}/{store.name}" for barcode in store.barcodes)
+        return names
 
 class AmethystSourceCombiner(BaseAmethystDataSource):
     sources: list[BaseAmethystDataSource]
@@ -263,6 +433,16 @@ class AmethystSourceCombiner(BaseAmethystDataSource):
         for source in self.sources:
             yield from source.datasets(load_data = load_data)
 
+def load_source_datasets(source: BaseAmethystDataSource) -> list[AmethystDatasetV2] | None:
+    """Read, partition, sort and convert every dataset of a source in a worker process.
+
+    Returns None for Amethyst H5 sources and .cov sources streamed within a memory budget,
+    which are read by the writer a dataset or part at a time instead of being held in memory whole.
+    """
+    if isinstance(source, AmethystH5Source) or getattr(source, "memory_budget_mb", None) is not None:
+        return None
+    return list(source.datasets(load_data = True))
+
 class ConflictHandler(str, Enum):
     ERROR = "ERROR" # Raise error on conflict
     OVERWRITE = "OVERWRITE" # Overwrite previous dataset on conflict
@@ -292,16 +472,19 @@ class AmethystH5Inserter(BaseModel):
     ```
     """
     source_combiner: AmethystSourceCombiner
+    _plan: list[list[str]] | None = PrivateAttr(default = None)
 
     @validate_call
     def insert_from_sources(
         self, 
         target_amethyst_h5_path: Path, 
-        compression: str = "gzip", 
+        compression: str | int | None = "gzip", 
         compression_opts: Any = 6, mode: str = "a",
+        chunk_rows: int | None = None,
+        layout: str = "rows",
         source_target_dataset_name_conflict_handler: ConflictHandler = ConflictHandler.ERROR,
-        dry_run = False
-
+        dry_run = False,
+        nproc: int = 1
     ):
         """Extract data from sources and insert into the H5 file at amethyst_h5_path
 
@@ -309,16 +492,28 @@ class AmethystH5Inserter(BaseModel):
             target_amethyst_h5_path: Amethyst H5 file to be written or appended to.
             compression: 'compression' argument for h5py.create_dataset
             compression_opts: 'compression_opts' argument for h5py.create_dataset
+            chunk_rows: Rows per chunk of written datasets, or None for the default policy of fct.h5.chunk_rows
+            layout: 'rows', 'columnar' or 'consolidated' on-disk layout of observations (see fct.h5.columnar)
             source_target_dataset_name_conflict_handler: Behavior when a source dataset has the same
                 name as a dataset in the target Amethyst H5 file (only relevant if the target H5 file exists)
             dry_run: If true, simulates run without modifying files.
+            nproc: Number of worker processes loading .cov and .parquet sources. Datasets are
+                still inserted by this process, in the same order as with nproc = 1.
 
         Raises:
             ValueError: Duplicate absolute dataset names found across input sources, or
-            input sources collide with datasets that already exits in target Amethyst H5 file.
+            input sources collide with datasets that already exits in target Amethyst H5 file,
+            or .cov sources are streamed into a layout other than 'rows'.
         """
         log_prefix = "[dry run] " if dry_run else ""
 
+        # Streamed parts are appended to resizable datasets, which only the rows layout does without rewriting them.
+        streamed = [source for source in self.source_combiner.sources if getattr(source, "memory_budget_mb", None) is not None]
+        if streamed and layout != "rows":
+            raise ValueError(
+                f"{streamed[0].path} is streamed within a memory budget, which requires the 'rows' layout, not '{layout}'."
+            )
+
         # Make sure that input sources do not conflict across input sources or with 
         # existing datasets in the output H5 file if appending to an existing file
         # and if dataset name conflicts with the target Amethyst H5 object should raise an error.
@@ -356,78 +551,121 @@ class AmethystH5Inserter(BaseModel):
 
         logger.info("{}Writing source data to {}.", log_prefix, target_amethyst_h5_path)
 
+        # Sources whose every dataset would be skipped are not read at all.
+        sources = self.source_combiner.sources
+        if source_target_dataset_name_conflict_handler == ConflictHandler.SKIP and mode != "w" and target_amethyst_h5_path.exists():
+            existing = target_dataset_names(target_amethyst_h5_path)
+            kept = []
+            for source, names in zip(sources, self.plan()):
+                if names and existing.issuperset(names):
+                    logger.info("{}Skipping {} as all of its datasets are already present in {}", log_prefix, source.data_source or source, target_amethyst_h5_path)
+                else:
+                    kept.append(source)
+            sources = kept
+
+        # Sequentially load and insert all datasets into the target H5 file. The write session keeps
+        # the target open, and adds /metadata/version and a catalog if it creates the file.
         if dry_run:
-            mode = "r"
-
-        # Sequentially load and insert all datasets into the target H5 file.
-        with h5py.File(name = target_amethyst_h5_path, mode = mode) as h5_file:
-
-            # Add metadata with Amethyst format version if it doesn't already exist.
-            if version_dataset_name not in h5_file and not dry_run:
-                h5_file.create_dataset(version_dataset_name, data = required_version)
-
-            # Iteratively load data from sources and write to the target as new datasets
-            for dataset in self.source_combiner.datasets(load_data = True):
-                if dataset.absolute_name in h5_file:
+            target = h5py.File(name = target_amethyst_h5_path, mode = "r")
+        else:
+            target = fct.h5.WriteSession(target_amethyst_h5_path, compression, compression_opts, mode = mode, chunk_rows = chunk_rows, layout = layout)
+
+        with target:
+            h5_file = target if dry_run else target.file
+
+            # Overwritten consolidated blocks are removed up front, so each store is rewritten once
+            # and the new data is then written like a new dataset.
+            if source_target_dataset_name_conflict_handler == ConflictHandler.OVERWRITE and not dry_run:
+                target.drop_blocks(name for names in self.plan() for name in names)
+
+            # Iteratively load data from sources and write to the target as new datasets.
+            # Parts after the first of a streamed dataset are appended to it, unless it was skipped.
+            skipped = set()
+            for dataset in self.loaded_datasets(sources, nproc):
+                if dataset.part > 0:
+                    if dataset.absolute_name not in skipped and not dry_run:
+                        target.append(fct.h5.Dataset(dataset.context, dataset.barcode, dataset.name, dataset.data, validation = "trust"))
+                    continue
+                # Consolidated observations are blocks of a store rather than objects at their path.
+                block = fct.h5.find_block(h5_file, dataset.absolute_name)
+                if dataset.absolute_name in h5_file or block is not None:
                     if source_target_dataset_name_conflict_handler == ConflictHandler.OVERWRITE:
                         logger.info("{}original dataset at {}", log_prefix, dataset.absolute_name)
                         if not dry_run:
                             del h5_file[dataset.absolute_name]
                     elif source_target_dataset_name_conflict_handler == ConflictHandler.SKIP:
                         logger.info("{}Skipping write of {} as it is already present in {}", log_prefix, dataset, target_amethyst_h5_path)
+                        skipped.add(dataset.absolute_name)
                         continue
                 
                 logger.info("{}Writing {} to {}", log_prefix, dataset, dataset.absolute_name)
                 if not dry_run:
-                    h5_file.create_dataset(
-                        name = dataset.absolute_name,
-                        data = dataset.data,
-                        compression = compression,
-                        compression_opts = compression_opts
-                    )
+                    target.create(dataset.absolute_name, dataset.data, resizable = not dataset.last_part)
                     if not first_written:
                         logger.info(
-                            "First dataset written. Here is a sample of it as loaded from the H5 file:\n{}", 
-                            pl.from_numpy(h5_file[dataset.absolute_name][:])
+                            "First dataset written. Here is a sample of it as written to the H5 file:\n{}", 
+                            pl.from_numpy(dataset.data)
                         )
                         first_written = True
 
+    def loaded_datasets(self, sources: list[BaseAmethystDataSource], nproc: int = 1) -> Generator[AmethystDatasetV2, None, None]:
+        """Yield the datasets of sources with data, in source order.
+
+        With nproc > 1, worker processes load the sources ahead of the caller, which remains
+        the only process that writes the target.
+        """
+        if nproc == 1:
+            for source in sources:
+                yield from source.datasets(load_data = True)
+            return
+        with fct.parallel.OrderedPool(load_source_datasets, nproc) as pool:
+            for source, datasets in zip(sources, pool.map(sources)):
+                yield from source.datasets(load_data = True) if datasets is None else datasets
+
+    def plan(self) -> list[list[str]]:
+        """Absolute dataset names of each source, in source order.
+
+        Names come from metadata only: the parsed path of .cov files, the context column of
+        .parquet files and the structure of .h5 files. They are found once per inserter, and
+        the insert phase reuses them rather than scanning the sources again.
+        """
+        if self._plan is None:
+            self._plan = [
+                [dataset.absolute_name for dataset in source.datasets(load_data = False)]
+                for source in self.source_combiner.sources
+            ]
+        return self._plan
+
     def detect_dataset_name_collisions(self, target_amethyst_h5_path: Path | None = None):
-        """Raise an exception if any dataset names collide across the input sources.
+        """Raise an exception if any dataset names collide across the input sources,
+        or with the datasets of the target file if given.
 
         Raises:
             ValueError: Duplicate absolute dataset names found across input sources.
         """
-        # Store absolute h5 dataset names discovered over all input sources.
-        absolute_names: dict[str, AmethystDatasetV2] = {}
-
-        # Iterate through source datasets without loading data
-        datasets = [self.source_combiner.datasets(load_data = False)]
+        # Store absolute h5 dataset names discovered over all input sources,
+        # along with the source they were found in for logging.
+        absolute_names: dict[str, Any] = {}
+        for source, names in zip(self.source_combiner.sources, self.plan()):
+            for absolute_name in names:
+                if absolute_name in absolute_names:
+                    raise ValueError(
+                        f"{absolute_name} found in two places: {absolute_names[absolute_name]} (loaded first) "
+                        f"and {source.data_source or source} (loaded second, caused collision)."
+                    )
+                absolute_names[absolute_name] = source.data_source or source
 
         # If appending to existing Amethyst H5 file, check for collisions between
         # existing datasets and input sources.
-        if check_output_path := target_amethyst_h5_path and target_amethyst_h5_path.exists():
-            output_as_source = AmethystH5Source(path = target_amethyst_h5_path)
-            datasets.append(output_as_source.datasets(load_data = False))
-
-        for dataset in itertools.chain.from_iterable(datasets):
-            # 1. Get current dataset absolute name
-            absolute_name = dataset.absolute_name
-
-            # 2. Check if it was already found
-            source1 = absolute_names.get(absolute_name)
-            source2 = dataset
-
-            # 3. Add it to the stored names, along with the dataset object itself for logging,
-            # or raise a ValueError if a duplicate was found.
-            if source1 is None:
-                absolute_names[absolute_name] = dataset
-            else:
-                raise ValueError(
-                    f"{absolute_name} found in two places: {source1} (loaded first) "
-                    f"and {source2} (loaded second, caused collision)."
-                )              
-        
+        if target_amethyst_h5_path and target_amethyst_h5_path.exists():
+            existing = target_dataset_names(target_amethyst_h5_path)
+            for absolute_name, source in absolute_names.items():
+                if absolute_name in existing:
+                    raise ValueError(
+                        f"{absolute_name} found in two places: {source} (loaded first) "
+                        f"and {target_amethyst_h5_path} (loaded second, caused collision)."
+                    )
+
         # No duplicates found -- success.
 
 class ContextBarcode(BaseModel):
@@ -577,14 +815,28 @@ facet --glob ./dir1/*.cov --glob ./dir2/*.cov cells.h5
     )
 )
 @click.option("--overwrite/--append", is_flag=True, default=True, show_default=True, help="""If HDF5_PATH exists, overwrite. Otherwise, new datasets are appended.""")
-@click.option("--compression", default="gzip", show_default=True, help="""Compression algorithm applied to written HDF5 datsets.""")
-@click.option("--compression_opts", default="6", show_default=True, help="Value of compression_opts argument for h5py create_dataset, specific to compression algorithm used.")
+@click.option("--compression", default="gzip", show_default=True, help="""Compression algorithm applied to written HDF5 datsets, optionally with a level (i.e. 'zstd:3').""")
+@click.option("--compression_opts", default=None, help="Value of compression_opts argument for h5py create_dataset, specific to compression algorithm used. Defaults to level 6 for gzip and to the codec's own default otherwise.")
+@chunking
+@layout
 @click.option("--cov-chr-col", default=0, show_default=True, help="Index of 'chr' column in .cov source datasets")
 @click.option("--cov-pos-col", default=1, show_default=True, help="Index of 'pos' column in .cov source datasets")
 @click.option("--cov-pct-col", default=2, show_default=True, help="Index of 'pct' column in .cov source datasets")
 @click.option("--cov-t-col", default=3, show_default=True, help="Index of 't' column in .cov source datasets")
 @click.option("--cov-c-col", default=4, show_default=True, help="Index of 'c' column in .cov source datasets")
 @click.option("--cov-delimiter", default="\t", show_default=True, help="Column delimiter character used in .cov source datasets")
+@click.option(
+    "--memory-budget-mb",
+    type = float,
+    default = None,
+    help = (
+"""Stream .cov source datasets in parts, holding about this many MB of each file in memory.
+Files larger than the budget are sorted externally through spill files and appended to resizable
+datasets in sorted chunks. Requires --layout rows. By default, each file is read into memory whole.
+"""
+    )
+)
+@click.option("--spill-dir", type = click.Path(file_okay = False, path_type = Path), default = None, help = "Directory for the temporary spill files of --memory-budget-mb. Defaults to the system temporary directory.")
 @click.option(
     "--source-target-dataset-name-conflict-handler", 
     type=click.Choice(choices = [ConflictHandler.ERROR, ConflictHandler.OVERWRITE, ConflictHandler.SKIP]),
@@ -603,6 +855,7 @@ Options:
     )
 )
 @click.option("--dry-run", is_flag = True, default=False, help="Run calls2h5 as dry run (files will not be changed)")
+@nproc
 @click.argument("target_amethyst_h5_path")
 @click.argument("source_paths", nargs=-1)
 def calls2h5(
@@ -615,14 +868,20 @@ def calls2h5(
     overwrite, 
     compression, 
     compression_opts,
+    chunk_rows,
+    chunk_cache_mb,
+    layout,
     cov_chr_col,
     cov_pos_col,
     cov_pct_col,
     cov_t_col,
     cov_c_col,
     cov_delimiter,
+    memory_budget_mb,
+    spill_dir,
     source_target_dataset_name_conflict_handler,
     dry_run,
+    nproc,
     target_amethyst_h5_path, 
     source_paths):
     """Ingest ScaleMethyl pipeline parquet files, plaintext .cov files, or other Amethyst H5 v2.0.0 files to Amethyst v2.0.0 HDF5 format
@@ -654,6 +913,14 @@ def calls2h5(
     /CH/ACTG_CATA_TTAA/1
     /CG/CAGG_GGAA_ACAA/1
     /CH/CAGG_GGAA_ACAA/1
+
+    \b
+    Read, sort and convert parquet files in 16 worker processes while this process writes cells.h5
+    facet calls2h5 -p 16 --parse {barcode}.parquet cells.h5 *.parquet
+
+    \b
+    Ingest .cov.gz files larger than memory, holding about 2 GB of each in memory
+    facet calls2h5 --memory-budget-mb 2000 --spill-dir /scratch --parse {barcode}.{context}.cov.gz cells.h5 *.cov.gz
     """
     if dry_run:
         logger.info("-----------Calls2h5 DRY RUN-----------")
@@ -712,6 +979,8 @@ def calls2h5(
                     barcode = context_barcode.barcode, 
                     name = dataset_name, 
                     cov_schema = cov_schema,
+                    memory_budget_mb = memory_budget_mb,
+                    spill_dir = spill_dir,
                     data_source = source_path
                 )
             case ".parquet":
@@ -753,22 +1022,23 @@ def calls2h5(
     # from one or more input sources of a variety of input files, checking for name conflicts.
     inserter = AmethystH5Inserter( source_combiner = AmethystSourceCombiner(sources = sources) )
     
-    # Convert compression_opts to number if possible,
-    # otherwise use as-is
-    try:
-        compression_opts = int(compression_opts)
-    except:
-        pass
-
     if not compression:
         compression = None
         compression_opts = None
+    else:
+        # Converts compression_opts to a number if possible, and codecs like 'zstd:3' to h5py filters
+        compression, compression_opts = CLIOptionsParser().parse_h5py_compression(compression, compression_opts)
+
+    fct.h5.set_chunk_cache(chunk_cache_mb)
 
     inserter.insert_from_sources(
         target_amethyst_h5_path, 
         mode = ("w" if overwrite else "a"), 
         compression = compression, 
         compression_opts = compression_opts,
+        chunk_rows = chunk_rows,
+        layout = layout,
         source_target_dataset_name_conflict_handler = source_target_dataset_name_conflict_handler,
-        dry_run = dry_run
+        dry_run = dry_run,
+        nproc = nproc
     )
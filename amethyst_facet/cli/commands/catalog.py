@@ -0,0 +1,74 @@
+from typing import *
+
+import click
+import polars as pl
+from loguru import logger
+
+from ..parse import CLIOptionsParser
+from ..decorators import *
+
+class AmethystH5Cataloger:
+    def rebuild(self, globs, max_rows, chunk_cache_mb, h5_in):
+        import amethyst_facet as fct
+        fct.h5.set_chunk_cache(chunk_cache_mb)
+        parser = CLIOptionsParser()
+        paths = parser.combine_paths_globs(h5_in, globs)
+
+        for path in paths:
+            with fct.h5.open(path, "a") as file:
+                catalog = fct.h5.rebuild_catalog(file, max_rows)
+            logger.info("Cataloged {} datasets in {}", len(catalog), path)
+
+    def show(self, globs, h5_in):
+        import amethyst_facet as fct
+        parser = CLIOptionsParser()
+        paths = parser.combine_paths_globs(h5_in, globs)
+
+        for path in paths:
+            with fct.h5.open(path, "r") as file:
+                catalog = fct.h5.read_catalog(file)
+            if catalog is None:
+                logger.info("{} has no catalog. Add one with 'facet catalog rebuild {}'.", path, path)
+                continue
+            with pl.Config(tbl_rows=100, tbl_cols=-1):
+                click.echo(f"{path}\n{catalog}")
+
+@click.group
+def catalog():
+    """Manage the /metadata/catalog listing every dataset in Amethyst v2.0.0 HDF5 files.
+
+    The catalog records each dataset's context, barcode, name, kind (observations or windows),
+    row count, dtype, uniform window scheme and whether it is sorted by chr, then pos or start.
+    facet agg, calls2h5, convert and delete keep it up to date in files they create, and readers
+    use it to select datasets without opening every group in the file.
+    """
+    pass
+
+@catalog.command
+@input_globs
+@click.option(
+    "--max-rows-in-memory", "max_rows",
+    type=int,
+    default=10_000_000,
+    show_default=True,
+    help="Maximum number of rows to read into memory at once when checking whether datasets are sorted."
+)
+@chunk_cache_mb
+@click.argument("h5_in", nargs=-1)
+def rebuild(globs, max_rows, chunk_cache_mb, h5_in):
+    """Build or replace the catalog of existing files by traversing their datasets.
+
+    Use on files written before catalogs existed, or modified by tools other than facet.
+
+    Example:
+
+    facet catalog rebuild *.h5
+    """
+    AmethystH5Cataloger().rebuild(globs, max_rows, chunk_cache_mb, h5_in)
+
+@catalog.command
+@input_globs
+@click.argument("h5_in", nargs=-1)
+def show(globs, h5_in):
+    """Print the catalog of each file."""
+    AmethystH5Cataloger().show(globs, h5_in)
@@ -6,20 +6,22 @@ from ..parse import CLIOptionsParser
 from ..decorators import *
 
 class AmethystH5Converter:
-    def convert(self, globs, observations, windows, only_contexts, only_barcodes, skip_barcodes, compression, compression_opts, h5_out, h5_in):
+    def convert(self, globs, observations, windows, only_contexts, only_barcodes, skip_barcodes, compression, compression_opts, chunk_rows, chunk_cache_mb, layout, validation, h5_out, h5_in):
         import amethyst_facet as fct
+        fct.h5.set_chunk_cache(chunk_cache_mb)
         parser = CLIOptionsParser()
         compression, compression_opts = parser.parse_h5py_compression(compression, compression_opts)
         paths = parser.combine_paths_globs(h5_in, globs)
         only_barcodes = parser.read_barcode_file(only_barcodes)
         skip_barcodes = parser.read_barcode_file(skip_barcodes)
 
-        v1reader = fct.h5.ReaderV1(paths, skip={"barcodes":skip_barcodes}, only={"contexts": only_contexts, "barcodes":only_barcodes}, mode="r")
+        v1reader = fct.h5.ReaderV1(paths, skip={"barcodes":skip_barcodes}, only={"contexts": only_contexts, "barcodes":only_barcodes}, mode="r", validation=validation)
 
-        for observations in v1reader.observations():
-            observations.writev2(h5_out, compression, compression_opts)
-        for windows in v1reader.windows():
-            windows.writev2(h5_out, compression, compression_opts)
+        with fct.h5.WriteSession(h5_out, compression, compression_opts, chunk_rows=chunk_rows, layout=layout) as session:
+            for observations in v1reader.observations():
+                session.write(observations)
+            for windows in v1reader.windows():
+                session.write(windows)
 
 @click.command
 @input_globs
@@ -39,9 +41,12 @@ class AmethystH5Converter:
     )
 @h5_subsets
 @compression
+@chunking
+@layout
+@validation
 @click.argument("h5_out")
 @click.argument("h5_in", nargs=-1)
-def convert(globs, observations, windows, only_contexts, only_barcodes, skip_barcodes, compression, compression_opts, verbosity, logfile, h5_out, h5_in):
+def convert(globs, observations, windows, only_contexts, only_barcodes, skip_barcodes, compression, compression_opts, chunk_rows, chunk_cache_mb, layout, validation, verbosity, logfile, h5_out, h5_in):
     """Convert one or more old Amethyst HDF5 file format to v2.0.0 format.
 
     The V1 format stores bp-level observations as (chr, pos, pct, c, t) in an HDF5 dataset at /context/barcode.
@@ -55,4 +60,4 @@ def convert(globs, observations, windows, only_contexts, only_barcodes, skip_bar
     If the same /context/barcode dataset is found in two or more input files, the conversion fails.
     """
     converter = AmethystH5Converter()
-    converter.convert(globs, observations, windows, only_contexts, only_barcodes, skip_barcodes, compression, compression_opts, h5_out, h5_in)
\ No newline at end of file
+    converter.convert(globs, observations, windows, only_contexts, only_barcodes, skip_barcodes, compression, compression_opts, chunk_rows, chunk_cache_mb, layout, validation, h5_out, h5_in)
\ No newline at end of file
@@ -1,6 +1,7 @@
 from concurrent.futures import ProcessPoolExecutor
 import glob
 import itertools
+import multiprocessing
 from typing import *
 import h5py
 import click
@@ -8,31 +9,39 @@ import click
 def delete_from_h5(args: Tuple[str]):
     """Delete all datasets matching dataset_name for all contexts and barcodes
     """
+    import amethyst_facet as fct
     amethyst_h5_file, name, level = args
 
-    def safe_del(obj):
-        try:
-            del obj
-        except:
-            pass
-
     with h5py.File(amethyst_h5_file, 'a') as f:
+        deleted = []
         for context in f:
             context_grp = f[f"/{context}"]
 
-            if level == "context" and context == name:
-                safe_del(context_grp)
-            elif context == "metadata":
+            if context == "metadata":
                 continue
+            elif level == "context" and context == name:
+                deleted.append(context_grp.name)
             if level in ["barcode", "dataset"]:
                 for barcode in context_grp:
                     barcode_grp = context_grp[barcode]
                     if level == "barcode" and barcode == name:
-                        safe_del(barcode_grp)
-                    elif level == "dataset":
-                        for dataset in barcode_grp:
-                            if dataset == name:
-                                safe_del(barcode_grp[name])
+                        deleted.append(barcode_grp.name)
+                    elif level == "dataset" and name in barcode_grp:
+                        deleted.append(barcode_grp[name].name)
+
+        # Objects are deleted after traversal, as deleting while iterating a group skips members.
+        for path in deleted:
+            del f[path]
+        fct.h5.remove_from_catalog(f, deleted)
+        # Shared window coordinates are deleted with the scheme's datasets.
+        if level == "dataset" and fct.h5.windows_table_path(name) in f:
+            del f[fct.h5.windows_table_path(name)]
+        # Consolidated observations are deleted by store, or rewritten without a deleted barcode.
+        for store in list(fct.h5.consolidated_stores(f)):
+            if (level == "context" and store.context == name) or (level == "dataset" and store.name == name):
+                del f[store.path]
+            elif level == "barcode":
+                store.drop([name])
 
 @click.command
 @click.option(
@@ -80,7 +89,8 @@ python facet.py delete dataset 500 demo.h5
     """
     filenames: List[str] = list(filenames) + list(itertools.chain.from_iterable([glob.glob(it) for it in _globs]))
   
-    with ProcessPoolExecutor(max_workers=nproc) as ppe:
+    # Workers are spawned rather than forked, as forking after polars has started its thread pool can deadlock.
+    with ProcessPoolExecutor(max_workers=nproc, mp_context=multiprocessing.get_context("spawn")) as ppe:
         [
             ppe.submit(delete_from_h5, (filename, h5obj_name, h5obj)).result()
             for filename in filenames
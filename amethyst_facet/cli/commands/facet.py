@@ -2,8 +2,12 @@ import click
 
 from .agg import agg
 from .calls2h5 import calls2h5
+from .catalog import catalog
 from .convert import convert
 from .delete import delete
+from .index import index
+from .matrix import matrix
+from .recompress import recompress
 from .version import version
 
 from loguru import logger
@@ -15,6 +19,10 @@ def facet():
 
 facet.add_command(agg, name="agg")
 facet.add_command(calls2h5, name="calls2h5")
+facet.add_command(catalog, name="catalog")
 facet.add_command(convert, name="convert")
 facet.add_command(delete, name="delete")
+facet.add_command(index, name="index")
+facet.add_command(matrix, name="matrix")
+facet.add_command(recompress, name="recompress")
 facet.add_command(version, name="version")
\ No newline at end of file
@@ -0,0 +1,57 @@
+from typing import *
+
+import click
+from loguru import logger
+
+from ..parse import CLIOptionsParser
+from ..decorators import *
+
+class AmethystH5Indexer:
+    def index(self, globs, only_contexts, max_rows, chunk_cache_mb, h5_in):
+        import amethyst_facet as fct
+        fct.h5.set_chunk_cache(chunk_cache_mb)
+        parser = CLIOptionsParser()
+        paths = parser.combine_paths_globs(h5_in, globs)
+
+        for path in paths:
+            with fct.h5.open(path, "a") as file:
+                for context in file:
+                    if context == "metadata" or (only_contexts and context not in only_contexts):
+                        continue
+                    for barcode in file[context]:
+                        for name, dataset in file[context][barcode].items():
+                            dataset = fct.h5.as_dataset(dataset)
+                            if not isinstance(dataset, fct.h5.DATASET_TYPES) or "chr" not in (dataset.dtype.names or []):
+                                continue
+                            index = fct.h5.build_chromosome_index(dataset, max_rows)
+                            fct.h5.write_chromosome_index(dataset, index)
+                            logger.debug("Indexed {}::{}", path, dataset.name)
+            logger.info("Finished indexing {}", path)
+
+@click.command
+@input_globs
+@only_contexts
+@click.option(
+    "--max-rows-in-memory", "max_rows",
+    type=int,
+    default=10_000_000,
+    show_default=True,
+    help="Maximum number of rows of the chr column to read into memory at once."
+)
+@chunk_cache_mb
+@click.argument("h5_in", nargs=-1)
+def index(globs, only_contexts, max_rows, chunk_cache_mb, h5_in):
+    """Add chromosome indexes to datasets in existing Amethyst v2.0.0 HDF5 files.
+
+    Datasets written by facet calls2h5, facet convert and facet agg store the row range of each
+    chromosome in the chr_index_names and chr_index_offsets attributes, so that a single
+    chromosome can be read without loading the whole dataset. This command adds the index to
+    every observations and windows dataset in files written before it existed. Files are
+    modified in place.
+
+    Example:
+
+    facet index *.h5
+    """
+    indexer = AmethystH5Indexer()
+    indexer.index(globs, only_contexts, max_rows, chunk_cache_mb, h5_in)
@@ -0,0 +1,152 @@
+from pathlib import Path
+from typing import *
+
+import click
+import h5py
+from loguru import logger
+
+from ..parse import CLIOptionsParser
+from ..decorators import *
+
+class AmethystH5MatrixExporter:
+    def export(
+            self,
+            globs,
+            only_contexts,
+            only_barcodes,
+            skip_barcodes,
+            chrom_sizes,
+            compression,
+            compression_opts,
+            chunk_rows,
+            chunk_cache_mb,
+            name,
+            out,
+            h5_in
+        ):
+        import amethyst_facet as fct
+        fct.h5.set_chunk_cache(chunk_cache_mb)
+        parser = CLIOptionsParser()
+        paths = parser.combine_paths_globs(h5_in, globs)
+        compression, compression_opts = parser.parse_h5py_compression(compression, compression_opts)
+        kwargs = fct.h5.compression_kwargs(compression, compression_opts)
+
+        skip = {"barcodes": self.read_barcodes(skip_barcodes)}
+        only = {"contexts": set(only_contexts), "barcodes": self.read_barcodes(only_barcodes), "windows": {name}}
+        reader = fct.h5.ReaderV2(paths=paths, skip=skip, only=only, mode="r")
+        chrom_sizes = fct.windows.read_chrom_sizes(chrom_sizes) if chrom_sizes else None
+        columns = None if chrom_sizes else self.union_columns(reader)
+
+        # .npz files are assembled from the HDF5 output, which is written to a temporary file.
+        out = Path(out)
+        npz = out.suffix == ".npz"
+        h5_path = out.with_name(out.name + ".tmp.h5") if npz else out
+        writers: Dict[str, fct.h5.SparseMatrixWriter] = {}
+        try:
+            with h5py.File(h5_path, "w") as file:
+                for _, h5path, dataset, attrs in reader.datasets("windows", reader.obtain_handle):
+                    context, barcode = h5path.split("/")[1:3]
+                    if context not in writers:
+                        context_columns = columns[context] if columns else self.grid_columns(attrs, name, chrom_sizes)
+                        writers[context] = fct.h5.SparseMatrixWriter(file.create_group(context), context_columns, chunk_rows, **kwargs)
+                    writers[context].append(barcode, dataset.fields(fct.h5.COORDINATE_COLUMNS + ["c", "t"])[:])
+                    rows = len(writers[context].barcodes)
+                    if rows % 10_000 == 0:
+                        logger.info("Added {} barcodes of context {} to {}", rows, context, out)
+                if not writers:
+                    raise fct.h5.NoWindowsDatasets(name)
+                for context, writer in writers.items():
+                    writer.close()
+                    if writer.dropped:
+                        logger.warning("{} windows of context {} are not on the chrom sizes grid and were not written", writer.dropped, context)
+                    logger.info(
+                        "Wrote {} x {} matrices with {} entries for context {}",
+                        len(writer.barcodes), len(writer.columns), writer.nnz, context
+                    )
+            if npz:
+                self.write_npz(h5_path, out)
+        finally:
+            if npz:
+                h5_path.unlink(missing_ok=True)
+
+    def read_barcodes(self, path: str | None) -> Set[str]:
+        return set(Path(path).read_text().split()) if path else set()
+
+    def union_columns(self, reader) -> Dict[str, Any]:
+        """Columns of each context's matrices: the distinct windows of its datasets, read in a first pass"""
+        import amethyst_facet as fct
+        unions: Dict[str, fct.h5.WindowUnion] = {}
+        for _, h5path, dataset, _ in reader.datasets("windows", reader.obtain_handle):
+            context = h5path.split("/")[1]
+            unions.setdefault(context, fct.h5.WindowUnion()).add(dataset.fields(fct.h5.COORDINATE_COLUMNS)[:])
+        return {context: union.columns() for context, union in unions.items()}
+
+    def grid_columns(self, attrs, name, chrom_sizes):
+        import amethyst_facet as fct
+        scheme = fct.windows.UniformWindowsAggregator.from_attrs(attrs, name)
+        if scheme is None:
+            raise fct.h5.MatrixNeedsUniformWindows(name)
+        return fct.h5.WindowColumns.from_grid(fct.windows.WindowGrid.from_aggregator(scheme, chrom_sizes))
+
+    def write_npz(self, h5_path: Path, out: Path):
+        import amethyst_facet as fct
+        with h5py.File(h5_path, "r") as file:
+            for context, group in file.items():
+                barcodes, windows = group["barcodes"][:], group["windows"][:]
+                for matrix in fct.h5.SPARSE_MATRICES:
+                    path = out.with_name(f"{out.stem}.{context}.{matrix}.npz")
+                    fct.h5.write_npz(group[matrix], barcodes, windows, path)
+                    logger.info("Wrote {}", path)
+
+@click.command
+@input_globs
+@h5_subsets
+@click.option(
+    "--chrom-sizes",
+    type=str,
+    default=None,
+    help=(
+        "Chrom sizes file of chromosome names and lengths. If given, the columns are every window of the "
+        "uniform scheme on these chromosomes. Otherwise, they are the windows present in any dataset."
+    )
+)
+@compression
+@chunking
+@click.argument("name")
+@click.argument("out")
+@click.argument("h5_in", nargs=-1)
+def matrix(globs, only_contexts, only_barcodes, skip_barcodes, chrom_sizes, compression, compression_opts, chunk_rows, chunk_cache_mb, name, out, h5_in):
+    """Export the windows datasets NAME as sparse cells x windows matrices.
+
+    Every barcode's windows dataset NAME is streamed into CSR matrices of its c and t counts
+    and its methylation fraction c/(c+t), with one row per barcode and one column per window,
+    for each context. Rows are written as they are read, so no dense matrix is held in memory.
+
+    If OUT ends in .npz, each matrix is written to [stem].[context].[c|t|frac].npz, readable by
+    scipy.sparse.load_npz, with the row barcodes and the column chr, start and end as extra
+    arrays. Otherwise OUT is an HDF5 file with a group per context holding barcodes, windows
+    and the c, t and frac CSR matrices in the layout written by anndata.
+
+    \b
+    Export 100kb windows to HDF5
+    facet matrix 100000 matrices.h5 cells.h5
+
+    \b
+    Export 10kb windows over a fixed genome-wide grid to .npz
+    facet matrix 10000 cells.npz --chrom-sizes hg38.chrom.sizes *.h5
+    """
+    exporter = AmethystH5MatrixExporter()
+    exporter.export(
+        globs,
+        only_contexts,
+        only_barcodes,
+        skip_barcodes,
+        chrom_sizes,
+        compression,
+        compression_opts,
+        chunk_rows,
+        chunk_cache_mb,
+        name,
+        out,
+        h5_in
+    )
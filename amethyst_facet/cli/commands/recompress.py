@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+from pathlib import Path
+from typing import *
+
+import click
+from loguru import logger
+
+from ..parse import CLIOptionsParser
+from ..decorators import *
+
+def recompress_one(args: Tuple[Any, ...]):
+    """Recompress one file into target, replacing the source if target is None"""
+    import amethyst_facet as fct
+    source, target, compression, compression_opts, chunk_rows, chunk_cache_mb, max_rows, layout, compact_dtypes = args
+    # Workers are spawned with the default chunk cache, so it is set from the command's option.
+    fct.h5.set_chunk_cache(chunk_cache_mb)
+    source = Path(source)
+    replace = target is None
+    if replace:
+        target = source.with_name(source.name + ".recompress")
+    target = Path(target)
+    try:
+        fct.h5.recompress_file(source, target, compression, compression_opts, chunk_rows, max_rows, layout, compact_dtypes)
+    except:
+        target.unlink(missing_ok=True)
+        raise
+    if replace:
+        # The original is only replaced once the copy is complete.
+        os.replace(target, source)
+    logger.info("Recompressed {} to {}", source, source if replace else target)
+
+class AmethystH5Recompressor:
+    def recompress(self, globs, compression, compression_opts, chunk_rows, chunk_cache_mb, max_rows, layout, compact_dtypes, nproc, out_dir, h5_in):
+        parser = CLIOptionsParser()
+        paths = parser.combine_paths_globs(h5_in, globs)
+        compression, compression_opts = parser.parse_h5py_compression(compression, compression_opts)
+        if out_dir is not None:
+            Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+        jobs = [
+            (path, Path(out_dir) / Path(path).name if out_dir is not None else None, compression, compression_opts, chunk_rows, chunk_cache_mb, max_rows, layout, compact_dtypes)
+            for path in paths
+        ]
+        # Workers are spawned rather than forked, as forking after polars has started its thread pool can deadlock.
+        with ProcessPoolExecutor(max_workers=nproc, mp_context=multiprocessing.get_context("spawn")) as ppe:
+            for _ in ppe.map(recompress_one, jobs):
+                pass
+
+@click.command
+@input_globs
+@compression
+@chunking
+@click.option(
+    "--max-rows-in-memory", "max_rows",
+    type=int,
+    default=10_000_000,
+    show_default=True,
+    help="Maximum number of rows of a dataset to read into memory at once."
+)
+@click.option(
+    "--layout",
+    type=click.Choice(["rows", "columnar", "consolidated"]),
+    default=None,
+    help="Rewrite observations in this layout (see facet calls2h5 --help). If not given, each dataset keeps its layout."
+)
+@click.option(
+    "--compact-dtypes/--full-dtypes",
+    default=None,
+    help="Rewrite windows with the narrowest integer columns, or with int64 columns. If not given, windows keep their dtypes."
+)
+@nproc
+@click.option(
+    "--out-dir", "-o",
+    type=str,
+    default=None,
+    help="Directory to write recompressed files to, keeping their names. If not given, files are replaced in place."
+)
+@click.argument("h5_in", nargs=-1)
+def recompress(globs, compression, compression_opts, chunk_rows, chunk_cache_mb, max_rows, layout, compact_dtypes, nproc, out_dir, h5_in):
+    """Rewrite existing Amethyst v2.0.0 HDF5 files with a different compression and chunk layout.
+
+    Every observations and windows dataset is rewritten, keeping its attributes. /metadata is
+    copied unchanged. Files are processed in parallel, one per worker process. In place, each
+    file is written to a temporary copy next to it that replaces the original once complete.
+
+    Example to migrate gzip-compressed files to byte-shuffled zstd using 8 processes:
+
+    facet recompress --compression zstd:3 -p 8 *.h5
+
+    Example to convert observations to the compact columnar layout:
+
+    facet recompress --layout columnar *.h5
+
+    Example to consolidate each context's observations into one store, and to split them again:
+
+    facet recompress --layout consolidated *.h5
+
+    facet recompress --layout rows *.h5
+
+    Example to store windows with the narrowest integer columns:
+
+    facet recompress --compact-dtypes *.h5
+    """
+    AmethystH5Recompressor().recompress(globs, compression, compression_opts, chunk_rows, chunk_cache_mb, max_rows, layout, compact_dtypes, nproc, out_dir, h5_in)
@@ -12,14 +12,17 @@ compression_algo = click.option(
     type=str,
     default = 'gzip',
     show_default=True,
-    help="Compression algorithm for writing to Amethyst H5"
+    help=(
+        "Compression algorithm for writing to Amethyst H5, optionally with a level (i.e. 'gzip:4' or 'zstd:3'). "
+        "gzip and lzf are always available. zstd, lz4, blosc, blosc-lz4, blosc-lz4hc, blosc-zstd and blosc-zlib "
+        "require the hdf5plugin package, and are byte-shuffled for better and faster compression."
+    )
 )
 compression_opts = click.option(
     "--compression_opts",
     type=str,
-    default = '6',
-    show_default=True,
-    help="Compression algorithm options for writing to Amethyst H5 (default is compatible with gzip)."
+    default = None,
+    help="Compression algorithm options for writing to Amethyst H5. Defaults to level 6 for gzip and to the codec's own default otherwise."
 )
 
 def compression(f):
@@ -44,6 +47,14 @@ skip_barcodes = click.option(
     help = "A file containing barcodes (newline-separated). Barcodes in this file will not be used (overrides --only-barcodes for conflicts)."
 )
 
+nproc = click.option(
+    "--nproc", "-p", "nproc",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of worker processes. Results are written by a single process in the same order as a serial run."
+)
+
 def h5_subsets(f):
     f = only_contexts(f)
     f = only_barcodes(f)
@@ -56,4 +67,66 @@ h5_out = click.option(
     default = None,
     show_default=True,
     help = "Output Amethyst H5 file to write results. If None, results are appended to input file as new datasets."
-)
\ No newline at end of file
+)
+chunk_rows = click.option(
+    "--chunk-rows",
+    type=int,
+    default=None,
+    help=(
+        "Rows per HDF5 chunk in written datasets. By default, chunks hold about 1 MiB of uncompressed rows, "
+        "and datasets smaller than that are stored as a single chunk."
+    )
+)
+chunk_cache_mb = click.option(
+    "--chunk-cache-mb",
+    type=float,
+    default=None,
+    help="Size in MiB of the HDF5 chunk cache of each open file. Defaults to 16."
+)
+
+def chunking(f):
+    f = chunk_rows(f)
+    f = chunk_cache_mb(f)
+    return f
+
+layout = click.option(
+    "--layout",
+    type=click.Choice(["rows", "columnar", "consolidated"]),
+    default="rows",
+    show_default=True,
+    help=(
+        "On-disk layout of observations. 'rows' stores one compound row per position. 'columnar' stores "
+        "chromosome codes, delta-encoded positions and narrow counts as separate datasets, which is smaller "
+        "and is read back transparently by facet. 'consolidated' concatenates every barcode's observations "
+        "of a context into one store at /metadata/observations/<context>/<name> with barcode offsets."
+    )
+)
+compact_dtypes = click.option(
+    "--compact-dtypes",
+    is_flag=True,
+    default=False,
+    help=(
+        "Store the integer columns of windows in the narrowest integer type holding their values, "
+        "recorded in the compact_dtypes attribute. facet reads them back as int64."
+    )
+)
+shared_windows = click.option(
+    "--shared-windows",
+    is_flag=True,
+    default=False,
+    help=(
+        "Write each scheme's window coordinates once, to /metadata/windows/<name>, and store only window "
+        "indices and counts in each barcode's dataset. facet joins the coordinates back on read."
+    )
+)
+validation = click.option(
+    "--validation",
+    type=click.Choice(["full", "fast", "trust"]),
+    default="fast",
+    show_default=True,
+    help=(
+        "How datasets read from the input files are checked for NaN counts, which are replaced with zero. "
+        "'full' checks every count column, 'fast' checks only floating point columns, as integer columns "
+        "cannot hold NaN, and 'trust' skips the checks, for files written by facet."
+    )
+)
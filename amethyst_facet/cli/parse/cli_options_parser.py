@@ -6,6 +6,8 @@ from pathlib import Path
 from typing import *
 import h5py
 
+import amethyst_facet as fct
+
 class InvalidCompressionArgs(ValueError):
     def __init__(self, compression, compression_opts):
         message = f"Invalid h5py compression arguments compression='{compression}' and compression_opts='{compression_opts}'"
@@ -51,14 +53,20 @@ class FailedReadBarcodeFile(BarcodeFileProblem):
         )
         super().__init__(message)
 
+# Level used for gzip when --compression_opts is not given.
+GZIP_DEFAULT_LEVEL: Final = 6
+
 class CLIOptionsParser:
-    def parse_h5py_compression(self, compression: str, compression_opts: str) -> Tuple[str, Any]:
+    def parse_h5py_compression(self, compression: str, compression_opts: str | None) -> Tuple[str, Any]:
         """Make CLI compression and compression_opts args h5py-compatible
+
+        If compression_opts is None, gzip uses GZIP_DEFAULT_LEVEL and other codecs their own default.
         """
         compression = compression.strip()
 
         if compression_opts and not compression:
             raise InvalidCompressionArgs(compression, compression_opts)
+        unspecified = compression_opts is None
 
         try:
             # Some compressors (i.e. gzip) require compression_opts be an int
@@ -70,15 +78,21 @@ class CLIOptionsParser:
 
         if compression == "":
             compression = None
+        elif unspecified and compression.partition(":")[0].strip().lower() == "gzip":
+            compression_opts = GZIP_DEFAULT_LEVEL
 
         try:
+            # Codec names may carry a level (i.e. 'zstd:3') and plugin codecs become filter ids.
+            parsed, parsed_opts = fct.h5.parse_compression(compression, compression_opts)
             bio = io.BytesIO()
             with h5py.File(bio, "w") as f:
-                f.create_dataset("test", shape=1, dtype=int, compression=compression, compression_opts=compression_opts)
+                f.create_dataset("test", shape=1, dtype=int, **fct.h5.compression_kwargs(parsed, parsed_opts))
+        except fct.h5.CompressionException:
+            raise
         except Exception as e:
-            raise InvalidCompressionArgs(compression, compression_opts)
+            raise InvalidCompressionArgs(compression, compression_opts) from e
 
-        return compression, compression_opts
+        return parsed, parsed_opts
 
     def combine_paths_globs(self, paths: List[str | Path], orig_globs: List[str]) -> List[str]:
         paths = list(paths)
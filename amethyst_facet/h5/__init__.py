@@ -2,6 +2,20 @@ from .reader import Reader
 from .readerv1 import ReaderV1
 from .readerv2 import ReaderV2
 from .handles import *
+from .chunking import *
+from .compression import *
+from .recompress import recompress_file
+from .shared_windows import *
+from .consolidated import *
+from .columnar import *
 from .dataset import *
+from .lazy_dataset import LazyDataset
+from .slices import DatasetSlices
+from .write_session import WriteSession
+from .chromosome_index import *
+from .catalog import *
+from .matrix import *
+from .sparse_matrix import *
+from .region import Region, RegionException, InvalidRegion
 
 version="amethyst2.0.0"
\ No newline at end of file
@@ -0,0 +1,177 @@
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+import polars as pl
+from loguru import logger
+
+from .chromosome_index import compute_chromosome_index
+from .columnar import DATASET_TYPES, as_dataset
+
+CATALOG_PATH: Final = "/metadata/catalog"
+
+# One row per dataset at /context/barcode/name. kind is "observations", "windows", "other",
+# or "deleted" for rows recording that a dataset was removed. size, step and offset are the
+# uniform window scheme, or -1 if the dataset is not uniform windows. sorted records whether
+# rows are sorted by chr (in contiguous blocks), then pos or start.
+catalog_dtype = np.dtype([
+    ("context", h5py.string_dtype()),
+    ("barcode", h5py.string_dtype()),
+    ("name", h5py.string_dtype()),
+    ("kind", h5py.string_dtype()),
+    ("nrows", "<i8"),
+    ("dtype", h5py.string_dtype()),
+    ("size", "<i8"),
+    ("step", "<i8"),
+    ("offset", "<i8"),
+    ("sorted", "?")
+])
+
+def dataset_kind(dtype: np.dtype) -> str:
+    names = dtype.names or []
+    if "chr" in names and "pos" in names:
+        return "observations"
+    elif all(col in names for col in ["chr", "start", "end"]):
+        return "windows"
+    return "other"
+
+def is_sorted(data: NDArray) -> bool:
+    """Whether observations or windows data is sorted by chromosome blocks, then pos or start"""
+    names = data.dtype.names or []
+    key = "pos" if "pos" in names else "start" if "start" in names else None
+    if "chr" not in names or key is None:
+        return False
+    chrom, values = data["chr"], data[key]
+    if compute_chromosome_index(chrom) is None:
+        return False
+    return bool(np.all((chrom[1:] != chrom[:-1]) | (values[1:] >= values[:-1])))
+
+def catalog_entry(dataset: h5py.Dataset, sorted: bool) -> Tuple:
+    """Catalog row describing dataset, using only its metadata"""
+    context, barcode, name = dataset.name.split("/")[1:]
+    attrs = dataset.attrs
+    uniform = all(key in attrs for key in ["size", "step", "offset"])
+    scheme = [int(attrs[key]) for key in ["size", "step", "offset"]] if uniform else [-1, -1, -1]
+    return (context, barcode, name, dataset_kind(dataset.dtype), dataset.shape[0], str(dataset.dtype), *scheme, sorted)
+
+def decode(value: str | bytes) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+def catalog_frame(rows: NDArray) -> pl.DataFrame:
+    """Catalog rows as a frame, decoding the string columns without a per-row loop"""
+    return pl.DataFrame([
+        pl.Series(name, rows[name], dtype=pl.Binary).cast(pl.String) if rows.dtype[name] == object else pl.Series(name, rows[name])
+        for name in catalog_dtype.names
+    ])
+
+def has_catalog(file: h5py.File) -> bool:
+    return CATALOG_PATH in file
+
+def create_catalog(file: h5py.File, entries: List[Tuple] | None = None):
+    """Create an empty catalog, or replace the existing catalog, with entries"""
+    if has_catalog(file):
+        del file[CATALOG_PATH]
+    rows = np.array(entries or [], dtype=catalog_dtype)
+    file.create_dataset(CATALOG_PATH, data=rows, maxshape=(None,), chunks=(1024,))
+
+def add_to_catalog(file: h5py.File, entries: List[Tuple], update: bool = False):
+    """Record entries in the file's catalog. Does nothing if the file has no catalog.
+
+    The catalog is append-only, and the last row for each dataset is its current entry. If
+    update and a single entry's dataset has a recent row (see recent_entry), that row is
+    overwritten instead, so repeatedly appending to resizable datasets does not grow the catalog.
+    """
+    if not has_catalog(file) or not entries:
+        return
+    catalog = file[CATALOG_PATH]
+    recent = recent_entry(file, *entries[0][:3]) if update and len(entries) == 1 else None
+    if recent is not None:
+        row, _ = recent
+        catalog[row] = np.array(entries, dtype=catalog_dtype)[0]
+        return
+    rows = catalog.shape[0]
+    catalog.resize((rows + len(entries),))
+    catalog[rows:] = np.array(entries, dtype=catalog_dtype)
+
+def recent_entry(file: h5py.File, context: str, barcode: str, name: str, window: int = 256) -> Tuple[int, Dict[str, Any]] | None:
+    """Find the current catalog row for /context/barcode/name among the last window rows
+
+    Returns (row number, entry), or None if there is no catalog or the dataset has no recent row.
+    Writers updating datasets they just wrote use this to avoid reading the whole catalog.
+    """
+    if not has_catalog(file):
+        return None
+    catalog = file[CATALOG_PATH]
+    start = max(catalog.shape[0] - window, 0)
+    matches = (
+        catalog_frame(catalog[start:])
+        .with_row_index("row", offset=start)
+        .filter((pl.col.context == context) & (pl.col.barcode == barcode) & (pl.col.name == name))
+    )
+    if matches.is_empty():
+        return None
+    entry = matches.row(-1, named=True)
+    return int(entry.pop("row")), entry
+
+def remove_from_catalog(file: h5py.File, prefixes: List[str]):
+    """Record removal of every cataloged dataset at or under any of the h5 path prefixes"""
+    catalog = read_catalog(file)
+    if catalog is None or not prefixes:
+        return
+    paths = pl.concat_str("/" + pl.col.context, pl.col.barcode, pl.col.name, separator="/")
+    removed = catalog.filter(pl.any_horizontal([
+        (paths == prefix) | paths.str.starts_with(prefix.rstrip("/") + "/")
+        for prefix in prefixes
+    ]))
+    entries = [
+        (row["context"], row["barcode"], row["name"], "deleted", 0, "", -1, -1, -1, False)
+        for row in removed.iter_rows(named=True)
+    ]
+    add_to_catalog(file, entries)
+
+def read_catalog(file: h5py.File) -> pl.DataFrame | None:
+    """Current catalog entries sorted by (context, barcode, name), or None if the file has no catalog"""
+    if not has_catalog(file):
+        return None
+    catalog = catalog_frame(file[CATALOG_PATH][:])
+    catalog = catalog.unique(["context", "barcode", "name"], keep="last", maintain_order=True)
+    return catalog.filter(pl.col.kind != "deleted").sort("context", "barcode", "name")
+
+def dataset_is_sorted(dataset: h5py.Dataset, max_rows: int = 10_000_000) -> bool:
+    """Check sortedness of a dataset on disk, reading its chr and pos or start columns in slices"""
+    kind = dataset_kind(dataset.dtype)
+    if kind == "other":
+        return False
+    columns = ["chr", "pos" if kind == "observations" else "start"]
+    previous = None
+    seen = set()
+    for start in range(0, dataset.shape[0], max_rows):
+        data = dataset.fields(columns)[start:start + max_rows]
+        if previous is not None:
+            data = np.concatenate([previous, data])
+        if not is_sorted(data):
+            return False
+        # Chromosomes followed by another chromosome must not appear again.
+        if set(data["chr"]) & seen:
+            return False
+        seen |= set(data["chr"][:-1]) - {data["chr"][-1]}
+        previous = data[-1:]
+    return True
+
+def rebuild_catalog(file: h5py.File, max_rows: int = 10_000_000) -> pl.DataFrame:
+    """Replace the catalog with one built by traversing every /context/barcode/name dataset"""
+    entries = []
+    for context in file:
+        if context == "metadata" or not isinstance(file[context], h5py.Group):
+            continue
+        for barcode in file[context]:
+            if not isinstance(file[context][barcode], h5py.Group):
+                continue
+            for dataset in file[context][barcode].values():
+                dataset = as_dataset(dataset)
+                if isinstance(dataset, DATASET_TYPES):
+                    entries.append(catalog_entry(dataset, dataset_is_sorted(dataset, max_rows)))
+    create_catalog(file, entries)
+    logger.debug("Cataloged {} datasets in {}", len(entries), file.filename)
+    return read_catalog(file)
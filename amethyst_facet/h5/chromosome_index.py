@@ -0,0 +1,124 @@
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+from loguru import logger
+
+from .columnar import LAYOUT_ATTRS
+
+# Attributes storing a dataset's chromosome index. Chromosome chr_index_names[i] occupies
+# rows [chr_index_offsets[i], chr_index_offsets[i + 1]) of the dataset.
+CHROMOSOME_INDEX_NAMES: Final = "chr_index_names"
+CHROMOSOME_INDEX_OFFSETS: Final = "chr_index_offsets"
+
+class ChromosomeIndexException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class MissingChromosomeIndex(ChromosomeIndexException):
+    def __init__(self, dataset: h5py.Dataset):
+        message = (
+            f"{dataset.file.filename}::{dataset.name} has no chromosome index. "
+            f"Add one with 'facet index {dataset.file.filename}'."
+        )
+        super().__init__(message)
+
+def compute_chromosome_index(chrom: NDArray) -> Dict[str, NDArray] | None:
+    """Compute chromosome index attributes from the chr column of a dataset.
+
+    Returns None if the chromosomes do not each occupy a single contiguous block of rows,
+    i.e. the data is not sorted by chromosome.
+    """
+    change = np.flatnonzero(chrom[1:] != chrom[:-1]) + 1
+    starts = np.concatenate([[0], change]).astype(np.int64) if len(chrom) else np.zeros(0, dtype=np.int64)
+    names = np.asarray(chrom[starts])
+    if len(np.unique(names)) != len(names):
+        return None
+    offsets = np.append(starts, len(chrom)).astype(np.int64)
+    return {CHROMOSOME_INDEX_NAMES: names.astype(bytes), CHROMOSOME_INDEX_OFFSETS: offsets}
+
+def append_chromosome_index(index: Dict[str, NDArray] | None, appended: Dict[str, NDArray] | None) -> Dict[str, NDArray] | None:
+    """Combine the index of a dataset with the index of rows appended to it"""
+    if index is None or appended is None:
+        return None
+    names, offsets = index[CHROMOSOME_INDEX_NAMES], index[CHROMOSOME_INDEX_OFFSETS]
+    new_names, new_offsets = appended[CHROMOSOME_INDEX_NAMES], appended[CHROMOSOME_INDEX_OFFSETS] + offsets[-1]
+    starts, new_starts = offsets[:-1], new_offsets[:-1]
+    if len(names) and len(new_names) and names[-1] == new_names[0]:
+        # The appended rows continue the last chromosome.
+        new_names, new_starts = new_names[1:], new_starts[1:]
+    names = np.concatenate([names.astype(bytes), new_names.astype(bytes)])
+    if len(np.unique(names)) != len(names):
+        return None
+    offsets = np.concatenate([starts, new_starts, new_offsets[-1:]]).astype(np.int64)
+    return {CHROMOSOME_INDEX_NAMES: names, CHROMOSOME_INDEX_OFFSETS: offsets}
+
+def write_chromosome_index(dataset: h5py.Dataset, index: Dict[str, NDArray] | None):
+    """Store index as attributes of dataset, or remove a stale index if index is None"""
+    for key in [CHROMOSOME_INDEX_NAMES, CHROMOSOME_INDEX_OFFSETS]:
+        if key in dataset.attrs:
+            del dataset.attrs[key]
+    if index is None:
+        logger.debug("{}::{} is not sorted by chromosome, so no chromosome index was written", dataset.file.filename, dataset.name)
+        return
+    try:
+        dataset.attrs.update(index)
+    except Exception as e:
+        # Attributes are limited to 64kb, which can be exceeded by assemblies with many thousands of contigs.
+        for key in [CHROMOSOME_INDEX_NAMES, CHROMOSOME_INDEX_OFFSETS]:
+            if key in dataset.attrs:
+                del dataset.attrs[key]
+        logger.debug("Could not write chromosome index for {}::{}: {}", dataset.file.filename, dataset.name, e)
+
+def index_attrs(dataset: h5py.Dataset) -> Dict[str, NDArray] | None:
+    """Load the chromosome index attributes of dataset, or None if not indexed"""
+    if CHROMOSOME_INDEX_NAMES not in dataset.attrs or CHROMOSOME_INDEX_OFFSETS not in dataset.attrs:
+        return None
+    return {key: dataset.attrs[key] for key in [CHROMOSOME_INDEX_NAMES, CHROMOSOME_INDEX_OFFSETS]}
+
+def user_attrs(dataset: h5py.Dataset) -> Dict[str, Any]:
+    """Attributes of dataset other than its chromosome index and layout
+
+    The index and layout describe the dataset on disk and are recomputed whenever data is
+    written, so they are not carried along with data read into memory.
+    """
+    return {
+        key: value for key, value in dataset.attrs.items()
+        if key not in [CHROMOSOME_INDEX_NAMES, CHROMOSOME_INDEX_OFFSETS, *LAYOUT_ATTRS]
+    }
+
+def index_ranges(index: Dict[str, NDArray]) -> Dict[str, Tuple[int, int]]:
+    """Map each chromosome in index attributes to its [row_start, row_end)"""
+    names, offsets = index[CHROMOSOME_INDEX_NAMES], index[CHROMOSOME_INDEX_OFFSETS]
+    return {
+        name.decode(): (int(start), int(end))
+        for name, start, end in zip(names, offsets[:-1], offsets[1:])
+    }
+
+def read_chromosome_index(dataset: h5py.Dataset) -> Dict[str, Tuple[int, int]] | None:
+    """Map each chromosome to its [row_start, row_end) in dataset, or None if not indexed"""
+    index = index_attrs(dataset)
+    return index_ranges(index) if index is not None else None
+
+def read_chromosome(dataset: h5py.Dataset, chrom: str) -> NDArray:
+    """Read only the rows of dataset on chrom using its chromosome index
+
+    Raises:
+        MissingChromosomeIndex: dataset has no chromosome index.
+    """
+    index = read_chromosome_index(dataset)
+    if index is None:
+        raise MissingChromosomeIndex(dataset)
+    start, end = index.get(chrom, (0, 0))
+    return dataset[start:end]
+
+def build_chromosome_index(dataset: h5py.Dataset, max_rows: int = 10_000_000) -> Dict[str, NDArray] | None:
+    """Compute the chromosome index of a dataset on disk, reading only its chr column in slices"""
+    index = compute_chromosome_index(np.zeros(0, dtype=dataset.dtype["chr"]))
+    for start in range(0, dataset.shape[0], max_rows):
+        chrom = dataset.fields("chr")[start:start + max_rows]
+        index = append_chromosome_index(index, compute_chromosome_index(chrom))
+        if index is None:
+            return None
+    return index
@@ -0,0 +1,50 @@
+from typing import *
+
+import numpy as np
+
+# Default uncompressed size of a chunk. Large enough that full scans decompress few chunks,
+# small enough that a region read decompresses little beyond the rows it needs, and that
+# several chunks fit in the default chunk cache.
+CHUNK_BYTES: Final = 2**20
+
+class ChunkingException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class InvalidChunkRows(ChunkingException):
+    def __init__(self, chunk_rows: int):
+        message = f"Chunk rows must be a positive integer, but chunk_rows={chunk_rows}."
+        super().__init__(message)
+
+class InvalidChunkCache(ChunkingException):
+    def __init__(self, chunk_cache_mb: float):
+        message = f"Chunk cache size must be a non-negative number of megabytes, but chunk_cache_mb={chunk_cache_mb}."
+        super().__init__(message)
+
+def chunk_rows(nrows: int | None, dtype: np.dtype, rows: int | None = None) -> int:
+    """Rows per chunk for a one-dimensional dataset of nrows rows of dtype.
+
+    Uses rows if given, otherwise as many rows as fit in CHUNK_BYTES. Datasets smaller than
+    one chunk are stored as a single chunk of exactly nrows rows, so reading them decompresses
+    nothing extra. Pass nrows=None for resizable datasets, whose final size is unknown.
+    """
+    if rows is not None and rows < 1:
+        raise InvalidChunkRows(rows)
+    target = rows or max(CHUNK_BYTES // np.dtype(dtype).itemsize, 1)
+    if nrows is not None:
+        target = min(target, max(nrows, 1))
+    return target
+
+# Chunk cache settings passed to h5py.File by fct.h5.open. h5py's default cache is 1 MiB,
+# which holds a single default chunk, so repeated region reads and binary searches would
+# decompress the same chunks again. rdcc_nslots should be a prime well above the number of
+# chunks that fit in the cache.
+chunk_cache: Dict[str, int] = {"rdcc_nbytes": 16*2**20, "rdcc_nslots": 10007}
+
+def set_chunk_cache(chunk_cache_mb: float | None):
+    """Set the chunk cache size of files subsequently opened by fct.h5.open. None keeps the current size."""
+    if chunk_cache_mb is None:
+        return
+    if chunk_cache_mb < 0:
+        raise InvalidChunkCache(chunk_cache_mb)
+    chunk_cache["rdcc_nbytes"] = int(chunk_cache_mb * 2**20)
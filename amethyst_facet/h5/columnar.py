@@ -0,0 +1,249 @@
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+from . import chunking
+from .consolidated import CONSOLIDATED_LAYOUT, ConsolidatedDataset, find_block
+from .shared_windows import SHARED_ATTRS, SharedWindowsDataset, is_shared
+
+# Observations datasets can be stored in either of two layouts. The rows layout is a single
+# compound dataset at /context/barcode/name. The columnar layout is a group at that path
+# with one dataset per column:
+#   chr_names    the distinct chromosome names of the dataset, in order of first appearance
+#   chr          each row's index into chr_names, as the narrowest unsigned integer that fits
+#   pos          each row's pos minus the previous row's pos, or 0 at anchor rows
+#   anchor_rows  rows where the delta chain restarts: every ANCHOR_ROWS-th row and the first row
+#                of each chromosome, so any row is decoded from a nearby anchor and sorted
+#                positions have non-negative deltas
+#   pos_anchors  the pos at each anchor row
+#   c, t         counts as the narrowest integer type that fits their maximum
+# The group's attributes hold the dataset's attributes, its chromosome index and the layout
+# attribute layout='columnar'. Readers reassemble the rows with the usual observations dtype.
+# Observations can also be consolidated into one store per context and name, described in
+# fct.h5.consolidated.
+ROWS_LAYOUT: Final = "rows"
+COLUMNAR_LAYOUT: Final = "columnar"
+LAYOUTS: Final = [ROWS_LAYOUT, COLUMNAR_LAYOUT, CONSOLIDATED_LAYOUT]
+# Windows datasets written with compact dtypes list their narrowed columns in this attribute.
+# Their integer columns are stored in the narrowest integer type holding the values written,
+# and are upcast to windows_dtype when read into a Dataset.
+COMPACT_ATTR: Final = "compact_dtypes"
+LAYOUT_ATTRS: Final = ["layout", COMPACT_ATTR, *SHARED_ATTRS]
+COLUMNAR_COLUMNS: Final = ["chr", "pos", "c", "t"]
+ANCHOR_ROWS: Final = 4096
+
+class ColumnarException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class InvalidLayout(ColumnarException):
+    def __init__(self, layout: str):
+        message = f"Layout must be one of {LAYOUTS}, but layout='{layout}'."
+        super().__init__(message)
+
+class NotColumnarObservations(ColumnarException):
+    def __init__(self, dtype: np.dtype):
+        message = f"The columnar layout stores observations with columns {COLUMNAR_COLUMNS}, but got dtype {dtype}."
+        super().__init__(message)
+
+def narrow_int_dtype(values: NDArray) -> np.dtype:
+    """Smallest integer dtype holding every value, unsigned unless a value is negative"""
+    if not len(values):
+        return np.dtype(np.uint8)
+    lo, hi = int(values.min()), int(values.max())
+    candidates = [np.uint8, np.uint16, np.uint32, np.uint64] if lo >= 0 else [np.int8, np.int16, np.int32, np.int64]
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def compact_dtype(data: NDArray) -> np.dtype:
+    """dtype of data with each integer column narrowed to the smallest type holding its values"""
+    return np.dtype([
+        (name, narrow_int_dtype(data[name]) if np.issubdtype(data.dtype[name], np.integer) else data.dtype[name])
+        for name in data.dtype.names
+    ])
+
+def widened_dtype(dtype: np.dtype, other: np.dtype) -> np.dtype:
+    """Column-wise dtype holding the values of both compact dtypes with the same columns"""
+    return np.dtype([(name, np.promote_types(dtype[name], other[name])) for name in dtype.names])
+
+def encode_positions(pos: NDArray, chrom: NDArray, every: int = ANCHOR_ROWS) -> Tuple[NDArray, NDArray, NDArray]:
+    """Delta-encode pos, restarting every `every` rows and at each chromosome change.
+
+    Returns (deltas, anchor_rows, anchors).
+    """
+    pos = np.asarray(pos, dtype=np.int64)
+    changes = np.flatnonzero(chrom[1:] != chrom[:-1]) + 1
+    anchor_rows = np.union1d(np.arange(0, len(pos), every), changes).astype(np.int64)
+    deltas = np.diff(pos, prepend=pos[:1])
+    deltas[anchor_rows] = 0
+    return deltas, anchor_rows, pos[anchor_rows]
+
+def decode_positions(deltas: NDArray, anchor_rows: NDArray, anchors: NDArray, first_row: int) -> NDArray:
+    """Decode deltas of the rows starting at first_row, which must be an anchor row.
+
+    anchor_rows and anchors are those of the decoded rows.
+    """
+    starts = anchor_rows - first_row
+    lengths = np.diff(np.append(starts, len(deltas)))
+    cumulative = np.cumsum(deltas, dtype=np.int64)
+    # Deltas are 0 at each anchor row, so the cumulative sum there is the sum of prior segments.
+    return cumulative + np.repeat(anchors - cumulative[starts], lengths)
+
+def is_columnar(item: Any) -> bool:
+    return isinstance(item, h5py.Group) and item.attrs.get("layout") == COLUMNAR_LAYOUT
+
+class ColumnarFields:
+    """Result of ColumnarDataset.fields, sliced by rows like h5py.Dataset.fields"""
+    def __init__(self, dataset: "ColumnarDataset", names: str | List[str]):
+        self.dataset = dataset
+        self.names = names
+
+    def __getitem__(self, rows: int | slice) -> NDArray:
+        if isinstance(self.names, str):
+            return self.dataset.read([self.names], rows)[self.names]
+        return self.dataset.read(self.names, rows)
+
+class ColumnarDataset:
+    """Observations stored in the columnar layout, read like an h5py.Dataset of rows.
+
+    Supports reading rows by index or slice, reading single columns with fields, and the
+    name, file, attrs, shape and dtype properties. Only the columns requested are read,
+    and positions are decoded from the nearest preceding anchor.
+    """
+    def __init__(self, group: h5py.Group):
+        self.group = group
+        self.chr_names = group["chr_names"][:]
+        self.anchor_rows = group["anchor_rows"][:]
+
+    @property
+    def name(self) -> str:
+        return self.group.name
+
+    @property
+    def file(self) -> h5py.File:
+        return self.group.file
+
+    @property
+    def attrs(self) -> h5py.AttributeManager:
+        return self.group.attrs
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return self.group["chr"].shape
+
+    @property
+    def ndim(self) -> int:
+        return 1
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype([(column, self.chr_names.dtype if column == "chr" else "<i8") for column in COLUMNAR_COLUMNS])
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def read_column(self, column: str, start: int, stop: int) -> NDArray:
+        if column == "chr":
+            return self.chr_names[self.group["chr"][start:stop]]
+        if column == "pos":
+            if stop <= start:
+                return np.zeros(0, dtype=np.int64)
+            anchor_rows = self.anchor_rows
+            lo = np.searchsorted(anchor_rows, start, side="right") - 1
+            hi = np.searchsorted(anchor_rows, stop, side="left")
+            first = int(anchor_rows[lo])
+            deltas = self.group["pos"][first:stop]
+            anchors = self.group["pos_anchors"][lo:hi]
+            return decode_positions(deltas, anchor_rows[lo:hi], anchors, first)[start - first:]
+        return self.group[column][start:stop]
+
+    def read(self, columns: List[str] | None = None, rows: int | slice = slice(None)) -> NDArray:
+        """Read rows (a slice) of the given columns (all columns if None) as a structured array"""
+        columns = columns or COLUMNAR_COLUMNS
+        start, stop, step = rows.indices(len(self))
+        stop = max(start, stop)
+        data = np.zeros(stop - start, dtype=[(column, self.dtype[column]) for column in columns])
+        for column in columns:
+            data[column] = self.read_column(column, start, stop)
+        return data[::step]
+
+    def fields(self, names: str | List[str]) -> ColumnarFields:
+        return ColumnarFields(self, names)
+
+    def __getitem__(self, key: int | slice | Tuple) -> NDArray:
+        if key == () or key is Ellipsis:
+            key = slice(None)
+        if isinstance(key, slice):
+            return self.read(None, key)
+        row = int(key) + (len(self) if key < 0 else 0)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Index ({key}) out of range for {self.name} of length {len(self)}")
+        return self.read(None, slice(row, row + 1))[0]
+
+# Types that readers accept as observations or windows datasets.
+DATASET_TYPES: Final = (h5py.Dataset, ColumnarDataset, SharedWindowsDataset, ConsolidatedDataset)
+
+def as_dataset(item: Any) -> Any:
+    """Wrap a columnar group as a ColumnarDataset and shared windows as a SharedWindowsDataset.
+
+    Other items are returned unchanged.
+    """
+    if is_columnar(item):
+        return ColumnarDataset(item)
+    if is_shared(item):
+        return SharedWindowsDataset(item)
+    return item
+
+def open_dataset(file: h5py.File, h5path: str) -> Any:
+    """The dataset at h5path wrapped by as_dataset, or its block of a consolidated store if it is not in file"""
+    if h5path in file:
+        return as_dataset(file[h5path])
+    block = find_block(file, h5path)
+    if block is None:
+        raise KeyError(f"No dataset or consolidated observations at {file.filename}::{h5path}")
+    return block
+
+def write_columnar(
+        parent: h5py.Group,
+        h5path: str,
+        data: NDArray,
+        chunk_rows: int | None = None,
+        **kwargs
+    ) -> ColumnarDataset:
+    """Write observations data in the columnar layout at h5path.
+
+    kwargs are passed to h5py create_dataset for every column, i.e. compression options.
+    Compressed columns wider than a byte are also byte-shuffled, which groups the mostly
+    zero high bytes of small deltas and counts.
+    """
+    if not all(column in (data.dtype.names or []) for column in COLUMNAR_COLUMNS):
+        raise NotColumnarObservations(data.dtype)
+    chr_names, first = np.unique(data["chr"], return_index=True)
+    chr_names = chr_names[np.argsort(first)]
+    codes = np.zeros(len(data), dtype=np.int64)
+    if len(chr_names):
+        lookup = np.argsort(chr_names)
+        codes = lookup[np.searchsorted(chr_names, data["chr"], sorter=lookup)]
+    deltas, anchor_rows, anchors = encode_positions(data["pos"], data["chr"])
+
+    columns = {
+        "chr_names": chr_names.astype(data.dtype["chr"]),
+        "chr": codes.astype(narrow_int_dtype(codes)),
+        "pos": deltas.astype(narrow_int_dtype(deltas)),
+        "anchor_rows": anchor_rows,
+        "pos_anchors": anchors,
+        "c": data["c"].astype(narrow_int_dtype(data["c"])),
+        "t": data["t"].astype(narrow_int_dtype(data["t"]))
+    }
+    group = parent.create_group(h5path)
+    group.attrs["layout"] = COLUMNAR_LAYOUT
+    for name, values in columns.items():
+        chunks = (chunking.chunk_rows(len(values), values.dtype, chunk_rows),)
+        shuffle = kwargs.get("shuffle") or (kwargs.get("compression") is not None and values.dtype.itemsize > 1)
+        group.create_dataset(name, data=values, chunks=chunks, **{**kwargs, "shuffle": shuffle})
+    return ColumnarDataset(group)
@@ -0,0 +1,82 @@
+from typing import *
+
+# Importing hdf5plugin registers its filters with HDF5, so datasets compressed with them
+# are read transparently by every reader once amethyst_facet.h5 is imported.
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+# Filter ids registered with The HDF Group for the hdf5plugin codecs.
+BLOSC_FILTER: Final = 32001
+LZ4_FILTER: Final = 32004
+ZSTD_FILTER: Final = 32015
+
+# Compressors that are not byte-shuffling by themselves. Shuffling groups the n-th byte of
+# every row of the compound dtype together, so the mostly-zero high bytes of the integer
+# columns form long runs that compress well and fast. Blosc shuffles internally.
+SHUFFLED: Final = {"lzf", ZSTD_FILTER, LZ4_FILTER}
+
+PLUGIN_CODECS: Final = ["zstd", "lz4", "blosc", "blosc-lz4", "blosc-lz4hc", "blosc-zstd", "blosc-zlib"]
+
+class CompressionException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class MissingCompressionPlugin(CompressionException):
+    def __init__(self, codec: str):
+        message = (
+            f"Compression '{codec}' requires the hdf5plugin package, which is not installed. "
+            "Install it with 'pip install hdf5plugin', or use gzip or lzf compression."
+        )
+        super().__init__(message)
+
+class InvalidCompressionLevel(CompressionException):
+    def __init__(self, spec: str):
+        message = f"Could not parse compression level in '{spec}'. Use {{codec}}:{{level}}, i.e. 'zstd:3'."
+        super().__init__(message)
+
+def plugin_filter(codec: str, level: int | None) -> Tuple[int, Tuple[int, ...]]:
+    """Filter id and options of an hdf5plugin codec, as h5py compression and compression_opts"""
+    if hdf5plugin is None:
+        raise MissingCompressionPlugin(codec)
+    if codec == "zstd":
+        compressor = hdf5plugin.Zstd(clevel=3 if level is None else level)
+    elif codec == "lz4":
+        # LZ4 has no compression level.
+        compressor = hdf5plugin.LZ4()
+    else:
+        cname = codec.removeprefix("blosc").removeprefix("-") or "lz4"
+        compressor = hdf5plugin.Blosc(cname=cname, clevel=5 if level is None else level, shuffle=hdf5plugin.Blosc.SHUFFLE)
+    return compressor.filter_id, tuple(compressor.filter_options)
+
+def parse_compression(compression: str | None, compression_opts: Any | None) -> Tuple[Any, Any]:
+    """Convert a codec name, optionally with a level as in 'zstd:3', into h5py compression arguments.
+
+    Levels given with the codec name take precedence over compression_opts. gzip, lzf and szip
+    are passed to h5py as-is, while the hdf5plugin codecs in PLUGIN_CODECS become their
+    filter id and options.
+    """
+    if compression is None:
+        return None, compression_opts
+    codec, _, level = compression.partition(":")
+    codec = codec.strip().lower()
+    if level:
+        try:
+            compression_opts = int(level)
+        except ValueError:
+            raise InvalidCompressionLevel(compression)
+    if codec in PLUGIN_CODECS:
+        level = compression_opts if isinstance(compression_opts, int) else None
+        return plugin_filter(codec, level)
+    return codec, compression_opts
+
+def compression_kwargs(compression: Any | None, compression_opts: Any | None) -> Dict[str, Any]:
+    """Keyword arguments for h5py create_dataset with byte-shuffling for codecs that benefit from it"""
+    kwargs = {"compression": compression, "compression_opts": compression_opts}
+    if compression in SHUFFLED:
+        kwargs["shuffle"] = True
+    if compression == "lzf":
+        # lzf takes no options.
+        kwargs["compression_opts"] = None
+    return kwargs
@@ -0,0 +1,326 @@
+from collections import OrderedDict
+from typing import *
+import uuid
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+from . import chunking
+
+# Observations can be consolidated so that every barcode's dataset of one context and name
+# lives in a single store, the group /metadata/observations/<context>/<name>, holding:
+#   barcodes     the barcode of each block of rows, in the order written
+#   offsets      barcode i occupies rows [offsets[i], offsets[i+1]) of every column
+#   chr_names    the chromosome names used by any barcode, in order of first appearance
+#   chr          each row's index into chr_names
+#   pos, c, t    the barcodes' observations, concatenated in the order of barcodes
+# The group has the attribute layout='consolidated'. There is one store per context and name
+# rather than one dataset per barcode, so per-object metadata is small and scanning every
+# barcode reads each column sequentially. Readers yield each barcode's block as the dataset
+# /context/barcode/name. Consolidated observations are not listed in the catalog.
+CONSOLIDATED_LAYOUT: Final = "consolidated"
+OBSERVATIONS_PATH: Final = "/metadata/observations"
+CONSOLIDATED_COLUMNS: Final = ["chr", "pos", "c", "t"]
+chr_code_dtype = np.dtype("<u4")
+
+# Barcode indices of the stores most recently opened, so that opening one barcode's block at a
+# time (as LazyDataset does) does not reread every store's barcodes and offsets. Each store's
+# offsets get a random store_id attribute when created, and a cached index is reused only while the store
+# has the same id, number of barcodes and total rows, so a store rewritten on disk is read again.
+INDEX_CACHE_SIZE: Final = 8
+STORE_ID_ATTR: Final = "store_id"
+_indices: OrderedDict = OrderedDict()
+
+class ConsolidatedException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class NotConsolidatedObservations(ConsolidatedException):
+    def __init__(self, dtype: np.dtype):
+        message = f"Consolidated stores hold observations with columns {CONSOLIDATED_COLUMNS}, but got dtype {dtype}."
+        super().__init__(message)
+
+class DuplicateBarcode(ConsolidatedException):
+    def __init__(self, path: str, barcode: str):
+        message = f"Barcode '{barcode}' is already in consolidated store {path}, and its rows cannot be replaced."
+        super().__init__(message)
+
+class ChromosomeNameTooLong(ConsolidatedException):
+    def __init__(self, path: str, names: List[bytes], dtype: np.dtype):
+        message = f"Chromosome names {names[:10]} are longer than the {dtype} chromosome names of consolidated store {path}."
+        super().__init__(message)
+
+def consolidated_path(context: str, name: str) -> str:
+    return f"{OBSERVATIONS_PATH}/{context}/{name}"
+
+def read_index(group: h5py.Group) -> Tuple[List[str], Dict[str, int], NDArray]:
+    """Barcodes, their rows in barcodes, and offsets of a store, reusing the last read while the store is unchanged.
+
+    Stores whose offsets lack a store_id attribute are read every time.
+    """
+    def read() -> Tuple[List[str], Dict[str, int], NDArray]:
+        barcodes = list(group["barcodes"].asstr()[:])
+        return barcodes, {barcode: row for row, barcode in enumerate(barcodes)}, group["offsets"][:]
+
+    offsets = group["offsets"]
+    store_id = offsets.attrs.get(STORE_ID_ATTR)
+    if store_id is None:
+        return read()
+    key = (group.file.filename, group.name)
+    cached = _indices.get(key)
+    if cached is None or cached[0] != store_id or len(cached[1][2]) != offsets.shape[0] or cached[1][2][-1] != offsets[-1]:
+        cached = (store_id, read())
+        _indices[key] = cached
+    _indices.move_to_end(key)
+    while len(_indices) > INDEX_CACHE_SIZE:
+        _indices.popitem(last=False)
+    return cached[1]
+
+class ConsolidatedFields:
+    """Result of ConsolidatedDataset.fields, sliced by rows like h5py.Dataset.fields"""
+    def __init__(self, dataset: "ConsolidatedDataset", names: str | List[str]):
+        self.dataset = dataset
+        self.names = names
+
+    def __getitem__(self, rows: int | slice) -> NDArray:
+        if isinstance(self.names, str):
+            return self.dataset.read([self.names], rows)[self.names]
+        return self.dataset.read(self.names, rows)
+
+class ConsolidatedDataset:
+    """One barcode's block of a consolidated store, read like an h5py.Dataset of rows.
+
+    Its name is /context/barcode/name, as for the barcode's dataset in the rows layout.
+    Supports reading rows by index or slice, reading columns with fields, and the name,
+    file, attrs, shape and dtype properties. Only the columns requested are read.
+    """
+    def __init__(self, store: "ConsolidatedStore", row: int):
+        self.store = store
+        self.row = row
+
+    @property
+    def barcode(self) -> str:
+        return self.store.barcodes[self.row]
+
+    @property
+    def name(self) -> str:
+        return f"/{self.store.context}/{self.barcode}/{self.store.name}"
+
+    @property
+    def file(self) -> h5py.File:
+        return self.store.group.file
+
+    @property
+    def attrs(self) -> h5py.AttributeManager:
+        return self.store.group.attrs
+
+    @property
+    def start(self) -> int:
+        return int(self.store.offsets[self.row])
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return (int(self.store.offsets[self.row + 1]) - self.start,)
+
+    @property
+    def ndim(self) -> int:
+        return 1
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.store.dtype
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def read(self, columns: List[str] | None = None, rows: int | slice = slice(None)) -> NDArray:
+        """Read rows (a slice) of the given columns (all columns if None) as a structured array"""
+        columns = columns or CONSOLIDATED_COLUMNS
+        start, stop, step = rows.indices(len(self))
+        stop = max(start, stop)
+        return self.store.read_rows(columns, self.start + start, self.start + stop)[::step]
+
+    def fields(self, names: str | List[str]) -> ConsolidatedFields:
+        return ConsolidatedFields(self, names)
+
+    def __getitem__(self, key: int | slice | Tuple) -> NDArray:
+        if key == () or key is Ellipsis:
+            key = slice(None)
+        if isinstance(key, slice):
+            return self.read(None, key)
+        row = int(key) + (len(self) if key < 0 else 0)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Index ({key}) out of range for {self.name} of length {len(self)}")
+        return self.read(None, slice(row, row + 1))[0]
+
+class ConsolidatedStore:
+    """Every barcode's observations of one context and name, concatenated CSR-style.
+
+    Blocks are added with append, and are buffered until about a chunk of rows is pending or
+    flush is called. Use open or create to obtain a store, and dataset or datasets to read it.
+    """
+    def __init__(self, group: h5py.Group, chunk_rows: int | None = None):
+        self.group = group
+        self.chunk_rows = chunk_rows
+        barcodes, rows, offsets = read_index(group)
+        self.barcodes = list(barcodes)
+        self.rows = dict(rows)
+        self.offsets = list(offsets.tolist())
+        self.chr_names = group["chr_names"][:]
+        self.codes = {name: code for code, name in enumerate(self.chr_names.tolist())}
+        self.stored = len(self.barcodes)
+        self.pending: List[NDArray] = []
+
+    @property
+    def context(self) -> str:
+        return self.group.name.split("/")[-2]
+
+    @property
+    def name(self) -> str:
+        return self.group.name.split("/")[-1]
+
+    @property
+    def path(self) -> str:
+        return self.group.name
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype([(column, self.chr_names.dtype if column == "chr" else "<i8") for column in CONSOLIDATED_COLUMNS])
+
+    @staticmethod
+    def create(
+            file: h5py.File,
+            context: str,
+            name: str,
+            chr_dtype: np.dtype = np.dtype("S10"),
+            chunk_rows: int | None = None,
+            **kwargs
+        ) -> "ConsolidatedStore":
+        """Create an empty store. kwargs are passed to h5py create_dataset, i.e. compression options."""
+        group = file.create_group(consolidated_path(context, name))
+        group.attrs["layout"] = CONSOLIDATED_LAYOUT
+        group.create_dataset("barcodes", shape=(0,), maxshape=(None,), dtype=h5py.string_dtype(), chunks=(1024,))
+        offsets = group.create_dataset("offsets", data=np.zeros(1, dtype=np.int64), maxshape=(None,), chunks=(1024,))
+        offsets.attrs[STORE_ID_ATTR] = uuid.uuid4().hex
+        group.create_dataset("chr_names", shape=(0,), maxshape=(None,), dtype=chr_dtype, chunks=(1024,))
+        for column in CONSOLIDATED_COLUMNS:
+            dtype = chr_code_dtype if column == "chr" else np.dtype("<i8")
+            chunks = (chunking.chunk_rows(None, dtype, chunk_rows),)
+            shuffle = kwargs.get("shuffle") or kwargs.get("compression") is not None
+            group.create_dataset(column, shape=(0,), maxshape=(None,), dtype=dtype, chunks=chunks, **{**kwargs, "shuffle": shuffle})
+        return ConsolidatedStore(group, chunk_rows)
+
+    @staticmethod
+    def open(file: h5py.File, context: str, name: str, chunk_rows: int | None = None) -> "ConsolidatedStore | None":
+        path = consolidated_path(context, name)
+        return ConsolidatedStore(file[path], chunk_rows) if path in file else None
+
+    def append(self, barcode: str, data: NDArray) -> ConsolidatedDataset:
+        """Add barcode's observations as a new block, returning the block"""
+        if not all(column in (data.dtype.names or []) for column in CONSOLIDATED_COLUMNS):
+            raise NotConsolidatedObservations(data.dtype)
+        if barcode in self.rows:
+            raise DuplicateBarcode(self.path, barcode)
+        block = np.zeros(len(data), dtype=[("chr", chr_code_dtype)] + [(it, "<i8") for it in CONSOLIDATED_COLUMNS[1:]])
+        block["chr"] = self.chromosome_codes(data["chr"])
+        for column in CONSOLIDATED_COLUMNS[1:]:
+            block[column] = data[column]
+        self.pending.append(block)
+        self.rows[barcode] = len(self.barcodes)
+        self.barcodes.append(barcode)
+        self.offsets.append(self.offsets[-1] + len(data))
+        if sum(len(it) for it in self.pending) >= chunking.chunk_rows(None, np.dtype("<i8"), self.chunk_rows):
+            self.flush()
+        return ConsolidatedDataset(self, self.rows[barcode])
+
+    def chromosome_codes(self, chrom: NDArray) -> NDArray:
+        """Index of each chromosome name into chr_names, adding names not yet in the store"""
+        names, inverse = np.unique(np.asarray(chrom), return_inverse=True)
+        added = [bytes(it) for it in names if bytes(it) not in self.codes]
+        if added:
+            too_long = [it for it in added if len(it) > self.chr_names.dtype.itemsize]
+            if too_long:
+                raise ChromosomeNameTooLong(self.path, too_long, self.chr_names.dtype)
+            for it in added:
+                self.codes[it] = len(self.codes)
+            self.chr_names = np.append(self.chr_names, np.array(added, dtype=self.chr_names.dtype))
+        return np.array([self.codes[bytes(it)] for it in names], dtype=chr_code_dtype)[inverse]
+
+    def flush(self):
+        """Write pending blocks and the barcodes, offsets and chromosome names added since the last flush"""
+        if len(self.barcodes) == self.stored:
+            return
+        rows = self.offsets[self.stored]
+        data = np.concatenate(self.pending)
+        for column in CONSOLIDATED_COLUMNS:
+            self.group[column].resize((rows + len(data),))
+            self.group[column][rows:] = data[column]
+        if len(self.chr_names) > self.group["chr_names"].shape[0]:
+            self.group["chr_names"].resize((len(self.chr_names),))
+            self.group["chr_names"][:] = self.chr_names
+        self.group["barcodes"].resize((len(self.barcodes),))
+        self.group["barcodes"][self.stored:] = self.barcodes[self.stored:]
+        self.group["offsets"].resize((len(self.offsets),))
+        self.group["offsets"][self.stored + 1:] = self.offsets[self.stored + 1:]
+        self.stored = len(self.barcodes)
+        self.pending.clear()
+
+    def read_rows(self, columns: List[str], start: int, stop: int) -> NDArray:
+        """Read rows [start, stop) of the store's columns as observations"""
+        self.flush()
+        data = np.zeros(stop - start, dtype=[(column, self.dtype[column]) for column in columns])
+        for column in columns:
+            values = self.group[column][start:stop]
+            data[column] = self.chr_names[values] if column == "chr" else values
+        return data
+
+    def dataset(self, barcode: str) -> ConsolidatedDataset | None:
+        row = self.rows.get(barcode)
+        return ConsolidatedDataset(self, row) if row is not None else None
+
+    def datasets(self) -> Generator[ConsolidatedDataset, None, None]:
+        """Each barcode's block, in the order stored"""
+        for row in range(len(self.barcodes)):
+            yield ConsolidatedDataset(self, row)
+
+    def drop(self, barcodes: Iterable[str], max_rows: int = 10_000_000) -> "ConsolidatedStore":
+        """Rewrite the store without barcodes, returning the rewritten store"""
+        barcodes = set(barcodes)
+        if not barcodes.intersection(self.rows):
+            return self
+        self.flush()
+        file, path = self.group.file, self.path
+        kwargs = {
+            key: getattr(self.group["pos"], key)
+            for key in ["compression", "compression_opts", "shuffle"]
+        }
+        kept = ConsolidatedStore.create(file, self.context, f"{self.name}.tmp", self.chr_names.dtype, self.chunk_rows, **kwargs)
+        for dataset in self.datasets():
+            if dataset.barcode not in barcodes:
+                kept.append(dataset.barcode, dataset[:])
+        kept.flush()
+        del file[path]
+        file.move(kept.path, path)
+        return ConsolidatedStore(file[path], self.chunk_rows)
+
+def is_consolidated(item: Any) -> bool:
+    return isinstance(item, h5py.Group) and item.attrs.get("layout") == CONSOLIDATED_LAYOUT
+
+def consolidated_stores(file: h5py.File, chunk_rows: int | None = None) -> Generator[ConsolidatedStore, None, None]:
+    """Every consolidated store in file, by context, then name"""
+    if OBSERVATIONS_PATH not in file:
+        return
+    for context in file[OBSERVATIONS_PATH].values():
+        for group in context.values():
+            if is_consolidated(group):
+                yield ConsolidatedStore(group, chunk_rows)
+
+def find_block(file: h5py.File, h5path: str) -> ConsolidatedDataset | None:
+    """The block of a consolidated store holding the dataset /context/barcode/name, if any"""
+    parts = h5path.split("/")[1:]
+    if len(parts) != 3:
+        return None
+    context, barcode, name = parts
+    store = ConsolidatedStore.open(file, context, name)
+    return store.dataset(barcode) if store is not None else None
@@ -16,6 +16,13 @@ observations_v1_dtype = [("chr", "S10"), ("pos", "<i8"), ("pct", "<f8"), ("c", "
 observations_v2_dtype = [("chr", "S10"), ("pos", "<i8"), ("c", "<i8"), ("t", "<i8")]
 observations_dtype = observations_v2_dtype
 windows_dtype = [("chr", "S10"), ("start", "<i8"), ("end", "<i8"), ("c", "<i8"), ("t", "<i8"), ("c_nz", "<i8"), ("t_nz", "<i8")]
+count_columns = ["c", "t", "c_nz", "t_nz"]
+
+# How thoroughly a Dataset checks its data for NaN counts, which are replaced with zero:
+#   full   checks every count column, replacing each with a cleaned copy
+#   fast   checks only floating point count columns, as integers cannot be NaN, and cleans them in place
+#   trust  does no checks, for data facet wrote itself
+VALIDATION_LEVELS: Final = ["full", "fast", "trust"]
 
 class DatasetException(Exception):
     def __init__(self, dataset: "Dataset", message: str):
@@ -33,28 +40,81 @@ class InvalidWindowsDtype(DatasetException):
         )
         super().__init__(dataset, message)
 
+class InvalidValidationLevel(Exception):
+    def __init__(self, validation: str):
+        message = f"Invalid validation level '{validation}'. Valid levels are {VALIDATION_LEVELS}."
+        super().__init__(message)
+
+def check_validation(validation: str) -> str:
+    if validation not in VALIDATION_LEVELS:
+        raise InvalidValidationLevel(validation)
+    return validation
+
+def frame_dtype(columns: Iterable[str]) -> List[Tuple[str, str]] | None:
+    """Dataset dtype of a DataFrame with these columns, or None if it is not an observations or windows frame"""
+    if "pos" in columns and "pct" in columns:
+        return observations_v1_dtype
+    elif "pos" in columns:
+        return observations_v2_dtype
+    elif "start" in columns and "end" in columns:
+        return windows_dtype
+
+def column_to_numpy(series: pl.Series, dtype: np.dtype) -> NDArray:
+    """Values of series to store in a field of dtype, without a per-row Python conversion of strings"""
+    if dtype.kind == "S" and series.dtype == pl.String and not series.null_count():
+        # Strings are encoded once per distinct value, i.e. per chromosome, and gathered by code.
+        categories = series.unique(maintain_order=True)
+        codes = series.cast(pl.Enum(categories)).to_physical().to_numpy()
+        return np.array(categories.to_list(), dtype=dtype)[codes]
+    return series.to_numpy()
+
+def frame_to_numpy(frame: pl.DataFrame, dtype: List[Tuple[str, str]] | None = None) -> NDArray:
+    """Copy a DataFrame into a new structured array of dtype in one pass over each column"""
+    dtype = dtype or frame_dtype(frame.columns)
+    if dtype is None:
+        return frame.to_numpy(structured=True)
+    dtype = np.dtype(dtype)
+    data = np.empty(len(frame), dtype=dtype)
+    for name in dtype.names:
+        data[name] = column_to_numpy(frame[name], dtype[name])
+    return data
+
 @dc.dataclass
 class Dataset:
+    """Observations or windows of one context, barcode and name.
+
+    data is a NumPy structured array, which is what h5py reads and writes. A Dataset built
+    from a DataFrame, like an aggregation result, copies it into data once, directly in the
+    dtype it will be written in, and keeps the frame so pl() returns it without converting
+    data back. Datasets read from HDF5 in the dtype facet writes keep the array as read.
+    Replace data rather than modifying it in place, as a kept frame is not updated.
+
+    validation is one of VALIDATION_LEVELS and sets how data is checked for NaN counts.
+    """
     context: str
     barcode: str
     name: str
     data: NDArray | pl.DataFrame
     path: str | Path = ""
+    attrs: Dict[str, Any] = dc.field(default_factory=dict)
+    validation: str = dc.field(default="full", repr=False, compare=False)
+    _frame: Tuple[NDArray, pl.DataFrame] | None = dc.field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
+        check_validation(self.validation)
         if isinstance(self.data, pl.DataFrame):
-            self.data = self.data.to_numpy(structured=True)
-        for name in ["c", "t", "c_nz", "t_nz"]:
-            if name in self.data.dtype.names:
-                count = sum(np.isnan(self.data[name]))
-                if count:
-                    logger.info(
-                        "{} nan values discovered in Dataset for {}. This will be converted to zero.",
-                        count,
-                        self
-                    )
-
+            self.from_frame(self.data)
+            return
+        for name in count_columns:
+            if name not in self.data.dtype.names or self.validation == "trust":
+                continue
+            elif self.validation == "full":
+                self.log_nan(int(np.isnan(self.data[name]).sum()))
                 self.data[name] = np.nan_to_num(self.data[name], nan=0)
+            elif np.issubdtype(self.data.dtype[name], np.floating):
+                nan = np.isnan(self.data[name])
+                self.log_nan(np.count_nonzero(nan))
+                self.data[name][nan] = 0
         if self.format == "obsv1":
             self.data = self.datav1
         elif self.format == "obsv2":
@@ -62,20 +122,43 @@ class Dataset:
         elif self.format == "windows":
             self.data = self.windows
 
+    def from_frame(self, frame: pl.DataFrame):
+        """Set data from a DataFrame, replacing NaN counts with zero, and keep the frame for pl()"""
+        for name in count_columns:
+            if name in frame.columns and frame[name].dtype.is_float() and self.validation != "trust":
+                self.log_nan(frame[name].is_nan().sum())
+                frame = frame.with_columns(pl.col(name).fill_nan(0))
+        self.data = frame_to_numpy(frame)
+        if frame_dtype(frame.columns) is not None:
+            # The kept frame has the columns and types pl() would give for data.
+            schema = pl.from_numpy(np.zeros(0, dtype=self.data.dtype)).schema
+            self._frame = (self.data, frame.select(schema.names()).cast(dict(schema)))
+
+    def log_nan(self, count: int):
+        if count:
+            logger.info(
+                "{} nan values discovered in Dataset for {}. This will be converted to zero.",
+                count,
+                self
+            )
+
     def convert_dtype(self, dtype: List[Tuple[str, type]], from_df: pl.DataFrame = None):
-        logging.debug(f"Converting to dtype {dtype}")
         data = from_df if from_df is not None else self.data
-        if isinstance(data, pl.DataFrame) or data.dtype != dtype:
-            if isinstance(data, pl.DataFrame):
-                data = data.to_numpy(structured=True)
-            new_data = np.zeros(data.shape, dtype=dtype)
+        if isinstance(data, pl.DataFrame):
+            logging.debug(f"Converting to dtype {dtype}")
+            return frame_to_numpy(data, dtype)
+        elif data.dtype != dtype:
+            logging.debug(f"Converting to dtype {dtype}")
+            new_data = np.empty(data.shape, dtype=dtype)
             for name, _ in dtype:
                 new_data[name] = data[name]
-        else:
-            new_data = data
-        return new_data
+            return new_data
+        return data
 
-    def pl(self):
+    def pl(self) -> pl.DataFrame:
+        """data as a DataFrame. This is the frame the Dataset was built from, if any, and a copy of data otherwise."""
+        if self._frame is not None and self._frame[0] is self.data:
+            return self._frame[1]
         return pl.from_numpy(self.data)
     
     def pd(self):
@@ -135,33 +218,68 @@ class Dataset:
         path = Path(path) if path else self.path
         self.writev2(path, compression, compression_opts)
 
-    def writev1(self, path: str | Path | None = None, how = "barcode", compression: str | None = "gzip", compression_opts: Any | None = 6):
+    def writev1(self, path: str | Path | None = None, how = "barcode", compression: str | None = "gzip", compression_opts: Any | None = 6, chunk_rows: int | None = None):
         path = Path(path) if path else self.path
         with fct.h5.open(path) as file:
             h5v1path = f"/{self.context}/{getattr(self, how)}"
             logger.info("Writing data to {}::{}", file.filename, h5v1path)
-            file.create_dataset(h5v1path, data=self.datav1, compression=compression, compression_opts=compression_opts)
+            data = self.datav1
+            chunks = (fct.h5.chunk_rows(len(data), data.dtype, chunk_rows),)
+            file.create_dataset(h5v1path, data=data, chunks=chunks, **fct.h5.compression_kwargs(compression, compression_opts))
             logger.info("Finished writing data to {}::{}", file.filename, h5v1path)
 
-    def writev2(self, path: str | Path | None = None, compression: str | None = "gzip", compression_opts: Any | None = 6, display_sample = False):
+    def writev2(
+            self,
+            path: str | Path | None = None,
+            compression: str | None = "gzip",
+            compression_opts: Any | None = 6,
+            display_sample = False,
+            chunk_rows: int | None = None,
+            layout: str = "rows",
+            compact_dtypes: bool = False,
+            shared_windows: bool = False
+        ):
+        """Write this dataset alone. To write many datasets to one file, use fct.h5.WriteSession."""
         path = Path(path) if path else self.path
-        exists = path.exists()
-        
-        with fct.h5.open(path) as file:
-            if not exists:
-                # Only add metadata version to file when it's first created.
-                fct.h5.write_version(path)
-            
-            data = self.datav2
-            logger.info("Writing data with dtype={} to {}::{}", data.dtype, file.filename, self.h5path)
-            file.create_dataset(self.h5path, data=data, compression=compression, compression_opts=compression_opts)
-            if display_sample:
-                df = pl.from_numpy(file[self.h5path][:])
-                with pl.Config(tbl_rows=100):
-                    df_string = str(df)
-                logger.info("First sample of current window schema as loaded from H5 file:\n{}", df_string)
-            logging.debug("Finished writing data to {}::{}", file.filename, self.h5path)
-            self.check_version(path)
+        with fct.h5.WriteSession(
+            path,
+            compression,
+            compression_opts,
+            chunk_rows=chunk_rows,
+            layout=layout,
+            compact_dtypes=compact_dtypes,
+            shared_windows=shared_windows
+        ) as session:
+            session.write(self, display_sample)
+
+    def appendv2(
+            self,
+            path: str | Path | None = None,
+            compression: str | None = "gzip",
+            compression_opts: Any | None = 6,
+            chunk_rows: int | None = None,
+            layout: str = "rows",
+            compact_dtypes: bool = False,
+            shared_windows: bool = False
+        ):
+        """Append rows to the dataset at h5path, creating it as a resizable dataset if absent"""
+        path = Path(path) if path else self.path
+        with fct.h5.WriteSession(
+            path,
+            compression,
+            compression_opts,
+            chunk_rows=chunk_rows,
+            layout=layout,
+            compact_dtypes=compact_dtypes,
+            shared_windows=shared_windows
+        ) as session:
+            session.append(self)
+
+    @property
+    def chromosome_index(self) -> Dict[str, Tuple[int, int]]:
+        """Map each chromosome to its [row_start, row_end) in data"""
+        index = fct.h5.compute_chromosome_index(self.data["chr"])
+        return fct.h5.index_ranges(index) if index is not None else {}
 
     @property
     def h5path(self):
@@ -66,6 +66,7 @@ def close(path: str | Path):
 def open(path: str | Path, mode: str = "a", *args, **kwargs) -> Generator[h5py.File, None, None]:
     try:
         if path not in handles:
+            kwargs = {**fct.h5.chunk_cache, **kwargs}
             file = h5py.File(path, mode=mode, *args, **kwargs)
             handles[path] = H5UserCounter(file)
         else:
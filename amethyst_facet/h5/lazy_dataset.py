@@ -0,0 +1,90 @@
+import dataclasses as dc
+from pathlib import Path
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+import pandas as pd
+import polars as pl
+
+from .dataset import Dataset
+import amethyst_facet as fct
+
+@dc.dataclass
+class LazyDataset:
+    """Handle to a dataset in an Amethyst H5 file that reads its data only on first access.
+
+    Holds the location, shape, dtype and attributes of the dataset, which are read from the
+    file's metadata without decompressing any data. Accessing data (or calling pl, pd or load)
+    reads the whole dataset once and caches it as a Dataset. Use read to load only some columns.
+
+    Supports the parts of the Dataset interface used by aggregators, so a LazyDataset can be
+    passed anywhere observations or windows are aggregated.
+    """
+    context: str
+    barcode: str
+    name: str
+    path: str | Path
+    shape: Tuple[int, ...]
+    dtype: np.dtype
+    attrs: Dict[str, Any] = dc.field(default_factory=dict)
+    validation: str = "full"
+    loaded: Dataset | None = dc.field(default=None, init=False, repr=False, compare=False)
+
+    @staticmethod
+    def from_h5(
+            file_path: str | Path,
+            h5_path: str,
+            dataset: h5py.Dataset,
+            attrs: Dict[str, Any] | None = None,
+            validation: str = "full"
+        ) -> "LazyDataset":
+        context, barcode, name = h5_path.split("/")[1:]
+        return LazyDataset(context, barcode, name, Path(file_path), dataset.shape, dataset.dtype, attrs or {}, validation)
+
+    @property
+    def h5path(self) -> str:
+        return f"/{self.context}/{self.barcode}/{self.name}"
+
+    @property
+    def display_path(self) -> str:
+        return f"{self.path}::{self.h5path}"
+
+    @property
+    def format(self) -> str:
+        names = self.dtype.names
+        if "pos" in names and "pct" in names:
+            return "obsv1"
+        elif "pos" in names:
+            return "obsv2"
+        elif "start" in names and "end" in names:
+            return "windows"
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def read(self, columns: List[str] | None = None, rows: slice = slice(None)) -> NDArray:
+        """Read rows of the given columns (all columns if None) from disk without caching them"""
+        if self.loaded is not None:
+            data = self.loaded.data[rows]
+            return data[columns] if columns else data
+        with fct.h5.open(self.path, mode="r") as file:
+            dataset = fct.h5.open_dataset(file, self.h5path)
+            return dataset.fields(columns)[rows] if columns else dataset[rows]
+
+    def load(self) -> Dataset:
+        """Read and cache the whole dataset"""
+        if self.loaded is None:
+            self.loaded = Dataset(self.context, self.barcode, self.name, self.read(), path=self.path, attrs=self.attrs, validation=self.validation)
+        return self.loaded
+
+    @property
+    def data(self) -> NDArray:
+        return self.load().data
+
+    def pl(self) -> pl.DataFrame:
+        return self.load().pl()
+
+    def pd(self) -> pd.DataFrame:
+        return self.load().pd()
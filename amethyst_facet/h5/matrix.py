@@ -0,0 +1,208 @@
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+from loguru import logger
+
+from . import chunking
+from .catalog import decode
+from .region import REGION_END_MAX, Region
+import amethyst_facet as fct
+
+# A matrix store holds the windows of one uniform scheme for every barcode of a context as
+# dense cells x windows arrays, in the group /metadata/matrices/<context>/<name>:
+#   barcodes           the barcode of each row
+#   chr_names          the chromosomes of the window grid, in order
+#   chr_lengths        their lengths in bp
+#   coordinates        (chr, start, end) of each column
+#   c, t               counts, with one row per barcode and one column per window
+#   c_nz, t_nz         optionally, the nonzero position counts
+# The group's size, step and offset attributes are the scheme's. Columns follow
+# fct.windows.WindowGrid, so a window's column is computed from its chr and start. Reading
+# every barcode over a region, or every window of one barcode, is a single hyperslab.
+MATRICES_PATH: Final = "/metadata/matrices"
+MATRIX_COLUMNS: Final = ["c", "t"]
+MATRIX_NZ_COLUMNS: Final = ["c_nz", "t_nz"]
+# Rows per chunk. Rows are buffered and written this many at a time, so each chunk is written once.
+MATRIX_CELL_ROWS: Final = 32
+matrix_dtype = np.dtype("<u4")
+
+class MatrixException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class MatrixMismatch(MatrixException):
+    def __init__(self, path: str, message: str):
+        message = f"Existing matrix store {path} does not match the windows written to it: {message}"
+        super().__init__(message)
+
+class MatrixCountOverflow(MatrixException):
+    def __init__(self, path: str, barcode: str, column: str):
+        message = f"Counts in column '{column}' for barcode '{barcode}' exceed the {matrix_dtype} range of matrix store {path}."
+        super().__init__(message)
+
+class MatrixNeedsUniformWindows(MatrixException):
+    def __init__(self, name: str):
+        message = f"Windows '{name}' have no size, step and offset attributes, so they cannot be written to a matrix store."
+        super().__init__(message)
+
+class UnknownBarcodes(MatrixException):
+    def __init__(self, path: str, barcodes: List[str]):
+        message = f"Barcodes {barcodes[:10]}{'...' if len(barcodes) > 10 else ''} are not in matrix store {path}."
+        super().__init__(message)
+
+def matrix_path(context: str, name: str) -> str:
+    return f"{MATRICES_PATH}/{context}/{name}"
+
+class MatrixStore:
+    """Cells x windows count matrices for one context and uniform windows scheme.
+
+    Rows are added with put, which sets the barcode's counts at its windows' columns, and are
+    buffered until MATRIX_CELL_ROWS rows are pending or flush is called. Use open or create to
+    obtain a store, and read or coordinates to query it.
+    """
+    def __init__(self, group: h5py.Group):
+        self.group = group
+        names = [decode(it) for it in group["chr_names"][:]]
+        self.grid = fct.windows.WindowGrid(
+            int(group.attrs["size"]),
+            int(group.attrs["step"]),
+            int(group.attrs["offset"]),
+            dict(zip(names, group["chr_lengths"][:].tolist()))
+        )
+        self.columns = [it for it in MATRIX_COLUMNS + MATRIX_NZ_COLUMNS if it in group]
+        self.barcodes = [decode(it) for it in group["barcodes"][:]]
+        self.rows = {barcode: row for row, barcode in enumerate(self.barcodes)}
+        self.stored = group[self.columns[0]].shape[0]
+        self.buffer: Dict[int, Dict[str, NDArray]] = {}
+
+    @property
+    def name(self) -> str:
+        return self.group.name
+
+    @staticmethod
+    def create(
+            file: h5py.File,
+            context: str,
+            name: str,
+            grid: "fct.windows.WindowGrid",
+            nz: bool = False,
+            **kwargs
+        ) -> "MatrixStore":
+        """Create an empty store. kwargs are passed to h5py create_dataset, i.e. compression options."""
+        group = file.create_group(matrix_path(context, name))
+        group.attrs.update(grid.attrs)
+        group.create_dataset("chr_names", data=np.array(grid.chr_names, dtype=h5py.string_dtype()))
+        group.create_dataset("chr_lengths", data=np.array([grid.chrom_sizes[it] for it in grid.chr_names], dtype=np.int64))
+        coordinates = grid.coordinates()
+        group.create_dataset(
+            "coordinates",
+            data=coordinates,
+            chunks=(chunking.chunk_rows(len(coordinates), coordinates.dtype),) if len(coordinates) else None,
+            **kwargs
+        )
+        group.create_dataset("barcodes", shape=(0,), maxshape=(None,), dtype=h5py.string_dtype(), chunks=(1024,))
+        windows = max(len(grid), 1)
+        chunks = (MATRIX_CELL_ROWS, min(windows, max(1, chunking.CHUNK_BYTES // (matrix_dtype.itemsize*MATRIX_CELL_ROWS))))
+        for column in MATRIX_COLUMNS + (MATRIX_NZ_COLUMNS if nz else []):
+            group.create_dataset(
+                column, shape=(0, len(grid)), maxshape=(None, len(grid)), dtype=matrix_dtype, chunks=chunks, **kwargs
+            )
+        return MatrixStore(group)
+
+    @staticmethod
+    def open(file: h5py.File, context: str, name: str) -> "MatrixStore | None":
+        path = matrix_path(context, name)
+        return MatrixStore(file[path]) if path in file else None
+
+    def check(self, grid: "fct.windows.WindowGrid", nz: bool):
+        """Raise MatrixMismatch unless grid and nz match the store"""
+        if grid.attrs != self.grid.attrs or grid.chrom_sizes != self.grid.chrom_sizes:
+            raise MatrixMismatch(self.name, f"the store has scheme {self.grid.attrs} over {len(self.grid.chr_names)} chromosomes.")
+        if nz and not all(it in self.columns for it in MATRIX_NZ_COLUMNS):
+            raise MatrixMismatch(self.name, "c_nz and t_nz were requested, but the store was created without them.")
+
+    def put(self, barcode: str, data: NDArray):
+        """Set barcode's counts at the columns of the windows in data, adding a row if it is new"""
+        columns = self.grid.columns(data["chr"], data["start"])
+        on_grid = columns >= 0
+        if not on_grid.all():
+            logger.warning(
+                "{} windows of barcode {} are not on the chrom sizes grid of {} and were not written",
+                int((~on_grid).sum()), barcode, self.name
+            )
+        row = self.row(barcode)
+        for column in self.columns:
+            values = data[column][on_grid]
+            if len(values) and values.max() > np.iinfo(matrix_dtype).max:
+                raise MatrixCountOverflow(self.name, barcode, column)
+            self.buffer[row][column][columns[on_grid]] = values
+
+    def row(self, barcode: str) -> int:
+        """Row of barcode, buffered for writing"""
+        row = self.rows.get(barcode)
+        if row is not None and row in self.buffer:
+            return row
+        if len(self.buffer) >= MATRIX_CELL_ROWS:
+            self.flush()
+        if row is None:
+            row = self.rows[barcode] = len(self.barcodes)
+            self.barcodes.append(barcode)
+        self.buffer[row] = {
+            column: self.group[column][row] if row < self.stored else np.zeros(len(self.grid), dtype=matrix_dtype)
+            for column in self.columns
+        }
+        return row
+
+    def flush(self):
+        """Write buffered rows, in blocks of consecutive rows"""
+        if not self.buffer:
+            return
+        if len(self.barcodes) > self.stored:
+            for column in self.columns:
+                self.group[column].resize((len(self.barcodes), len(self.grid)))
+            self.group["barcodes"].resize((len(self.barcodes),))
+            self.group["barcodes"][self.stored:] = self.barcodes[self.stored:]
+            self.stored = len(self.barcodes)
+        rows = sorted(self.buffer)
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        for block in np.split(np.array(rows), breaks):
+            for column in self.columns:
+                self.group[column][block[0]:block[-1] + 1] = np.stack([self.buffer[row][column] for row in block])
+        self.buffer.clear()
+
+    def window_columns(self, region: str | Region | None = None) -> slice:
+        if region is None:
+            return slice(0, len(self.grid))
+        region = Region.parse(region) if isinstance(region, str) else region
+        end = None if region.end == REGION_END_MAX else region.end
+        return self.grid.chromosome_columns(region.chrom, region.start, end)
+
+    def coordinates(self, region: str | Region | None = None) -> NDArray:
+        """(chr, start, end) of the columns read for region"""
+        return self.group["coordinates"][self.window_columns(region)]
+
+    def read(
+            self,
+            column: str = "c",
+            barcodes: List[str] | None = None,
+            region: str | Region | None = None
+        ) -> NDArray:
+        """Read column for barcodes (all rows if None) over the windows overlapping region (all if None)
+
+        Returns a 2D array with a row per barcode, in the order given, and a column per window
+        as listed by coordinates(region).
+        """
+        self.flush()
+        columns = self.window_columns(region)
+        dataset = self.group[column]
+        if barcodes is None:
+            return dataset[:, columns]
+        unknown = [it for it in barcodes if it not in self.rows]
+        if unknown:
+            raise UnknownBarcodes(self.name, unknown)
+        rows, inverse = np.unique([self.rows[it] for it in barcodes], return_inverse=True)
+        if not len(rows):
+            return np.zeros((0, columns.stop - columns.start), dtype=dataset.dtype)
+        return dataset[rows.tolist(), columns][inverse]
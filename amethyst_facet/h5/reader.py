@@ -7,7 +7,7 @@ import warnings
 import h5py
 from numpy.typing import NDArray
 
-from .dataset import Dataset
+from .dataset import Dataset, check_validation
 import amethyst_facet as fct
 
 class ReaderException(Exception):
@@ -32,8 +32,10 @@ class Reader:
     only: Dict[str, Set] = dc.field(default_factory=dict)
     mode: str = "a"
     reader_type: str = "Reader"
+    validation: str = "full"
 
     def __post_init__(self):
+        check_validation(self.validation)
         for k in self.skip:
             if self.skip[k] is None:
                 self.skip[k] = set()
@@ -42,8 +44,17 @@ class Reader:
                 self.only[k] = set()
 
     def obtain(self, item: h5py.Dataset):
-        if isinstance(item, h5py.Dataset):
-            return item.file.filename, item.name, item[:]
+        item = fct.h5.as_dataset(item)
+        if isinstance(item, fct.h5.DATASET_TYPES):
+            return item.file.filename, item.name, item[:], fct.h5.user_attrs(item)
+        else:
+            return item
+
+    def obtain_handle(self, item: h5py.Dataset):
+        """Like obtain, but returns the open h5py.Dataset instead of reading its data"""
+        item = fct.h5.as_dataset(item)
+        if isinstance(item, fct.h5.DATASET_TYPES):
+            return item.file.filename, item.name, item, fct.h5.user_attrs(item)
         else:
             return item
     
@@ -54,10 +65,12 @@ class Reader:
             self, 
             file_or_group: h5py.File | h5py.Group, 
             level: str,
-            ignore: Callable = lambda x: False
+            ignore: Callable = lambda x: False,
+            obtain: Callable | None = None
             ) -> Generator[h5py.Group | h5py.Dataset, None, None]:
 
         logging.debug(f"Reader.read(file_or_group={file_or_group}, level={level})")
+        obtain = obtain or self.obtain
         skip = set(self.skip.get(level, set())) or set()
         only = set(self.only.get(level, set())) or set()
         logging.debug(f"{self.reader_type} reading from {level} {file_or_group}")
@@ -73,7 +86,7 @@ class Reader:
                     ignore_it = True
                 if present and not ignore_it:
                     logging.debug(f"Yielding {level} {file_or_group.file.filename}::{file_or_group[only_item].name}")
-                    yield self.obtain(file_or_group[only_item])
+                    yield obtain(file_or_group[only_item])
                 elif present:
                     logging.debug(f"Skipped {file_or_group.file.filename}::{file_or_group[only_item].name} (present: {present}, ignored: {ignore_it})")
                 elif not present:
@@ -85,15 +98,15 @@ class Reader:
                 ignore_it = ignore(file_or_group[h5_item])
                 if not_skipped and not ignore_it:
                     logging.debug(f"Yielding {level} {file_or_group.file.filename}::{file_or_group[h5_item].name}")
-                    yield self.obtain(file_or_group[h5_item])
+                    yield obtain(file_or_group[h5_item])
                 else:
                     logging.debug(f"Skipped {file_or_group.file.filename}::{file_or_group[h5_item].name} (not_skipped: {not_skipped}, ignored: {ignore_it})")
 
     def is_observations(self, dataset: h5py.Dataset) -> bool:
-        return isinstance(dataset, h5py.Dataset) and all(col in dataset.dtype.names for col in ["chr", "pos"])
+        return isinstance(dataset, fct.h5.DATASET_TYPES) and all(col in dataset.dtype.names for col in ["chr", "pos"])
 
     def is_windows(self, dataset: h5py.Dataset) -> bool:
-        return isinstance(dataset, h5py.Dataset) and all(col in dataset.dtype.names for col in ["chr", "start", "end"])
+        return isinstance(dataset, fct.h5.DATASET_TYPES) and all(col in dataset.dtype.names for col in ["chr", "start", "end"])
 
     def file_contexts(self, file: h5py.File):
         def ignore(it):
@@ -16,10 +16,10 @@ class ReaderV1(Reader):
     default_name: str = "1"
     reader_type: str = "ReaderV1"
 
-    def create_dataset(self, file_path, h5_path, data):
+    def create_dataset(self, file_path, h5_path, data, attrs = None):
         context, barcode = h5_path.split("/")[1:]
         name = self.default_name or h5_path
-        return Dataset(context, barcode, name, data, path=Path(file_path))
+        return Dataset(context, barcode, name, data, path=Path(file_path), attrs=attrs or {}, validation=self.validation)
 
     def barcodes(self):
         def ignore(it):
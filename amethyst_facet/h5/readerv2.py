@@ -5,9 +5,14 @@ from typing import *
 import warnings
 
 import h5py
+import polars as pl
 
 from .dataset import Dataset
+from .lazy_dataset import LazyDataset
 from .reader import Reader
+from .region import Region
+from .slices import DatasetSlices
+import amethyst_facet as fct
 
 class ReaderException(Exception):
     def __init__(self, message: str):
@@ -17,41 +22,154 @@ class ReaderException(Exception):
 class ReaderV2(Reader):
     reader_type: str = "ReaderV2"
 
-    def barcode_observations(self, barcode: h5py.Group):
+    def barcode_observations(self, barcode: h5py.Group, obtain: Callable | None = None):
         def ignore(it):
-            if not isinstance(it, h5py.Dataset):
+            it = fct.h5.as_dataset(it)
+            if not isinstance(it, fct.h5.DATASET_TYPES):
                 return f"not h5py.Dataset (type={type(it)})"
             elif not self.is_observations(it):
                 return f"not observations dtype (dtype={it.dtype})"
             return False
         
-        yield from self.read(barcode, "observations", ignore)
+        yield from self.read(barcode, "observations", ignore, obtain)
 
-    def barcode_windows(self, barcode: h5py.Group):
+    def barcode_windows(self, barcode: h5py.Group, obtain: Callable | None = None):
         def ignore(it):
-            if not isinstance(it, h5py.Dataset):
+            it = fct.h5.as_dataset(it)
+            if not isinstance(it, fct.h5.DATASET_TYPES):
                 return f"not h5py.Dataset (type={type(it)})"
             elif not self.is_windows(it):
                 return f"not windows dtype (dtype={it.dtype})"
             return False
     
-        yield from self.read(barcode, "windows", ignore)
+        yield from self.read(barcode, "windows", ignore, obtain)
+
+    def datasets(self, kind: str, obtain: Callable | None = None) -> Generator[Any, None, None]:
+        """Yield each selected observations or windows dataset (kind) passed through obtain.
+
+        Files with a /metadata/catalog are enumerated and filtered from the catalog, so only
+        the selected datasets are opened. Other files are traversed group by group. Consolidated
+        observations follow, as each selected barcode's block of each selected store.
+        """
+        obtain = obtain or self.obtain
+        barcode_datasets = self.barcode_observations if kind == "observations" else self.barcode_windows
+        for path in set(self.paths):
+            with fct.h5.open(path, mode=self.mode) as file:
+                catalog = fct.h5.read_catalog(file)
+                if catalog is None:
+                    for context in self.file_contexts(file):
+                        for barcode in self.context_barcodes(context):
+                            yield from barcode_datasets(barcode, obtain)
+                else:
+                    for h5_path in self.catalog_selection(catalog, kind):
+                        yield obtain(file[h5_path])
+                if kind == "observations":
+                    for block in self.consolidated_selection(file):
+                        yield obtain(block)
+
+    def selects(self, level: str, value: str) -> bool:
+        """Whether skip and only select value at level, as Reader.read selects items"""
+        skip = set(self.skip.get(level, set())) or set()
+        only = set(self.only.get(level, set())) or set()
+        return value in only.difference(skip) if only else value not in skip
+
+    def consolidated_selection(self, file: h5py.File) -> Generator[Any, None, None]:
+        """Blocks of the file's consolidated stores selected by skip and only, in stored order"""
+        for store in fct.h5.consolidated_stores(file):
+            if not (self.selects("contexts", store.context) and self.selects("observations", store.name)):
+                continue
+            for block in store.datasets():
+                if self.selects("barcodes", block.barcode):
+                    yield block
+
+    def catalog_selection(self, catalog: pl.DataFrame, kind: str) -> List[str]:
+        """Paths of cataloged datasets of the given kind selected by skip and only, as Reader.read selects them"""
+        selected = catalog.filter(pl.col.kind == kind)
+        for level, column in [("contexts", "context"), ("barcodes", "barcode"), (kind, "name")]:
+            skip = set(self.skip.get(level, set())) or set()
+            only = set(self.only.get(level, set())) or set()
+            if only:
+                selected = selected.filter(pl.col(column).is_in(list(only.difference(skip))))
+            elif skip:
+                selected = selected.filter(~pl.col(column).is_in(list(skip)))
+        return [f"/{context}/{barcode}/{name}" for context, barcode, name in selected.select("context", "barcode", "name").iter_rows()]
 
     def barcodes(self) -> Generator[h5py.Group, None, None]:
         for context in self.contexts():
             yield from self.context_barcodes(context)
 
-    def create_dataset(self, file_path, h5_path, data):
+    def create_dataset(self, file_path, h5_path, data, attrs = None):
         context, barcode, name = h5_path.split("/")[1:]
-        result = Dataset(context, barcode, name, data, path=Path(file_path))
+        result = Dataset(context, barcode, name, data, path=Path(file_path), attrs=attrs or {}, validation=self.validation)
         return result
 
-    def observations(self) -> Generator[Dataset, None, None]:
-        for barcode in self.barcodes():
-            for it in self.barcode_observations(barcode):
-                yield self.create_dataset(*it)
+    def create_lazy_dataset(self, file_path, h5_path, dataset, attrs = None):
+        return LazyDataset.from_h5(file_path, h5_path, dataset, attrs, self.validation)
+
+    def observations(self, lazy: bool = False) -> Generator[Dataset | LazyDataset, None, None]:
+        """Yield observations datasets. If lazy, yield LazyDatasets that read data only when accessed."""
+        obtain, create = (self.obtain_handle, self.create_lazy_dataset) if lazy else (self.obtain, self.create_dataset)
+        for it in self.datasets("observations", obtain):
+            yield create(*it)
+
+    def observation_slices(self, max_rows: int) -> Generator[DatasetSlices, None, None]:
+        """Yield observations datasets as consecutive slices of at most max_rows rows, read on demand"""
+        for file_path, h5_path, dataset, attrs in self.datasets("observations", self.obtain_handle):
+            yield DatasetSlices(Path(file_path), h5_path, dataset, max_rows, attrs, self.validation)
+
+    def query(
+            self, 
+            region: str | Region, 
+            barcodes: Iterable[str] | None = None, 
+            names: Iterable[str] | None = None
+        ) -> Generator[Dataset, None, None]:
+        """Yield the rows of each observations and windows dataset overlapping a genomic region
+
+        Only the rows of the region's chromosome block between binary searched bounds are
+        read from disk (see Region.rows), so the cost per dataset is independent of its size.
+        Datasets the catalog records as unsorted are read whole and filtered instead, as are
+        datasets missing from the catalog whose searched rows turn out to be out of order.
+
+        Args:
+            region: Region string formatted as chr, chr:start-end or chr:start-, or a Region.
+                Observations overlap if start <= pos < end and windows if they intersect [start, end).
+            barcodes: Only query these barcodes. If None, queries all barcodes selected by the reader.
+            names: Only query datasets with these names (i.e. ["1", "10000"]). If None, queries all datasets.
+
+        Example:
+        ```
+        reader = fct.h5.ReaderV2(paths=["cells.h5"])
+        for dataset in reader.query("chr1:1000000-2000000", names=["1", "10000"]):
+            print(dataset.barcode, dataset.pl())
+        ```
+        """
+        region = region if isinstance(region, Region) else Region.parse(region)
+        barcodes = set(barcodes) if barcodes is not None else None
+        names = set(names) if names is not None else None
+        # Narrow the reader's selection so unselected barcodes and names are never opened.
+        only = dict(self.only)
+        for levels, selected in [(["barcodes"], barcodes), (["observations", "windows"], names)]:
+            for level in levels:
+                if selected is not None:
+                    only[level] = selected.intersection(only[level]) if only.get(level) else selected
+                    if not only[level]:
+                        return
+        reader = dc.replace(self, only=only)
+        # Catalog sorted flags by file and dataset path, read once per file.
+        ordered = {}
+        for kind in ["observations", "windows"]:
+            for file_path, h5_path, dataset, attrs in reader.datasets(kind, reader.obtain_handle):
+                if file_path not in ordered:
+                    catalog = fct.h5.read_catalog(dataset.file)
+                    ordered[file_path] = {} if catalog is None else {
+                        f"/{context}/{barcode}/{name}": flag
+                        for context, barcode, name, flag in catalog.select("context", "barcode", "name", "sorted").iter_rows()
+                    }
+                data = region.read(dataset, attrs, ordered[file_path].get(h5_path))
+                yield self.create_dataset(file_path, h5_path, data, attrs)
 
-    def windows(self) -> Generator[Dataset, None, None]:
-        for barcode in self.barcodes():
-            for it in self.barcode_windows(barcode):
-                yield self.create_dataset(*it)
\ No newline at end of file
+    def windows(self, lazy: bool = False) -> Generator[Dataset | LazyDataset, None, None]:
+        """Yield windows datasets. If lazy, yield LazyDatasets that read data only when accessed."""
+        obtain, create = (self.obtain_handle, self.create_lazy_dataset) if lazy else (self.obtain, self.create_dataset)
+        for it in self.datasets("windows", obtain):
+            yield create(*it)
\ No newline at end of file
@@ -0,0 +1,144 @@
+from pathlib import Path
+from typing import *
+
+import h5py
+from loguru import logger
+import numpy as np
+
+from . import chunking
+from .catalog import add_to_catalog, catalog_entry, dataset_is_sorted, dataset_kind, remove_from_catalog
+from .columnar import COLUMNAR_LAYOUT, COMPACT_ATTR, DATASET_TYPES, LAYOUT_ATTRS, LAYOUTS, ROWS_LAYOUT, ColumnarDataset, InvalidLayout, as_dataset, compact_dtype, is_columnar, widened_dtype, write_columnar
+from .compression import compression_kwargs
+from .consolidated import CONSOLIDATED_LAYOUT, OBSERVATIONS_PATH, ConsolidatedDataset, ConsolidatedStore, consolidated_path, consolidated_stores
+from .shared_windows import is_shared
+import amethyst_facet as fct
+
+def recompress_file(
+        source: str | Path,
+        target: str | Path,
+        compression: Any | None,
+        compression_opts: Any | None,
+        chunk_rows: int | None = None,
+        max_rows: int = 10_000_000,
+        layout: str | None = None,
+        compact_dtypes: bool | None = None
+    ):
+    """Copy every group, dataset and attribute of source into a new file at target.
+
+    Observations and windows datasets are rewritten with the given compression and chunk
+    layout, reading at most max_rows rows at a time. Observations are rewritten in layout
+    ("rows", "columnar" or "consolidated"), or in their current layout if None. Columnar
+    observations are encoded whole and consolidated observations are moved one barcode at a
+    time, so max_rows does not bound memory for them. Consolidating removes the datasets'
+    catalog entries, and splitting consolidated stores into per-barcode datasets adds them.
+    Other datasets under /metadata, including the catalog, are copied unchanged, except that
+    windows whose dtype changes get a new catalog entry. Windows are rewritten with compact
+    dtypes (see WriteSession) if compact_dtypes, with full int64 columns if it is False, or as
+    they are stored if None. Windows stored with shared coordinates are recompressed as stored.
+    """
+    if layout is not None and layout not in LAYOUTS:
+        raise InvalidLayout(layout)
+    kwargs = compression_kwargs(compression, compression_opts)
+    with fct.h5.open(source, "r") as src, fct.h5.open(target, "w-") as dst:
+        dst.attrs.update(src.attrs)
+        # Datasets whose dtype changed, or that were split out of consolidated stores, to record
+        # in the catalog once /metadata has been copied, and datasets that were consolidated.
+        retyped, consolidated = [], []
+        stores: Dict[str, ConsolidatedStore] = {}
+
+        def copy(group: h5py.Group):
+            for item in group.values():
+                dataset = as_dataset(item)
+                if item.name == "/metadata":
+                    copy_metadata(item)
+                elif is_shared(item):
+                    # Shared windows keep their layout, as their coordinate tables are copied with /metadata.
+                    rewrite(item, ROWS_LAYOUT)
+                elif layout == CONSOLIDATED_LAYOUT and isinstance(dataset, DATASET_TYPES) and dataset_kind(dataset.dtype) == "observations":
+                    consolidate(dataset)
+                    consolidated.append(dataset.name)
+                elif isinstance(dataset, DATASET_TYPES) and dataset.ndim == 1:
+                    rewrite(dataset, layout or (COLUMNAR_LAYOUT if is_columnar(item) else ROWS_LAYOUT))
+                elif isinstance(item, h5py.Group):
+                    dst.require_group(item.name).attrs.update(item.attrs)
+                    copy(item)
+                else:
+                    src.copy(item, dst, item.name)
+
+        def copy_metadata(metadata: h5py.Group):
+            dst.require_group(metadata.name).attrs.update(metadata.attrs)
+            for item in metadata.values():
+                if item.name != OBSERVATIONS_PATH:
+                    src.copy(item, dst, item.name)
+            for store in consolidated_stores(src):
+                for block in store.datasets():
+                    if layout in [None, CONSOLIDATED_LAYOUT]:
+                        consolidate(block)
+                    else:
+                        rewrite(block, layout)
+                        retyped.append(block.name)
+
+        def consolidate(dataset: Any):
+            context, barcode, name = dataset.name.split("/")[1:]
+            path = consolidated_path(context, name)
+            if path not in stores:
+                stores[path] = (
+                    ConsolidatedStore.open(dst, context, name, chunk_rows)
+                    or ConsolidatedStore.create(dst, context, name, dataset.dtype["chr"], chunk_rows, **kwargs)
+                )
+            stores[path].append(barcode, dataset[:])
+
+        def rewrite(item: h5py.Dataset | ColumnarDataset | ConsolidatedDataset, layout: str):
+            attrs = {key: value for key, value in item.attrs.items() if key not in LAYOUT_ATTRS or is_shared(item)}
+            kind = dataset_kind(item.dtype)
+            compact = COMPACT_ATTR in item.attrs if compact_dtypes is None else compact_dtypes
+            if layout == COLUMNAR_LAYOUT and kind == "observations":
+                dataset = write_columnar(dst, item.name, item[:], chunk_rows, **kwargs)
+            else:
+                dtype = item.dtype
+                if kind == "windows":
+                    dtype = rewritten_dtype(item, compact)
+                nrows = item.shape[0]
+                resizable = isinstance(item, ColumnarDataset) or (isinstance(item, h5py.Dataset) and item.maxshape[0] is None)
+                rows = chunking.chunk_rows(None if resizable else nrows, dtype, chunk_rows)
+                dataset = dst.create_dataset(
+                    item.name,
+                    shape=item.shape,
+                    dtype=dtype,
+                    chunks=(rows,),
+                    maxshape=(None,) if resizable else item.shape,
+                    **kwargs
+                )
+                for start in range(0, nrows, max_rows):
+                    dataset[start:start + max_rows] = item[start:start + max_rows].astype(dtype)
+                if compact and kind == "windows":
+                    dataset.attrs[COMPACT_ATTR] = [name for name in dtype.names if name != "chr"]
+                if dtype != item.dtype:
+                    retyped.append(item.name)
+            dataset.attrs.update(attrs)
+            logger.debug("Recompressed {}::{}", source, item.name)
+
+        def rewritten_dtype(item: h5py.Dataset, compact: bool) -> np.dtype:
+            if not compact:
+                return np.dtype([
+                    (name, np.int64 if np.issubdtype(item.dtype[name], np.integer) else item.dtype[name])
+                    for name in item.dtype.names
+                ])
+            # The narrowest types are found from the column ranges of every slice before writing.
+            dtype = compact_dtype(item[:0])
+            for start in range(0, item.shape[0], max_rows):
+                dtype = widened_dtype(dtype, compact_dtype(item[start:start + max_rows]))
+            return dtype
+
+        copy(src)
+        for store in stores.values():
+            store.flush()
+        # Barcode and context groups left empty by consolidation are removed.
+        for path in consolidated:
+            barcode = path.rsplit("/", 1)[0]
+            for group in [barcode, barcode.rsplit("/", 1)[0]]:
+                if group in dst and not len(dst[group]):
+                    del dst[group]
+        remove_from_catalog(dst, consolidated)
+        datasets = [as_dataset(dst[it]) for it in retyped]
+        add_to_catalog(dst, [catalog_entry(it, dataset_is_sorted(it, max_rows)) for it in datasets])
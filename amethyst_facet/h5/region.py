@@ -0,0 +1,128 @@
+import bisect
+import dataclasses as dc
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+from .chromosome_index import read_chromosome_index, compute_chromosome_index, index_ranges
+
+class RegionException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class InvalidRegion(RegionException):
+    def __init__(self, region: str, message: str = ""):
+        message = (
+            f"Could not parse region '{region}'. Regions must be formatted as chr, chr:start-end or chr:start-, "
+            f"i.e. 'chr1:1000000-2000000'. {message}"
+        )
+        super().__init__(message)
+
+class Column:
+    """Sequence view of one field of a sorted h5py.Dataset, reading single elements on demand.
+
+    Used with the bisect module to binary search a column on disk. Each probe reads only the
+    chunk containing the probed row. Probed values are kept, so a search can check that the
+    rows it touched are in order.
+    """
+    def __init__(self, dataset: h5py.Dataset, field: str):
+        self.dataset = dataset
+        self.field = field
+        self.probed: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return self.dataset.shape[0]
+
+    def __getitem__(self, row: int):
+        value = self.dataset[row][self.field]
+        self.probed[row] = value
+        return value
+
+    def probes_sorted(self) -> bool:
+        """Whether the probed values are nondecreasing in row order"""
+        values = [self.probed[row] for row in sorted(self.probed)]
+        return all(a <= b for a, b in zip(values, values[1:]))
+
+REGION_END_MAX: Final = int(np.iinfo(np.int64).max)
+
+@dc.dataclass
+class Region:
+    """Genomic interval [start, end) on chrom, in the same coordinates as pos, start and end columns"""
+    chrom: str
+    start: int = 0
+    end: int = REGION_END_MAX
+
+    @staticmethod
+    def parse(region: str) -> "Region":
+        """Parse a region string formatted as chr, chr:start-end or chr:start-"""
+        chrom, _, interval = region.partition(":")
+        if not chrom:
+            raise InvalidRegion(region, "No chromosome given.")
+        if not interval:
+            return Region(chrom)
+        start, sep, end = interval.replace(",", "").partition("-")
+        try:
+            start = int(start)
+            end = int(end) if end else REGION_END_MAX
+        except ValueError:
+            raise InvalidRegion(region, "Start and end must be integers.")
+        if not sep or start > end:
+            raise InvalidRegion(region, "Start must be at most end.")
+        return Region(chrom, start, end)
+
+    def overlaps(self, data: NDArray) -> NDArray:
+        """Mask of rows in observations or windows data overlapping the region"""
+        on_chrom = data["chr"] == self.chrom.encode()
+        if "pos" in data.dtype.names:
+            return on_chrom & (data["pos"] >= self.start) & (data["pos"] < self.end)
+        return on_chrom & (data["start"] < self.end) & (data["end"] > self.start)
+
+    def rows(self, dataset: h5py.Dataset, attrs: Dict[str, Any] | None = None, ordered: bool | None = None) -> Tuple[int, int] | None:
+        """Find [row_start, row_end) of dataset containing every row overlapping the region
+
+        Rows are found by binary search on pos (observations) or start (windows) within the
+        chromosome's block of rows. Returns None if the dataset is not sorted by chromosome,
+        then pos or start. ordered is the catalog's sorted flag for the dataset. If it is None,
+        the rows probed by the search are checked to be in order, and None is returned if
+        they are not, so an unsorted block is read whole rather than searched.
+        For windows, the window size in attrs (written for uniform windows) bounds how far
+        before the region start an overlapping window can begin. Without it, the end column
+        of the chromosome block is read to find the first overlapping window.
+        """
+        if ordered is False:
+            return None
+        attrs = attrs if attrs is not None else dict(dataset.attrs)
+        index = read_chromosome_index(dataset)
+        if index is None:
+            built = compute_chromosome_index(dataset.fields("chr")[:])
+            if built is None:
+                return None
+            index = index_ranges(built)
+        block_start, block_end = index.get(self.chrom, (0, 0))
+
+        if "pos" in dataset.dtype.names:
+            column = Column(dataset, "pos")
+            lo = bisect.bisect_left(column, self.start, block_start, block_end)
+            hi = bisect.bisect_left(column, self.end, lo, block_end)
+            return (lo, hi) if ordered or column.probes_sorted() else None
+
+        column = Column(dataset, "start")
+        hi = bisect.bisect_left(column, self.end, block_start, block_end)
+        if "size" in attrs:
+            lo = bisect.bisect_left(column, self.start - int(attrs["size"]) + 1, block_start, hi)
+        else:
+            ends = dataset.fields("end")[block_start:hi]
+            overlapping = np.flatnonzero(ends > self.start)
+            lo = block_start + int(overlapping[0]) if len(overlapping) else hi
+        return (lo, hi) if ordered or column.probes_sorted() else None
+
+    def read(self, dataset: h5py.Dataset, attrs: Dict[str, Any] | None = None, ordered: bool | None = None) -> NDArray:
+        """Read the rows of dataset overlapping the region, reading only their hyperslab when possible.
+
+        Unsorted datasets are read whole and masked (see rows).
+        """
+        rows = self.rows(dataset, attrs, ordered)
+        data = dataset[rows[0]:rows[1]] if rows is not None else dataset[:]
+        return data[self.overlaps(data)]
@@ -0,0 +1,206 @@
+from collections import OrderedDict
+from typing import *
+import uuid
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+import polars as pl
+
+from . import chunking
+
+# Windows datasets can store their coordinates in a table shared by every dataset of the
+# scheme. The table is /metadata/windows/<name>, with one (chr, start, end) row per window
+# any dataset of the scheme has written. Each /context/barcode/<name> dataset then stores
+# (window_index, c, t, c_nz, t_nz) rows, where window_index is the window's row in the table,
+# and has the attributes layout='shared' and coordinates='/metadata/windows/<name>'.
+# The table is append-only, so indices written earlier stay valid as windows are added.
+# Readers join the coordinates back to give the usual windows rows.
+SHARED_LAYOUT: Final = "shared"
+WINDOWS_TABLES_PATH: Final = "/metadata/windows"
+SHARED_ATTRS: Final = ["coordinates"]
+COORDINATE_COLUMNS: Final = ["chr", "start", "end"]
+SHARED_COLUMNS: Final = ["window_index", "c", "t", "c_nz", "t_nz"]
+shared_dtype = [("window_index", "<i8"), ("c", "<i8"), ("t", "<i8"), ("c_nz", "<i8"), ("t_nz", "<i8")]
+
+# Coordinate tables most recently read, so the datasets of many barcodes share one read.
+# Each table gets a random table_id attribute when created, and a cached read is reused only
+# while the table has the same id and length, so a table recreated or replaced on disk is read again.
+COORDINATES_CACHE_SIZE: Final = 8
+TABLE_ID_ATTR: Final = "table_id"
+_coordinates: OrderedDict = OrderedDict()
+
+class SharedWindowsException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class NotWindows(SharedWindowsException):
+    def __init__(self, dtype: np.dtype):
+        message = f"Shared coordinates store windows with columns {COORDINATE_COLUMNS + SHARED_COLUMNS[1:]}, but got dtype {dtype}."
+        super().__init__(message)
+
+def windows_table_path(name: str) -> str:
+    return f"{WINDOWS_TABLES_PATH}/{name}"
+
+def is_shared(item: Any) -> bool:
+    return isinstance(item, h5py.Dataset) and item.attrs.get("layout") == SHARED_LAYOUT
+
+def read_coordinates(table: h5py.Dataset) -> NDArray:
+    """Read a coordinate table, reusing the last read while the table is the same and has not grown.
+
+    Tables without a table_id attribute are read every time.
+    """
+    table_id = table.attrs.get(TABLE_ID_ATTR)
+    if table_id is None:
+        return table[:]
+    key = (table.file.filename, table.name)
+    cached = _coordinates.get(key)
+    if cached is None or cached[0] != table_id or len(cached[1]) != table.shape[0]:
+        cached = (table_id, table[:])
+        _coordinates[key] = cached
+    _coordinates.move_to_end(key)
+    while len(_coordinates) > COORDINATES_CACHE_SIZE:
+        _coordinates.popitem(last=False)
+    return cached[1]
+
+class SharedWindowsFields:
+    """Result of SharedWindowsDataset.fields, sliced by rows like h5py.Dataset.fields"""
+    def __init__(self, dataset: "SharedWindowsDataset", names: str | List[str]):
+        self.dataset = dataset
+        self.names = names
+
+    def __getitem__(self, rows: int | slice) -> NDArray:
+        if isinstance(self.names, str):
+            return self.dataset.read([self.names], rows)[self.names]
+        return self.dataset.read(self.names, rows)
+
+class SharedWindowsDataset:
+    """Windows stored as indices into a shared coordinate table, read like an h5py.Dataset of rows.
+
+    Supports reading rows by slice or index, reading columns with fields, and the name, file,
+    attrs, shape, maxshape and dtype properties. The coordinate table is only read when chr,
+    start or end are requested.
+    """
+    def __init__(self, dataset: h5py.Dataset):
+        self.dataset = dataset
+
+    @property
+    def name(self) -> str:
+        return self.dataset.name
+
+    @property
+    def file(self) -> h5py.File:
+        return self.dataset.file
+
+    @property
+    def attrs(self) -> h5py.AttributeManager:
+        return self.dataset.attrs
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return self.dataset.shape
+
+    @property
+    def maxshape(self) -> Tuple[int | None]:
+        return self.dataset.maxshape
+
+    @property
+    def ndim(self) -> int:
+        return 1
+
+    @property
+    def table(self) -> h5py.Dataset:
+        return self.file[self.attrs["coordinates"]]
+
+    @property
+    def dtype(self) -> np.dtype:
+        coordinates = self.table.dtype
+        return np.dtype(
+            [(name, coordinates[name]) for name in COORDINATE_COLUMNS]
+            + [(name, "<i8") for name in SHARED_COLUMNS[1:]]
+        )
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def read(self, columns: List[str] | None = None, rows: int | slice = slice(None)) -> NDArray:
+        """Read rows (a slice) of the given columns (all columns if None) as a structured array"""
+        columns = columns or list(self.dtype.names)
+        joined = [it for it in columns if it in COORDINATE_COLUMNS]
+        stored = [it for it in columns if it not in COORDINATE_COLUMNS] + (["window_index"] if joined else [])
+        values = self.dataset.fields(stored)[rows]
+        data = np.zeros(len(values), dtype=[(column, self.dtype[column]) for column in columns])
+        if joined:
+            coordinates = read_coordinates(self.table)[values["window_index"]]
+        for column in columns:
+            data[column] = coordinates[column] if column in joined else values[column]
+        return data
+
+    def fields(self, names: str | List[str]) -> SharedWindowsFields:
+        return SharedWindowsFields(self, names)
+
+    def __getitem__(self, key: int | slice | Tuple) -> NDArray:
+        if key == () or key is Ellipsis:
+            key = slice(None)
+        if isinstance(key, slice):
+            return self.read(None, key)
+        row = int(key) + (len(self) if key < 0 else 0)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Index ({key}) out of range for {self.name} of length {len(self)}")
+        return self.read(None, slice(row, row + 1))[0]
+
+class WindowsTable:
+    """Assigns window indices in one file's coordinate table, adding windows it lacks.
+
+    Holds the table in memory as a polars DataFrame while a WriteSession is open, so looking
+    up each dataset's windows is a join rather than a read of the table.
+    """
+    def __init__(self, file: h5py.File, name: str, **kwargs):
+        """kwargs are passed to h5py create_dataset when creating the table, i.e. compression options"""
+        self.file = file
+        self.path = windows_table_path(name)
+        self.kwargs = kwargs
+        if self.path in file:
+            coordinates = pl.from_numpy(file[self.path][:])
+        else:
+            coordinates = pl.DataFrame(schema={"chr": pl.Binary, "start": pl.Int64, "end": pl.Int64})
+        self.coordinates = coordinates.with_row_index("window_index").with_columns(pl.col.window_index.cast(pl.Int64))
+
+    def indices(self, data: NDArray, coordinates_dtype: np.dtype) -> NDArray:
+        """Window index of each row of windows data, appending unseen windows to the table"""
+        windows = pl.DataFrame({column: data[column] for column in COORDINATE_COLUMNS})
+        joined = self.join(windows)
+        missing = joined.filter(pl.col.window_index.is_null()).select(COORDINATE_COLUMNS).unique(maintain_order=True)
+        if len(missing):
+            self.append(missing, coordinates_dtype)
+            joined = self.join(windows)
+        return joined["window_index"].to_numpy()
+
+    def join(self, windows: pl.DataFrame) -> pl.DataFrame:
+        return windows.join(self.coordinates, on=COORDINATE_COLUMNS, how="left", maintain_order="left")
+
+    def append(self, missing: pl.DataFrame, coordinates_dtype: np.dtype):
+        first = len(self.coordinates)
+        rows = np.zeros(len(missing), dtype=coordinates_dtype)
+        for column in COORDINATE_COLUMNS:
+            rows[column] = missing[column].to_numpy()
+        if self.path not in self.file:
+            chunks = (chunking.chunk_rows(None, rows.dtype),)
+            table = self.file.create_dataset(self.path, data=rows, maxshape=(None,), chunks=chunks, **self.kwargs)
+            table.attrs[TABLE_ID_ATTR] = uuid.uuid4().hex
+        else:
+            table = self.file[self.path]
+            table.resize((first + len(rows),))
+            table[first:] = rows
+        added = missing.with_row_index("window_index", offset=first).with_columns(pl.col.window_index.cast(pl.Int64))
+        self.coordinates = pl.concat([self.coordinates, added.select(self.coordinates.columns)])
+
+def to_shared(data: NDArray, indices: NDArray) -> NDArray:
+    """Rows of windows data as stored in the shared layout, given their window indices"""
+    if not all(column in (data.dtype.names or []) for column in COORDINATE_COLUMNS + SHARED_COLUMNS[1:]):
+        raise NotWindows(data.dtype)
+    shared = np.zeros(len(data), dtype=shared_dtype)
+    shared["window_index"] = indices
+    for column in SHARED_COLUMNS[1:]:
+        shared[column] = data[column]
+    return shared
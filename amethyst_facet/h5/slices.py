@@ -0,0 +1,82 @@
+import dataclasses as dc
+from pathlib import Path
+from typing import *
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+from .dataset import Dataset
+
+class DatasetSlicesException(Exception):
+    def __init__(self, slices: "DatasetSlices", message: str):
+        message = f"Problem reading slices of {slices.path}::{slices.h5path}: {message}"
+        super().__init__(message)
+
+class InvalidMaxRows(DatasetSlicesException):
+    def __init__(self, slices: "DatasetSlices"):
+        message = f"max_rows must be a positive integer, but max_rows={slices.max_rows}."
+        super().__init__(slices, message)
+
+class UnsortedObservations(DatasetSlicesException):
+    def __init__(self, slices: "DatasetSlices", row: int):
+        message = (
+            f"Observations are not sorted by (chr, pos) at row {row}. "
+            f"Streaming aggregation requires observations sorted by chr, then pos, "
+            f"as written by facet calls2h5 and facet convert."
+        )
+        super().__init__(slices, message)
+
+Boundary = Tuple[str, int] | None
+
+@dc.dataclass
+class DatasetSlices:
+    """Consecutive row slices of at most max_rows rows from an observations dataset on disk.
+
+    Iterating yields (Dataset, boundary) pairs, where boundary is the (chr, pos) of the first
+    row after the slice, or None for the last slice. Observations must be sorted by (chr, pos)
+    so that a slice's boundary is at or after every position in it.
+    """
+    path: str | Path
+    h5path: str
+    dataset: h5py.Dataset
+    max_rows: int
+    attrs: Dict[str, Any] = dc.field(default_factory=dict)
+    validation: str = "full"
+
+    def __post_init__(self):
+        if self.max_rows is None or self.max_rows < 1:
+            raise InvalidMaxRows(self)
+
+    @property
+    def context(self) -> str:
+        return self.h5path.split("/")[1]
+
+    @property
+    def barcode(self) -> str:
+        return self.h5path.split("/")[2]
+
+    @property
+    def name(self) -> str:
+        return self.h5path.split("/")[3]
+
+    def check_sorted(self, chrom: NDArray, pos: NDArray, start: int):
+        ordered = (chrom[1:] > chrom[:-1]) | ((chrom[1:] == chrom[:-1]) & (pos[1:] >= pos[:-1]))
+        if not ordered.all():
+            raise UnsortedObservations(self, start + int(np.argmin(ordered)) + 1)
+
+    def __iter__(self) -> Generator[Tuple[Dataset, Boundary], None, None]:
+        rows = self.dataset.shape[0]
+        for start in range(0, max(rows, 1), self.max_rows):
+            end = min(start + self.max_rows, rows)
+            data = self.dataset[start:end]
+            chrom, pos = data["chr"], data["pos"]
+            boundary = None
+            if end < rows:
+                # Reading the single row after the slice gives the boundary without a second slice in memory.
+                row = self.dataset[end]
+                chrom, pos = np.append(chrom, row["chr"]), np.append(pos, row["pos"])
+                boundary = (row["chr"].decode(), int(row["pos"]))
+            self.check_sorted(chrom, pos, start)
+            dataset = Dataset(self.context, self.barcode, self.name, data, path=Path(self.path), attrs=self.attrs, validation=self.validation)
+            yield dataset, boundary
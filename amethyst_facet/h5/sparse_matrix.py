@@ -0,0 +1,207 @@
+from pathlib import Path
+from typing import *
+import zipfile
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+import polars as pl
+
+from . import chunking
+from .matrix import MatrixCountOverflow, matrix_dtype
+from .shared_windows import COORDINATE_COLUMNS
+import amethyst_facet as fct
+
+# facet matrix exports the windows datasets of one scheme as sparse cells x windows matrices
+# in CSR form, one row per barcode dataset. In HDF5 output each context is a group holding:
+#   barcodes     the barcode of each row
+#   windows      (chr, start, end) of each column
+#   c, t, frac   CSR matrices, each a group with data, indices and indptr datasets and the
+#                attributes encoding-type='csr_matrix' and shape, as written by anndata
+# The three matrices have the same sparsity, holding an entry for every window a barcode has
+# observations in, so a stored frac of 0 is an unmethylated window rather than a missing one.
+# t and frac hard link to the indices and indptr of c, which are stored once.
+SPARSE_MATRICES: Final = ["c", "t", "frac"]
+frac_dtype = np.dtype("<f4")
+indptr_dtype = np.dtype("<i8")
+
+class SparseMatrixException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class NoWindowsDatasets(SparseMatrixException):
+    def __init__(self, name: str):
+        message = f"No windows datasets named '{name}' were found in the selected contexts and barcodes."
+        super().__init__(message)
+
+class WindowColumns:
+    """Column of each window of a sparse matrix, given its (chr, start, end) coordinates.
+
+    Columns are either the windows of a WindowGrid, computed arithmetically from chr and start,
+    or a table of windows sorted by (chr, start, end), looked up with a join.
+    """
+    def __init__(self, coordinates: NDArray, grid: "fct.windows.WindowGrid | None" = None):
+        self.coordinates = coordinates
+        self.grid = grid
+        if grid is None:
+            self.table = pl.from_numpy(coordinates).with_row_index("column").with_columns(pl.col.column.cast(pl.Int64))
+
+    @staticmethod
+    def from_grid(grid: "fct.windows.WindowGrid") -> "WindowColumns":
+        return WindowColumns(grid.coordinates(), grid)
+
+    @staticmethod
+    def union(coordinates: Iterable[NDArray], max_rows: int = 10_000_000) -> "WindowColumns":
+        """Columns for every distinct window in coordinates, deduplicating at most max_rows pending rows at a time"""
+        union = WindowUnion(max_rows)
+        for data in coordinates:
+            union.add(data)
+        return union.columns()
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def columns(self, data: NDArray) -> NDArray:
+        """Column of each window in data, or -1 if it is not a column"""
+        if self.grid is not None:
+            return self.grid.columns(data["chr"], data["start"])
+        windows = pl.DataFrame({column: data[column] if column == "chr" else data[column].astype(np.int64) for column in COORDINATE_COLUMNS})
+        joined = windows.join(self.table, on=COORDINATE_COLUMNS, how="left", maintain_order="left")
+        return joined["column"].fill_null(-1).to_numpy()
+
+class WindowUnion:
+    """Distinct windows of coordinate arrays added one at a time.
+
+    Only the coordinate columns are kept, and pending rows are deduplicated into the windows
+    seen so far whenever max_rows of them accumulate, so the added arrays are never all held.
+    """
+    def __init__(self, max_rows: int = 10_000_000):
+        self.max_rows = max_rows
+        self.seen: pl.DataFrame | None = None
+        self.pending: List[pl.DataFrame] = []
+        self.rows = 0
+        self.chr_dtype = np.dtype("S10")
+
+    def add(self, data: NDArray):
+        self.pending.append(pl.from_numpy(data[COORDINATE_COLUMNS]))
+        self.rows += len(data)
+        self.chr_dtype = max(self.chr_dtype, data.dtype["chr"], key=lambda dtype: dtype.itemsize)
+        if self.rows >= self.max_rows:
+            self.deduplicate()
+
+    def deduplicate(self):
+        frames = ([] if self.seen is None else [self.seen]) + self.pending
+        if frames:
+            self.seen = pl.concat(frames).unique()
+        self.pending, self.rows = [], 0
+
+    def columns(self) -> WindowColumns:
+        """Columns for every distinct window added, sorted by (chr, start, end)"""
+        self.deduplicate()
+        windows = None if self.seen is None else self.seen.sort(COORDINATE_COLUMNS)
+        data = np.zeros(0 if windows is None else len(windows), dtype=[("chr", self.chr_dtype), ("start", "<i8"), ("end", "<i8")])
+        for column in COORDINATE_COLUMNS:
+            if windows is not None:
+                data[column] = windows[column].to_numpy()
+        return WindowColumns(data)
+
+class SparseMatrixWriter:
+    """Appends barcodes' windows as rows of the CSR matrices of one context's output group.
+
+    Rows are buffered until about a chunk of entries is pending or flush is called, so each
+    append to the data and indices datasets writes whole chunks.
+    """
+    def __init__(self, group: h5py.Group, columns: WindowColumns, chunk_rows: int | None = None, **kwargs):
+        """kwargs are passed to h5py create_dataset, i.e. compression options"""
+        self.group = group
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.barcodes: List[str] = []
+        self.nnz = 0
+        self.pending: List[Tuple[NDArray, NDArray, NDArray, NDArray]] = []
+        self.dropped = 0
+        group.create_dataset("windows", data=columns.coordinates, **kwargs)
+        index_dtype = np.dtype("<i4") if len(columns) < np.iinfo(np.int32).max else np.dtype("<i8")
+        for name in SPARSE_MATRICES:
+            matrix = group.create_group(name)
+            matrix.attrs["encoding-type"] = "csr_matrix"
+            matrix.attrs["encoding-version"] = "0.1.0"
+            dtype = frac_dtype if name == "frac" else matrix_dtype
+            matrix.create_dataset("data", shape=(0,), maxshape=(None,), dtype=dtype, chunks=(self.chunks(dtype),), **kwargs)
+        group["c"].create_dataset("indices", shape=(0,), maxshape=(None,), dtype=index_dtype, chunks=(self.chunks(index_dtype),), **kwargs)
+        group["c"].create_dataset("indptr", data=np.zeros(1, dtype=indptr_dtype), maxshape=(None,), chunks=(self.chunks(indptr_dtype),))
+        for name in SPARSE_MATRICES[1:]:
+            group[name]["indices"] = group["c"]["indices"]
+            group[name]["indptr"] = group["c"]["indptr"]
+
+    def chunks(self, dtype: np.dtype) -> int:
+        return chunking.chunk_rows(None, dtype, self.chunk_rows)
+
+    def append(self, barcode: str, data: NDArray):
+        """Add a row of barcode's windows data. Windows that are not columns are not written."""
+        columns = self.columns.columns(data)
+        kept = columns >= 0
+        self.dropped += int((~kept).sum())
+        order = np.argsort(columns[kept], kind="stable")
+        columns, data = columns[kept][order], data[kept][order]
+        counts = {}
+        for name in ["c", "t"]:
+            if len(data) and data[name].max() > np.iinfo(matrix_dtype).max:
+                raise MatrixCountOverflow(self.group.name, barcode, name)
+            counts[name] = data[name].astype(matrix_dtype)
+        total = counts["c"].astype(np.int64) + counts["t"]
+        frac = np.divide(counts["c"], total, out=np.zeros(len(data), dtype=np.float64), where=total > 0).astype(frac_dtype)
+        self.pending.append((columns, counts["c"], counts["t"], frac))
+        self.barcodes.append(barcode)
+        if sum(len(it[0]) for it in self.pending) >= self.chunks(matrix_dtype):
+            self.flush()
+
+    def flush(self):
+        """Write pending rows"""
+        if not self.pending:
+            return
+        lengths = [len(it[0]) for it in self.pending]
+        start = self.nnz
+        self.nnz += sum(lengths)
+        for position, dataset in enumerate([self.group["c"]["indices"], *[self.group[it]["data"] for it in SPARSE_MATRICES]]):
+            dataset.resize((self.nnz,))
+            dataset[start:] = np.concatenate([it[position] for it in self.pending])
+        indptr = self.group["c"]["indptr"]
+        rows = indptr.shape[0]
+        indptr.resize((rows + len(lengths),))
+        indptr[rows:] = start + np.cumsum(lengths)
+        self.pending.clear()
+
+    def close(self):
+        """Flush pending rows and write the barcodes and matrix shapes"""
+        self.flush()
+        self.group.create_dataset("barcodes", data=np.array(self.barcodes, dtype=h5py.string_dtype()))
+        for name in SPARSE_MATRICES:
+            self.group[name].attrs["shape"] = (len(self.barcodes), len(self.columns))
+
+def write_npz(matrix: h5py.Group, barcodes: NDArray, windows: NDArray, path: str | Path, max_rows: int = 10_000_000):
+    """Write a CSR matrix group as a .npz file readable by scipy.sparse.load_npz.
+
+    The barcodes and the windows' chr, start and end are stored as extra arrays. Arrays are
+    copied into the archive at most max_rows entries at a time.
+    """
+    arrays = {
+        "data": matrix["data"],
+        "indices": matrix["indices"],
+        "indptr": matrix["indptr"],
+        "shape": np.array(matrix.attrs["shape"], dtype=np.int64),
+        "format": np.array(b"csr"),
+        "barcodes": np.array([fct.h5.decode(it) for it in barcodes], dtype=str),
+        **{column: windows[column] for column in COORDINATE_COLUMNS}
+    }
+    with zipfile.ZipFile(path, "w", allowZip64=True) as archive:
+        for key, array in arrays.items():
+            with archive.open(f"{key}.npy", "w", force_zip64=True) as member:
+                # h5py string dtypes carry metadata that .npy headers cannot store, so only their layout is written.
+                header = {"descr": np.lib.format.dtype_to_descr(np.dtype(array.dtype.str)), "fortran_order": False, "shape": array.shape}
+                np.lib.format.write_array_header_1_0(member, header)
+                if isinstance(array, np.ndarray):
+                    member.write(np.ascontiguousarray(array).tobytes())
+                    continue
+                for start in range(0, array.shape[0], max_rows):
+                    member.write(np.ascontiguousarray(array[start:start + max_rows]).tobytes())
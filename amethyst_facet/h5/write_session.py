@@ -0,0 +1,292 @@
+import dataclasses as dc
+from pathlib import Path
+from typing import *
+import warnings
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+import polars as pl
+from loguru import logger
+
+from .catalog import add_to_catalog, catalog_entry, create_catalog, dataset_is_sorted, dataset_kind, has_catalog, is_sorted, recent_entry
+from .chunking import chunk_rows
+from .compression import compression_kwargs
+from .chromosome_index import append_chromosome_index, compute_chromosome_index, index_attrs, user_attrs, write_chromosome_index
+from .consolidated import CONSOLIDATED_LAYOUT, ConsolidatedDataset, ConsolidatedStore, consolidated_path
+from .matrix import MatrixNeedsUniformWindows, MatrixStore, matrix_path
+from .shared_windows import COORDINATE_COLUMNS, SHARED_LAYOUT, SharedWindowsDataset, WindowsTable, is_shared, to_shared, windows_table_path
+from .columnar import COLUMNAR_LAYOUT, COMPACT_ATTR, LAYOUTS, ColumnarDataset, InvalidLayout, as_dataset, compact_dtype, is_columnar, widened_dtype, write_columnar
+import amethyst_facet as fct
+
+@dc.dataclass
+class WriteSession:
+    """Write many datasets to one Amethyst H5 file while keeping it open.
+
+    On entry the file is opened once through fct.h5.open. A new file gets its /metadata/version
+    and catalog, and an existing file has its version checked, once per session rather than once
+    per dataset. Parent groups are created once and remembered, and the file is flushed every
+    flush_every datasets and on exit, so many small datasets are written per flush.
+
+    Datasets are chunked with chunk_rows rows per chunk, or by the default policy of
+    fct.h5.chunk_rows if None. compression and compression_opts are h5py arguments as
+    returned by fct.h5.parse_compression.
+
+    With layout="columnar", observations are written in the columnar layout described in
+    fct.h5.columnar, and windows are written as rows. With layout="consolidated", each
+    observations dataset is appended as a block of its context and name's consolidated
+    store (see fct.h5.consolidated) instead. With compact_dtypes, the integer columns
+    of windows are stored in the narrowest type holding their values, and appends widen them
+    as needed. With shared_windows, windows are stored as indices into their scheme's
+    coordinate table, as described in fct.h5.shared_windows. write_matrix writes uniform
+    windows as rows of the cells x windows matrices described in fct.h5.matrix instead.
+
+    Every dataset written gets a chromosome index and a catalog entry.
+
+    Example:
+    ```
+    with WriteSession("cells.h5") as session:
+        for result in results:
+            session.write(result)
+    ```
+    """
+    path: str | Path
+    compression: str | None = "gzip"
+    compression_opts: Any | None = 6
+    mode: str = "a"
+    chunk_rows: int | None = None
+    layout: str = "rows"
+    compact_dtypes: bool = False
+    shared_windows: bool = False
+    flush_every: int = 256
+    file: h5py.File | None = dc.field(default=None, init=False, repr=False)
+    groups: Set[str] = dc.field(default_factory=set, init=False, repr=False)
+    tables: Dict[str, WindowsTable] = dc.field(default_factory=dict, init=False, repr=False)
+    matrices: Dict[str, MatrixStore] = dc.field(default_factory=dict, init=False, repr=False)
+    stores: Dict[str, ConsolidatedStore] = dc.field(default_factory=dict, init=False, repr=False)
+    unflushed: int = dc.field(default=0, init=False, repr=False)
+    opened: Any = dc.field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+        if self.layout not in LAYOUTS:
+            raise InvalidLayout(self.layout)
+
+    def __enter__(self) -> "WriteSession":
+        creates = self.mode in ["w", "w-", "x"] or not self.path.exists()
+        self.opened = fct.h5.open(self.path, mode=self.mode)
+        self.file = self.opened.__enter__()
+        if creates:
+            self.file.create_dataset("/metadata/version", data=fct.h5.version)
+            # Files created without a catalog never get one, as it would omit earlier datasets.
+            create_catalog(self.file)
+        else:
+            self.check_version()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            for store in [*self.matrices.values(), *self.stores.values()]:
+                store.flush()
+            if self.unflushed or self.matrices or self.stores:
+                self.file.flush()
+        finally:
+            self.opened.__exit__(*exc_info)
+            self.file = None
+            self.opened = None
+            self.groups.clear()
+            self.tables.clear()
+            self.matrices.clear()
+            self.stores.clear()
+            self.unflushed = 0
+
+    def check_version(self):
+        version = None
+        try:
+            version = self.file["/metadata/version"][()].decode()
+            assert version == fct.h5.version
+        except:
+            warnings.warn(f"Amethyst H5 file {self.path} version='{version}'")
+
+    def require_parent(self, h5path: str):
+        parent = h5path.rsplit("/", 1)[0]
+        if parent and parent not in self.groups:
+            self.file.require_group(parent)
+            self.groups.add(parent)
+
+    def written(self):
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.file.flush()
+            self.unflushed = 0
+
+    def create(
+            self,
+            h5path: str,
+            data: NDArray,
+            attrs: Dict[str, Any] | None = None,
+            resizable: bool = False,
+            layout: str | None = None,
+            compact: bool | None = None,
+            shared: bool | None = None
+        ) -> h5py.Dataset | ColumnarDataset | SharedWindowsDataset | ConsolidatedDataset:
+        """Create a dataset from data as stored, with its attributes, chromosome index and catalog entry
+
+        layout, compact and shared override the session's layout, compact_dtypes and
+        shared_windows for this dataset.
+        """
+        if (layout or self.layout) == CONSOLIDATED_LAYOUT and dataset_kind(data.dtype) == "observations":
+            return self.consolidate(h5path, data, attrs)
+        self.require_parent(h5path)
+        kwargs = compression_kwargs(self.compression, self.compression_opts)
+        windows = dataset_kind(data.dtype) == "windows"
+        compact = (self.compact_dtypes if compact is None else compact) and windows
+        shared = (self.shared_windows if shared is None else shared) and windows
+        chrom, ordered = data["chr"], is_sorted(data)
+        if shared:
+            data = self.share(h5path, data)
+        if compact:
+            data = data.astype(compact_dtype(data))
+        if (layout or self.layout) == COLUMNAR_LAYOUT and "pos" in (data.dtype.names or []):
+            dataset = write_columnar(self.file, h5path, data, self.chunk_rows, **kwargs)
+        else:
+            rows = chunk_rows(None if resizable else len(data), data.dtype, self.chunk_rows)
+            dataset = self.file.create_dataset(
+                h5path,
+                data=data,
+                chunks=(rows,),
+                maxshape=(None,) if resizable else None,
+                **kwargs
+            )
+        dataset.attrs.update(attrs or {})
+        if compact:
+            dataset.attrs[COMPACT_ATTR] = [name for name in data.dtype.names if name != "chr"]
+        if shared:
+            dataset.attrs["layout"] = SHARED_LAYOUT
+            dataset.attrs["coordinates"] = windows_table_path(h5path.rsplit("/", 1)[-1])
+            dataset = SharedWindowsDataset(dataset)
+        write_chromosome_index(dataset, compute_chromosome_index(chrom))
+        add_to_catalog(self.file, [catalog_entry(dataset, ordered)], update=resizable)
+        self.written()
+        return dataset
+
+    def consolidate(self, h5path: str, data: NDArray, attrs: Dict[str, Any] | None = None) -> ConsolidatedDataset:
+        """Append observations data as the barcode's block of its context and name's consolidated store
+
+        Blocks have no attributes of their own, so attrs are not written.
+        """
+        context, barcode, name = h5path.split("/")[1:]
+        path = consolidated_path(context, name)
+        store = self.stores.get(path)
+        if store is None:
+            store = ConsolidatedStore.open(self.file, context, name, self.chunk_rows)
+            if store is None:
+                kwargs = compression_kwargs(self.compression, self.compression_opts)
+                store = ConsolidatedStore.create(self.file, context, name, data.dtype["chr"], self.chunk_rows, **kwargs)
+            self.stores[path] = store
+        if attrs:
+            logger.warning("Attributes {} of {} are not stored in the consolidated layout", list(attrs), h5path)
+        return store.append(barcode, data)
+
+    def drop_blocks(self, h5paths: Iterable[str]):
+        """Remove the consolidated blocks of datasets at h5paths, rewriting each store once"""
+        dropped: Dict[Tuple[str, str], List[str]] = {}
+        for h5path in h5paths:
+            parts = h5path.split("/")[1:]
+            if len(parts) == 3:
+                context, barcode, name = parts
+                dropped.setdefault((context, name), []).append(barcode)
+        for (context, name), barcodes in dropped.items():
+            path = consolidated_path(context, name)
+            store = self.stores.get(path) or ConsolidatedStore.open(self.file, context, name, self.chunk_rows)
+            if store is not None and set(barcodes).intersection(store.rows):
+                logger.info("Removing {} barcodes from consolidated store {}::{}", len(set(barcodes).intersection(store.rows)), self.path, path)
+                self.stores[path] = store.drop(barcodes)
+
+    def share(self, h5path: str, data: NDArray) -> NDArray:
+        """Windows data as stored in the shared layout, adding its windows to the scheme's coordinate table"""
+        name = h5path.rsplit("/", 1)[-1]
+        if name not in self.tables:
+            kwargs = compression_kwargs(self.compression, self.compression_opts)
+            self.tables[name] = WindowsTable(self.file, name, **kwargs)
+        coordinates_dtype = np.dtype([(column, data.dtype[column]) for column in COORDINATE_COLUMNS])
+        return to_shared(data, self.tables[name].indices(data, coordinates_dtype))
+
+    def write(self, dataset: "fct.h5.Dataset", display_sample: bool = False, resizable: bool = False):
+        """Write dataset in Amethyst v2 format at its h5path, as a resizable dataset that can be appended to if resizable"""
+        data = dataset.datav2
+        logger.info("Writing data with dtype={} to {}::{}", data.dtype, self.path, dataset.h5path)
+        self.create(dataset.h5path, data, dataset.attrs, resizable=resizable)
+        if display_sample:
+            with pl.Config(tbl_rows=100):
+                df_string = str(pl.from_numpy(data))
+            logger.info("First sample of current window schema as written to H5 file:\n{}", df_string)
+        logger.debug("Finished writing data to {}::{}", self.path, dataset.h5path)
+
+    def write_matrix(self, dataset: "fct.h5.Dataset", chrom_sizes: Dict[str, int], nz: bool = False):
+        """Write uniform windows as the barcode's row of the matrix store of its context and scheme
+
+        The store is created over the windows of chrom_sizes if absent. With nz, it also holds
+        c_nz and t_nz. Windows outside chrom_sizes are not written.
+        """
+        h5path = matrix_path(dataset.context, dataset.name)
+        store = self.matrices.get(h5path)
+        if store is None:
+            scheme = fct.windows.UniformWindowsAggregator.from_attrs(dataset.attrs, dataset.name)
+            if scheme is None:
+                raise MatrixNeedsUniformWindows(dataset.name)
+            grid = fct.windows.WindowGrid.from_aggregator(scheme, chrom_sizes)
+            store = MatrixStore.open(self.file, dataset.context, dataset.name)
+            if store is None:
+                kwargs = compression_kwargs(self.compression, self.compression_opts)
+                store = MatrixStore.create(self.file, dataset.context, dataset.name, grid, nz, **kwargs)
+            store.check(grid, nz)
+            self.matrices[h5path] = store
+        store.put(dataset.barcode, dataset.datav2)
+
+    def append(self, dataset: "fct.h5.Dataset"):
+        """Append rows to the dataset at h5path, creating it as a resizable dataset if absent"""
+        data = dataset.datav2
+        if dataset.h5path not in self.file:
+            logger.info("Creating resizable dataset with dtype={} at {}::{}", data.dtype, self.path, dataset.h5path)
+            self.create(dataset.h5path, data, dataset.attrs, resizable=True)
+            return
+
+        h5_dataset = self.file[dataset.h5path]
+        if is_columnar(h5_dataset):
+            # Columns are encoded as a whole, so appending rewrites the dataset with the new rows.
+            existing = ColumnarDataset(h5_dataset)
+            attrs = user_attrs(existing)
+            data = np.concatenate([existing[:].astype(data.dtype), data])
+            del self.file[dataset.h5path]
+            self.create(dataset.h5path, data, attrs, resizable=True, layout=COLUMNAR_LAYOUT)
+            return
+
+        shared = is_shared(h5_dataset)
+        stored = self.share(dataset.h5path, data) if shared else data
+        if COMPACT_ATTR in h5_dataset.attrs:
+            dtype = widened_dtype(h5_dataset.dtype, compact_dtype(stored))
+            if dtype != h5_dataset.dtype:
+                # The appended values do not fit the narrow columns, so the dataset is rewritten wider.
+                existing = as_dataset(h5_dataset)
+                attrs = user_attrs(existing)
+                data = np.concatenate([existing[:].astype(data.dtype), data])
+                del self.file[dataset.h5path]
+                self.create(dataset.h5path, data, attrs, resizable=True, compact=True, shared=shared)
+                return
+
+        rows = h5_dataset.shape[0]
+        recent = recent_entry(self.file, dataset.context, dataset.barcode, dataset.name)
+        if recent is not None:
+            was_ordered = recent[1]["sorted"]
+        else:
+            was_ordered = has_catalog(self.file) and dataset_is_sorted(as_dataset(h5_dataset))
+        h5_dataset.resize((rows + len(stored),))
+        h5_dataset[rows:] = stored
+        index = append_chromosome_index(index_attrs(h5_dataset), compute_chromosome_index(data["chr"]))
+        write_chromosome_index(h5_dataset, index)
+        # Chromosomes stay in contiguous blocks only if the appended index is valid.
+        h5_dataset = as_dataset(h5_dataset)
+        ordered = was_ordered and index is not None and is_sorted(h5_dataset[max(rows - 1, 0):])
+        add_to_catalog(self.file, [catalog_entry(h5_dataset, ordered)], update=True)
+        self.written()
@@ -0,0 +1,2 @@
+from .ordered_pool import *
+from .dataset_writer import *
@@ -0,0 +1,226 @@
+import dataclasses as dc
+import multiprocessing
+from pathlib import Path
+import queue
+import traceback
+from typing import *
+
+class DatasetWriterException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class WriterFailed(DatasetWriterException):
+    def __init__(self, error: str):
+        message = f"Writer process failed, so no further datasets were written:\n{error}"
+        super().__init__(message)
+
+class InvalidMaxQueued(DatasetWriterException):
+    def __init__(self, max_queued: int):
+        message = f"Maximum number of queued datasets must be a positive integer, but max_queued={max_queued}."
+        super().__init__(message)
+
+# (method, dataset, keyword arguments) for a fct.h5.WriteSession method such as write or append.
+WriteItem = Tuple[str, Any, Dict[str, Any]]
+
+class Session:
+    """Performs writes in the process that owns the output files.
+
+    Keeps a fct.h5.WriteSession open on the most recently written file, so consecutive
+    datasets for the same file are written within one session.
+    """
+    def __init__(
+            self,
+            path: str | Path | None,
+            compression: str | None,
+            compression_opts: Any,
+            chunk_rows: int | None = None,
+            layout: str = "rows",
+            compact_dtypes: bool = False,
+            shared_windows: bool = False
+        ):
+        self.path = path
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.chunk_rows = chunk_rows
+        self.layout = layout
+        self.compact_dtypes = compact_dtypes
+        self.shared_windows = shared_windows
+        self.session = None
+
+    def write(self, item: WriteItem):
+        import amethyst_facet as fct
+        method, dataset, kwargs = item
+        path = Path(self.path) if self.path else Path(dataset.path)
+        if self.session is not None and self.session.path != path:
+            self.close()
+        if self.session is None:
+            self.session = fct.h5.WriteSession(
+                path,
+                self.compression,
+                self.compression_opts,
+                chunk_rows=self.chunk_rows,
+                layout=self.layout,
+                compact_dtypes=self.compact_dtypes,
+                shared_windows=self.shared_windows
+            ).__enter__()
+        getattr(self.session, method)(dataset, **kwargs)
+
+    def close(self):
+        if self.session is not None:
+            session, self.session = self.session, None
+            session.__exit__(None, None, None)
+
+def _write_loop(items: "multiprocessing.Queue", errors: "multiprocessing.Queue", path, compression, compression_opts, chunk_rows, layout, compact_dtypes, shared_windows, chunk_cache):
+    import amethyst_facet as fct
+    # The spawned process starts from the default chunk cache, so it is set from the parent's.
+    fct.h5.chunk_cache.update(chunk_cache)
+    session = Session(path, compression, compression_opts, chunk_rows, layout, compact_dtypes, shared_windows)
+    failed = False
+    try:
+        # Items are written as they arrive until the None sentinel, all within one session.
+        for item in iter(items.get, None):
+            if failed:
+                # Keep draining the queue so producers blocked on put can finish.
+                continue
+            try:
+                session.write(item)
+            except Exception:
+                errors.put(traceback.format_exc())
+                failed = True
+    finally:
+        session.close()
+
+@dc.dataclass
+class DatasetWriter:
+    """Write Datasets from a single dedicated process fed by a bounded queue.
+
+    HDF5 files cannot be written safely from several processes, and fct.h5.open's handle
+    registry is per process, so all writes go through one writer. Call write or append with
+    finished Datasets from the process that runs the pipeline. Items are written in the order
+    they are queued. Once max_queued datasets are waiting, write and append block until the
+    writer catches up, which bounds memory when computing results is faster than writing them.
+
+    If process is False, datasets are written in the calling process as they are queued,
+    through the same write session. Use this when the output file is also an input file that
+    the calling process has open, as HDF5 locks files against concurrent opening by other processes.
+
+    Use as a context manager. Exiting waits for every queued dataset to be written.
+
+    Example:
+    ```
+    with DatasetWriter("out.h5") as writer, OrderedPool(aggregator.aggregate, nproc = 8) as pool:
+        for results in pool.map(reader.observations()):
+            for result in results:
+                writer.write(result)
+    ```
+    """
+    path: str | Path | None = None
+    compression: str | None = "gzip"
+    compression_opts: Any | None = 6
+    max_queued: int = 16
+    process: bool = True
+    chunk_rows: int | None = None
+    layout: str = "rows"
+    compact_dtypes: bool = False
+    shared_windows: bool = False
+    items: Any = dc.field(default=None, init=False, repr=False)
+    errors: Any = dc.field(default=None, init=False, repr=False)
+    writer: multiprocessing.Process | None = dc.field(default=None, init=False, repr=False)
+    session: Session | None = dc.field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.max_queued is None or self.max_queued < 1:
+            raise InvalidMaxQueued(self.max_queued)
+
+    def __enter__(self) -> "DatasetWriter":
+        import amethyst_facet as fct
+        if self.process:
+            # Spawned rather than forked, as forking after polars has started its thread pool can deadlock.
+            context = multiprocessing.get_context("spawn")
+            self.items = context.Queue(maxsize = self.max_queued)
+            self.errors = context.Queue()
+            self.writer = context.Process(
+                target = _write_loop,
+                args = (
+                    self.items,
+                    self.errors,
+                    self.path,
+                    self.compression,
+                    self.compression_opts,
+                    self.chunk_rows,
+                    self.layout,
+                    self.compact_dtypes,
+                    self.shared_windows,
+                    dict(fct.h5.chunk_cache)
+                ),
+                daemon = True
+            )
+            self.writer.start()
+        else:
+            self.session = Session(
+                self.path,
+                self.compression,
+                self.compression_opts,
+                self.chunk_rows,
+                self.layout,
+                self.compact_dtypes,
+                self.shared_windows
+            )
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        if self.writer is not None:
+            # The sentinel is queued without checking for writer failures, so the writer is always
+            # stopped and joined, and its failures never replace an exception already propagating.
+            try:
+                self.send_sentinel()
+            finally:
+                self.writer.join()
+                self.writer = None
+            if exc_type is None:
+                self.check()
+
+    def check(self):
+        """Raise WriterFailed if the writer process has failed"""
+        if self.errors is not None:
+            try:
+                raise WriterFailed(self.errors.get_nowait())
+            except queue.Empty:
+                pass
+
+    def send_sentinel(self):
+        """Queue the None sentinel, waiting for room only while the writer process is alive"""
+        while self.writer.is_alive():
+            try:
+                self.items.put(None, timeout = 1)
+                return
+            except queue.Full:
+                pass
+
+    def put(self, item: WriteItem | None):
+        if self.session is not None:
+            self.session.write(item)
+            return
+        while True:
+            self.check()
+            try:
+                self.items.put(item, timeout = 1)
+                return
+            except queue.Full:
+                if not self.writer.is_alive():
+                    raise WriterFailed(f"Writer process exited with code {self.writer.exitcode}.")
+
+    def write(self, dataset, display_sample: bool = False, resizable: bool = False):
+        """Queue dataset to be written with fct.h5.WriteSession.write"""
+        self.put(("write", dataset, {"display_sample": display_sample, "resizable": resizable}))
+
+    def append(self, dataset):
+        """Queue dataset to be appended with fct.h5.WriteSession.append"""
+        self.put(("append", dataset, {}))
+
+    def write_matrix(self, dataset, chrom_sizes: Dict[str, int], nz: bool = False):
+        """Queue windows to be written to a matrix store with fct.h5.WriteSession.write_matrix"""
+        self.put(("write_matrix", dataset, {"chrom_sizes": chrom_sizes, "nz": nz}))
@@ -0,0 +1,86 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import dataclasses as dc
+import multiprocessing
+from typing import *
+
+class OrderedPoolException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class InvalidNproc(OrderedPoolException):
+    def __init__(self, nproc: int):
+        message = f"Number of processes must be a positive integer, but nproc={nproc}."
+        super().__init__(message)
+
+# Function installed in each worker process by _init_worker. Workers receive the
+# function once at startup rather than once per item, so large state captured by the
+# function (i.e. a variable windows table) is only pickled nproc times.
+_worker_fn: Callable | None = None
+
+def _init_worker(fn: Callable):
+    global _worker_fn
+    _worker_fn = fn
+
+def _call_worker(item: Any) -> Any:
+    return _worker_fn(item)
+
+@dc.dataclass
+class OrderedPool:
+    """Apply a function to streams of items in worker processes, yielding results in input order.
+
+    Results are yielded in the same order as the items so that a single consumer (i.e. the
+    process that owns an output HDF5 file) produces exactly the same output as a serial run.
+    At most max_pending items are in flight at once, which bounds memory when the consumer
+    or the item producer is slower than the workers.
+
+    Use as a context manager. Worker processes are started on entry and reused by every
+    call to map until exit. They are started with the 'spawn' method, as forking a process 
+    after polars has started its thread pool can deadlock the child.
+
+    Example:
+    ```
+    with OrderedPool(aggregator.aggregate, nproc = 8) as pool:
+        for result in pool.map(reader.observations()):
+            result.writev2()
+    ```
+    """
+    fn: Callable
+    nproc: int = 1
+    max_pending: int | None = None
+    executor: ProcessPoolExecutor | None = dc.field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.nproc is None or self.nproc < 1:
+            raise InvalidNproc(self.nproc)
+        if self.max_pending is None:
+            self.max_pending = 2*self.nproc
+
+    def __enter__(self) -> "OrderedPool":
+        if self.nproc > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers = self.nproc,
+                mp_context = multiprocessing.get_context("spawn"),
+                initializer = _init_worker,
+                initargs = (self.fn,)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures = True)
+            self.executor = None
+
+    def map(self, items: Iterable) -> Generator[Any, None, None]:
+        if self.executor is None:
+            for item in items:
+                yield self.fn(item)
+            return
+
+        pending: Deque[Future] = deque()
+        for item in items:
+            pending.append(self.executor.submit(_call_worker, item))
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,2 +1,5 @@
 from .uniform_windows_aggregator import UniformWindowsAggregator
 from .variable_windows_aggregator import VariableWindowsAggregator
+from .multi_windows_aggregator import MultiWindowsAggregator
+from .streaming_windows_aggregator import StreamingWindowsAggregator
+from .window_grid import WindowGrid, WindowGridException, InvalidChromSizes, read_chrom_sizes
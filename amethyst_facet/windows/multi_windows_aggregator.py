@@ -0,0 +1,123 @@
+import dataclasses as dc
+from typing import *
+
+from .windows_aggregator import WindowsAggregator
+from .uniform_windows_aggregator import UniformWindowsAggregator
+import amethyst_facet as fct
+
+class MultiWindowsAggregatorException(Exception):
+    def __init__(self, message: str):
+        message = f"Problem with multiple window schemes aggregation:\n{message}"
+        super().__init__(message)
+
+class DuplicateWindowNames(MultiWindowsAggregatorException):
+    def __init__(self, names: List[str]):
+        message = (
+            f"Window schemes must have unique dataset names, but found duplicates: {names}. "
+            f"Give each scheme a distinct name (i.e. -u name=500 or -v name=windows.tsv)."
+        )
+        super().__init__(message)
+
+class NotDerivable(MultiWindowsAggregatorException):
+    def __init__(self, windows: "fct.h5.Dataset", scheme: UniformWindowsAggregator | None, names: List[str]):
+        message = (
+            f"Cannot compute window schemes {names} from existing windows at {windows.display_path} "
+            f"(scheme: {scheme.properties if scheme else 'unknown'}). "
+            f"Only uniform schemes whose step is a multiple of the existing non-overlapping window size, "
+            f"with aligned offsets, can be derived from existing windows."
+        )
+        super().__init__(message)
+
+@dc.dataclass
+class MultiWindowsAggregator:
+    """Apply several window schemes to each observations dataset in a single pass.
+
+    Each observations dataset is converted and cleaned once, then every scheme is
+    computed from the same in-memory values before moving on to the next dataset.
+
+    Uniform schemes are computed as a pyramid: a scheme whose windows are exact sums of
+    another requested scheme's windows (see UniformWindowsAggregator.derives_from)
+    is computed from the coarsest such scheme rather than from the observations.
+    """
+    aggregators: List[WindowsAggregator] = dc.field(default_factory=list)
+    plan: List[Tuple[WindowsAggregator, str | None]] = dc.field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        names = [it.name for it in self.aggregators]
+        duplicates = sorted(set(name for name in names if names.count(name) > 1))
+        if duplicates:
+            raise DuplicateWindowNames(duplicates)
+        self.plan = self.pyramid()
+
+    def pyramid(self, base: UniformWindowsAggregator | None = None) -> List[Tuple[WindowsAggregator, str | None]]:
+        """Order aggregators so each one follows the scheme it is derived from.
+
+        Returns (aggregator, source name) pairs, with source None for aggregators computed
+        from observations. If base is given, it is treated as an already computed scheme
+        available as a source.
+        """
+        # Uniform schemes can only derive from schemes with a smaller size, so visiting
+        # them from finest to coarsest guarantees sources are computed first.
+        uniform = [it for it in self.aggregators if isinstance(it, UniformWindowsAggregator)]
+        uniform = sorted(uniform, key = lambda it: (it.size, it.step))
+        other = [it for it in self.aggregators if not isinstance(it, UniformWindowsAggregator)]
+
+        plan = [(it, None) for it in other]
+        computed = [base] if base is not None else []
+        for aggregator in uniform:
+            sources = [it for it in computed if aggregator.derives_from(it)]
+            source = max(sources, key = lambda it: it.size).name if sources else None
+            plan.append((aggregator, source))
+            computed.append(aggregator)
+        return plan
+
+    def aggregate(
+            self,
+            observations: fct.h5.Dataset
+        ) -> List[fct.h5.Dataset]:
+        if not self.aggregators:
+            return []
+        values = self.aggregators[0].clean_values(observations.pl())
+        results = {}
+        for aggregator, source in self.plan:
+            if source is None:
+                results[aggregator.name] = aggregator.aggregate_values(values, observations)
+            else:
+                results[aggregator.name] = aggregator.aggregate_windows(results[source])
+        return [results[it.name] for it in self.aggregators]
+
+    def windows_plan(
+            self,
+            windows: "fct.h5.Dataset | fct.h5.LazyDataset"
+        ) -> List[Tuple[WindowsAggregator, str]]:
+        """Plan computing every scheme from an existing windows dataset.
+
+        Uses only the name and size, step and offset attributes of windows, so a
+        fct.h5.LazyDataset can be planned without reading its data.
+
+        Raises:
+            NotDerivable: Some scheme cannot be computed from windows.
+        """
+        scheme = UniformWindowsAggregator.from_attrs(windows.attrs, windows.name)
+        plan = self.pyramid(scheme) if scheme is not None else [(it, None) for it in self.aggregators]
+        underived = [aggregator.name for aggregator, source in plan if source is None]
+        if underived:
+            raise NotDerivable(windows, scheme, underived)
+        return plan
+
+    def aggregate_windows(
+            self,
+            windows: fct.h5.Dataset
+        ) -> List[fct.h5.Dataset]:
+        """Compute every scheme from an existing windows dataset without reading observations
+
+        The scheme of the existing windows is read from its size, step and offset attributes.
+
+        Raises:
+            NotDerivable: Some scheme cannot be computed from windows.
+        """
+        plan = self.windows_plan(windows)
+        results = {windows.name: windows}
+        for aggregator, source in plan:
+            results[aggregator.name] = aggregator.aggregate_windows(results[source])
+        return [results[it.name] for it in self.aggregators]
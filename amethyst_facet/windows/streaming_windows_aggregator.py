@@ -0,0 +1,62 @@
+import dataclasses as dc
+from typing import *
+
+import polars as pl
+
+from .multi_windows_aggregator import MultiWindowsAggregator
+import amethyst_facet as fct
+
+Boundary = Tuple[str, int] | None
+
+@dc.dataclass
+class StreamingWindowsAggregator:
+    """Aggregate an observations dataset slice by slice with bounded memory.
+
+    Slices are consecutive row ranges of observations sorted by (chr, pos) (see fct.h5.DatasetSlices).
+    Each slice is aggregated independently with aggregate, which can run in a worker process.
+    Results are then passed in order to merge, which combines windows that straddle slice
+    boundaries and returns only windows that later slices cannot add to. Concatenating the
+    merged output over all slices gives the same rows, in the same (chr, start, end) order,
+    as aggregating the whole dataset at once.
+    """
+    aggregator: MultiWindowsAggregator
+    held: Dict[str, fct.h5.Dataset] = dc.field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def aggregate(
+            self,
+            item: Tuple[fct.h5.Dataset, Boundary]
+        ) -> Tuple[List[fct.h5.Dataset], Boundary]:
+        observations, boundary = item
+        return self.aggregator.aggregate(observations), boundary
+
+    def merge(
+            self,
+            item: Tuple[List[fct.h5.Dataset], Boundary]
+        ) -> List[fct.h5.Dataset]:
+        """Combine the next slice's results with held windows and return completed windows.
+
+        Windows on the boundary chromosome that start at or after the first start of any window
+        containing the boundary position are held for the next slice. Every window from later
+        slices starts at or after that point, so emitted windows stay sorted. The last slice
+        has boundary None and releases all held windows.
+        """
+        results, boundary = item
+        merged = []
+        for result in results:
+            values = result.pl().cast({"chr": pl.String})
+            if result.name in self.held:
+                held = self.held.pop(result.name).pl().cast({"chr": pl.String})
+                values = pl.concat([held, values])
+                values = values.group_by("chr", "start", "end").agg(pl.sum("c", "t", "c_nz", "t_nz"))
+                values = values.sort("chr", "start", "end")
+
+            if boundary is not None:
+                chrom, pos = boundary
+                aggregator = next(it for it in self.aggregator.aggregators if it.name == result.name)
+                open_start = aggregator.first_open_start(chrom, pos)
+                is_open = (pl.col.chr == chrom) & (pl.col.start >= open_start)
+                self.held[result.name] = dc.replace(result, data=values.filter(is_open))
+                values = values.filter(~is_open)
+
+            merged.append(dc.replace(result, data=values))
+        return merged
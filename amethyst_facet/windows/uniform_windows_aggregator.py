@@ -1,7 +1,10 @@
 import dataclasses as dc
+from typing import *
+
 from .windows_aggregator import WindowsAggregator
 import amethyst_facet as fct
 
+import numpy as np
 import polars as pl
 
 class UniformWindowsAggregatorException(Exception):
@@ -42,30 +45,138 @@ class UniformWindowsAggregator(WindowsAggregator):
         if self.name is None or not self.name.strip():
             self.name = f"{self.size}:{self.step}+{self.offset}"
 
-    def aggregate(
+    @property
+    def attrs(self) -> Dict[str, int]:
+        """Window parameters stored as HDF5 attributes on each result dataset"""
+        return {"size": self.size, "step": self.step, "offset": self.offset}
+
+    @staticmethod
+    def from_attrs(attrs: Dict[str, Any], name: str = None) -> "UniformWindowsAggregator | None":
+        """Recover the scheme used to compute an existing windows dataset, if recorded"""
+        if not all(key in attrs for key in ["size", "step", "offset"]):
+            return None
+        return UniformWindowsAggregator(int(attrs["size"]), int(attrs["step"]), int(attrs["offset"]), name)
+
+    def derives_from(self, finer: "UniformWindowsAggregator") -> bool:
+        """True if this scheme's windows are exact sums of finer's windows.
+
+        finer must be non-overlapping and its windows must tile this scheme's step-sized
+        bins, so each of its windows falls in exactly one bin.
+        """
+        return all([
+            finer.step == finer.size,
+            self.step % finer.size == 0,
+            (self.offset - finer.offset) % finer.size == 0,
+            finer.start_min is None and finer.end_min is None
+        ])
+
+    def first_open_start(self, chrom: str, pos: int) -> int:
+        """Smallest start of any window on chrom that contains a position >= pos"""
+        return self.offset + self.step*((pos - self.size - self.offset) // self.step + 1)
+
+    def bin_values(self, values: pl.DataFrame) -> pl.DataFrame:
+        """Sum observations into step-sized bins, sorted by chr then bin.
+
+        Bin b covers [b*step + offset, (b + 1)*step + offset), so every window is
+        exactly size/step consecutive bins.
+        """
+        values = values.with_columns(
+            c_nz = (pl.col.c > 0).cast(pl.Int64),
+            t_nz = (pl.col.t > 0).cast(pl.Int64)
+        )
+        return self._sum_bins(values, "pos")
+
+    def bin_windows(self, windows: pl.DataFrame) -> pl.DataFrame:
+        """Sum windows from a scheme this scheme derives_from into step-sized bins."""
+        return self._sum_bins(windows, "start")
+
+    def _sum_bins(self, values: pl.DataFrame, position: str) -> pl.DataFrame:
+        values = values.with_columns(bin = (pl.col(position) - self.offset) // self.step)
+        values = values.group_by("chr", "bin").agg(pl.sum("c", "t", "c_nz", "t_nz"))
+        values = values.sort("chr", "bin")
+        return values
+
+    def rolling_windows(self, bins: pl.DataFrame) -> pl.DataFrame:
+        """Sum size/step consecutive bins into windows using prefix sums.
+
+        Only windows containing at least one nonempty bin are produced. Memory is
+        proportional to the number of bins plus the number of output windows,
+        independent of how much the windows overlap.
+        """
+        schema = {
+            "chr": pl.String, "start": pl.Int64, "end": pl.Int64, 
+            "c": pl.Int64, "t": pl.Int64, "c_nz": pl.Int64, "t_nz": pl.Int64
+        }
+        if bins.is_empty():
+            return pl.DataFrame(schema=schema)
+        bins_per_window = self.size // self.step
+
+        # Place all chromosomes on a single sorted integer axis. Each chromosome gets 
+        # a block with bins_per_window of padding on either side, so runs of windows
+        # never cross from one chromosome into the next.
+        new_chrom = bins["chr"] != bins["chr"].shift(1)
+        codes = new_chrom.fill_null(True).cum_sum().to_numpy().astype(np.int64) - 1
+        chroms = bins["chr"].filter(new_chrom.fill_null(True))
+        bin = bins["bin"].to_numpy()
+        bin_min = bin.min()
+        span = int(bin.max() - bin_min) + 2*bins_per_window
+        keys = codes*span + (bin - bin_min + bins_per_window)
+
+        # Bin b contributes to the windows starting at bins b - bins_per_window + 1, ..., b.
+        # Merge these ranges across bins into runs and enumerate the windows in each run.
+        new_run = np.ones(len(keys), dtype=bool)
+        new_run[1:] = np.diff(keys) > bins_per_window
+        run_first = keys[new_run] - bins_per_window + 1
+        run_last = keys[np.append(np.flatnonzero(new_run)[1:] - 1, len(keys) - 1)]
+        run_lengths = run_last - run_first + 1
+        run_offsets = np.cumsum(run_lengths) - run_lengths
+        windows = np.arange(run_lengths.sum()) - np.repeat(run_offsets - run_first, run_lengths)
+
+        # Each window's sums are the difference of prefix sums over its bins.
+        lo = np.searchsorted(keys, windows, side="left")
+        hi = np.searchsorted(keys, windows + bins_per_window, side="left")
+        sums = {}
+        for name in ["c", "t", "c_nz", "t_nz"]:
+            prefix = np.concatenate([[0], np.cumsum(bins[name].to_numpy())])
+            sums[name] = prefix[hi] - prefix[lo]
+
+        window_codes = windows // span
+        start = (windows - window_codes*span + bin_min - bins_per_window)*self.step + self.offset
+        result = pl.DataFrame(
+            {
+                "chr": chroms.gather(window_codes),
+                "start": start,
+                "end": start + self.size,
+                **sums
+            },
+            schema = schema
+        )
+        return result
+
+    def aggregate_values(
             self,
+            values: pl.DataFrame,
             observations: fct.h5.Dataset
         ) -> fct.h5.Dataset:
-        # Create empty dataframe to avoid error when concatenating
-        windows_schema = {"chr": pl.String, "start": pl.Int64(), "end": pl.Int64, "c": pl.Int64, "t": pl.Int64}
-        values_strides = [pl.DataFrame(schema=windows_schema)]
-        values = self.clean_values(observations.pl())
-
-        # Accumulate uniform windows at offsets determined by step
-        for stride in range(0, self.size, self.step):
-            offset = self.offset + stride
-            windowed = values.with_columns(
-                start = (pl.col.pos - offset) // self.size * self.size + offset
-            )
-            windowed = windowed.with_columns(
-                end = pl.col.start + self.size
-            )
-            windowed = windowed.select("chr", "start", "end", "c", "t")
-            values_strides.append(windowed)
-        values = pl.concat(values_strides)
-
-        # Compute aggregations
-        values = self._group_agg_sort(values)
+        bins = self.bin_values(values)
+        return self._result(bins, observations)
+
+    def aggregate_windows(
+            self,
+            windows: fct.h5.Dataset
+        ) -> fct.h5.Dataset:
+        """Compute windows from the windows of a finer scheme that this scheme derives_from"""
+        values = windows.pl().select("chr", "start", "c", "t", "c_nz", "t_nz")
+        values = values.cast({"chr": pl.String, "start": pl.Int64, "c": pl.Int64, "t": pl.Int64, "c_nz": pl.Int64, "t_nz": pl.Int64})
+        bins = self.bin_windows(values)
+        return self._result(bins, windows)
+
+    def _result(
+            self,
+            bins: pl.DataFrame,
+            source: fct.h5.Dataset
+        ) -> fct.h5.Dataset:
+        values = self.rolling_windows(bins)
 
         # Remove negative values
         if self.start_min is not None and self.end_min is not None:
@@ -76,11 +187,12 @@ class UniformWindowsAggregator(WindowsAggregator):
             values = values.filter(pl.col.end >= self.end_min)
 
         result = fct.h5.Dataset(
-            observations.context,
-            observations.barcode,
+            source.context,
+            source.barcode,
             self.name,
             values,
-            observations.path
+            source.path,
+            attrs = self.attrs
         )
 
         return result
\ No newline at end of file
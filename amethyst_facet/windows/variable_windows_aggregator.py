@@ -4,6 +4,8 @@ from typing import *
 import warnings
 
 import duckdb
+import numpy as np
+from numpy.typing import NDArray
 import polars as pl
 
 from .windows_aggregator import WindowsAggregator
@@ -57,7 +59,7 @@ class VariableWindowsAggregator(WindowsAggregator):
     name: str
     path: str | Path = None
     windows: pl.DataFrame = None
-    
+    index: Dict[str, Tuple[NDArray, NDArray, NDArray]] = dc.field(default=None, init=False, repr=False, compare=False)
 
     def check_header(self):
         if not all(col in self.windows.columns for col in ["chr", "start", "end"]):
@@ -131,22 +133,74 @@ class VariableWindowsAggregator(WindowsAggregator):
         self.check_numeric()
         self.check_widths()
         self.check_duplicate()
-
-    def aggregate(
+        self.build_index()
+
+    def build_index(self):
+        """Index window starts, ends and running maximum of ends by chromosome, sorted by (start, end).
+
+        The index is built once and shared by every barcode and context aggregated
+        with this object (including across worker processes, which receive a copy
+        of the aggregator once at startup).
+        """
+        self.windows = self.windows.sort("chr", "start", "end")
+        self.index = {}
+        for (chrom,), windows in self.windows.partition_by("chr", as_dict=True, maintain_order=True).items():
+            starts, ends = windows["start"].to_numpy(), windows["end"].to_numpy()
+            self.index[chrom] = (starts, ends, np.maximum.accumulate(ends))
+
+    def first_open_start(self, chrom: str, pos: int) -> int | float:
+        """Smallest start of any window on chrom that contains a position >= pos, or inf if none"""
+        if chrom not in self.index:
+            return float("inf")
+        starts, _, max_ends = self.index[chrom]
+        first = np.searchsorted(max_ends, pos, side="right")
+        return int(starts[first]) if first < len(starts) else float("inf")
+
+    def aggregate_values(
             self,
+            values: pl.DataFrame,
             observations: fct.h5.Dataset
         ) -> fct.h5.Dataset:
-        values = self.clean_values(observations.pl())
         self.check_chroms(observations, values["chr"], self.windows["chr"])
-        values = self.windows.join_where(
-            values,
-            pl.col("chr") == pl.col("chr_right"),
-            pl.col("start") <= pl.col("pos"),
-            pl.col("end") > pl.col("pos")
+        values = values.with_columns(
+            c_nz = (pl.col.c > 0).cast(pl.Int64),
+            t_nz = (pl.col.t > 0).cast(pl.Int64)
         )
-        values = values.select("chr", "start", "end", "c", "t")
-        
-        values = self._group_agg_sort(values)
+        values = values.sort("chr", "pos")
+        chroms = values.partition_by("chr", as_dict=True, maintain_order=True)
+
+        # Sum over [start, end) is the difference of prefix sums at the first positions
+        # >= start and >= end, found by binary search. Overlapping windows need no 
+        # special handling, and windows are emitted in (chr, start, end) order.
+        schema = {
+            "chr": pl.String, "start": pl.Int64, "end": pl.Int64, 
+            "c": pl.Int64, "t": pl.Int64, "c_nz": pl.Int64, "t_nz": pl.Int64
+        }
+        results = [pl.DataFrame(schema=schema)]
+        for chrom, (starts, ends, _) in self.index.items():
+            if (chrom,) not in chroms:
+                continue
+            chrom_values = chroms[(chrom,)]
+            pos = chrom_values["pos"].to_numpy()
+            lo = np.searchsorted(pos, starts, side="left")
+            hi = np.searchsorted(pos, ends, side="left")
+            nonempty = hi > lo
+            lo, hi = lo[nonempty], hi[nonempty]
+            sums = {}
+            for name in ["c", "t", "c_nz", "t_nz"]:
+                prefix = np.concatenate([[0], np.cumsum(chrom_values[name].to_numpy())])
+                sums[name] = prefix[hi] - prefix[lo]
+            result = pl.DataFrame(
+                {
+                    "chr": [chrom]*len(lo),
+                    "start": starts[nonempty],
+                    "end": ends[nonempty],
+                    **sums
+                },
+                schema = schema
+            )
+            results.append(result)
+        values = pl.concat(results)
 
         result = fct.h5.Dataset(
             observations.context,
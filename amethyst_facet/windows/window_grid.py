@@ -0,0 +1,107 @@
+import dataclasses as dc
+from pathlib import Path
+from typing import *
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .uniform_windows_aggregator import UniformWindowsAggregator
+
+class WindowGridException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+class InvalidChromSizes(WindowGridException):
+    def __init__(self, path: str | Path, line: int, text: str):
+        message = (
+            f"Could not parse line {line} of chrom sizes file {path}: '{text}'. "
+            "Each line must be a chromosome name and its length in bp, separated by a tab or spaces."
+        )
+        super().__init__(message)
+
+def read_chrom_sizes(path: str | Path) -> Dict[str, int]:
+    """Read a UCSC-style chrom sizes file of chromosome names and lengths, in file order"""
+    sizes = {}
+    with open(path) as file:
+        for line, text in enumerate(file, 1):
+            if not text.strip() or text.startswith("#"):
+                continue
+            fields = text.split()
+            try:
+                sizes[fields[0]] = int(fields[1])
+            except (IndexError, ValueError) as e:
+                raise InvalidChromSizes(path, line, text.rstrip("\n")) from e
+    return sizes
+
+@dc.dataclass
+class WindowGrid:
+    """Every window of a uniform scheme across a genome, numbered in chromosome order.
+
+    A chromosome of length L holds the windows overlapping positions 0 to L, so window k of
+    the chromosome starts at first_starts[code] + k*step and has column chr_offsets[code] + k.
+    Column numbers are computed arithmetically from chr and start, without a lookup table.
+    """
+    size: int
+    step: int
+    offset: int
+    chrom_sizes: Dict[str, int]
+    chr_names: List[str] = dc.field(init=False)
+    first_starts: NDArray = dc.field(init=False, repr=False)
+    chr_offsets: NDArray = dc.field(init=False, repr=False)
+
+    def __post_init__(self):
+        scheme = UniformWindowsAggregator(self.size, self.step, self.offset)
+        self.chr_names = list(self.chrom_sizes)
+        lengths = np.array([self.chrom_sizes[it] for it in self.chr_names], dtype=np.int64)
+        self.first_starts = np.array([scheme.first_open_start(it, 0) for it in self.chr_names], dtype=np.int64)
+        last_starts = self.offset + self.step*((lengths - self.offset) // self.step)
+        counts = np.maximum((last_starts - self.first_starts) // self.step + 1, 0)
+        self.chr_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    @staticmethod
+    def from_aggregator(aggregator: UniformWindowsAggregator, chrom_sizes: Dict[str, int]) -> "WindowGrid":
+        return WindowGrid(aggregator.size, aggregator.step, aggregator.offset, chrom_sizes)
+
+    @property
+    def attrs(self) -> Dict[str, int]:
+        return {"size": self.size, "step": self.step, "offset": self.offset}
+
+    def __len__(self) -> int:
+        return int(self.chr_offsets[-1])
+
+    def columns(self, chrom: NDArray, start: NDArray) -> NDArray:
+        """Column of each window given its chr and start, or -1 if it is not on the grid"""
+        codes_by_name = {it.encode(): code for code, it in enumerate(self.chr_names)}
+        names, inverse = np.unique(np.asarray(chrom), return_inverse=True)
+        codes = np.array([codes_by_name.get(bytes(it), -1) for it in names], dtype=np.int64)[inverse]
+        known = codes >= 0
+        codes = np.where(known, codes, 0)
+        if not self.chr_names:
+            return np.full(len(codes), -1, dtype=np.int64)
+        k, remainder = np.divmod(np.asarray(start, dtype=np.int64) - self.first_starts[codes], self.step)
+        columns = self.chr_offsets[codes] + k
+        valid = known & (remainder == 0) & (k >= 0) & (columns < self.chr_offsets[codes + 1])
+        return np.where(valid, columns, -1)
+
+    def chromosome_columns(self, chrom: str, start: int = 0, end: int | None = None) -> slice:
+        """Columns of the windows on chrom overlapping [start, end)"""
+        if chrom not in self.chrom_sizes:
+            return slice(0, 0)
+        code = self.chr_names.index(chrom)
+        first, stop, first_start = int(self.chr_offsets[code]), int(self.chr_offsets[code + 1]), int(self.first_starts[code])
+        # Window k starts at first_start + k*step, and overlaps [start, end) if it starts
+        # before end and ends after start.
+        lo = first + max(0, (start - self.size - first_start) // self.step + 1)
+        hi = stop if end is None else first + max(0, -((first_start - end) // self.step))
+        return slice(min(lo, stop), min(max(hi, lo), stop))
+
+    def coordinates(self, columns: slice = slice(None)) -> NDArray:
+        """(chr, start, end) of the windows in columns"""
+        first, stop, _ = columns.indices(len(self))
+        column = np.arange(first, max(first, stop))
+        codes = np.searchsorted(self.chr_offsets, column, side="right") - 1
+        data = np.zeros(len(column), dtype=[("chr", "S10"), ("start", "<i8"), ("end", "<i8")])
+        data["chr"] = np.array([it.encode() for it in self.chr_names], dtype=object)[codes] if len(column) else []
+        data["start"] = self.first_starts[codes] + (column - self.chr_offsets[codes])*self.step
+        data["end"] = data["start"] + self.size
+        return data
@@ -10,6 +10,26 @@ class WindowsAggregator:
             self,
             observations: Dataset
         ) -> Dataset:
+        values = self.clean_values(observations.pl())
+        return self.aggregate_values(values, observations)
+
+    def aggregate_values(
+            self,
+            values: pl.DataFrame,
+            observations: Dataset
+        ) -> Dataset:
+        """Aggregate observations already passed through clean_values.
+
+        observations supplies the context, barcode and path of the result.
+        """
+        raise NotImplementedError("Use a UniformWindowAggregator or VariableWindowAggregator subclass")
+
+    def first_open_start(self, chrom: str, pos: int) -> int | float:
+        """Smallest start of any window on chrom that contains a position >= pos.
+
+        Used by streaming aggregation to decide which windows may still receive observations
+        from later slices of a dataset.
+        """
         raise NotImplementedError("Use a UniformWindowAggregator or VariableWindowAggregator subclass")
 
     def clean_values(
@@ -0,0 +1,81 @@
+"""Time and count the copies of Dataset conversions on the agg read -> aggregate -> write path.
+
+Reading is timed at each validation level.
+
+A materialization is a NumPy allocation the size of the dataset, counted from the peak memory
+tracemalloc records for a step. Run from the repository root:
+
+    python -m benchmarks.dataset_conversions --rows 5000000
+"""
+import argparse
+import dataclasses as dc
+import itertools
+from pathlib import Path
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import amethyst_facet as fct
+
+def observations(nrows: int, seed: int = 0) -> fct.h5.Dataset:
+    rng = np.random.default_rng(seed)
+    data = np.zeros(nrows, dtype=fct.h5.dataset.observations_dtype)
+    data["chr"] = np.where(np.arange(nrows) < nrows//2, b"chr1", b"chr2")
+    data["pos"] = np.arange(nrows)*2 % (nrows//2*2)
+    data["c"] = rng.integers(0, 3, nrows)
+    data["t"] = rng.integers(0, 30, nrows)
+    return fct.h5.Dataset("CG", "barcode", "1", data)
+
+def measure(step, nbytes: int | None = None):
+    """Run step, returning its result, its seconds, and if nbytes is given, its NumPy materializations of
+    nbytes, from a second run traced by tracemalloc so tracing does not slow the timed run"""
+    start = time.perf_counter()
+    result = step()
+    seconds = time.perf_counter() - start
+    if nbytes is None:
+        return result, seconds, None
+    tracemalloc.start()
+    step()
+    materializations = tracemalloc.get_traced_memory()[1]/nbytes
+    tracemalloc.stop()
+    return result, seconds, materializations
+
+def report(step: str, seconds: float, materializations: float | None = None):
+    copies = "" if materializations is None else f"{materializations:6.2f} materializations"
+    print(f"{step:<28}{seconds:8.3f}s  {copies}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Observations per dataset")
+    parser.add_argument("--size", type=int, default=100, help="Uniform window size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory)/"bench.h5"
+        observations(args.rows).writev2(path, compression=None, compression_opts=None)
+        aggregator = fct.windows.UniformWindowsAggregator(size=args.size, name=str(args.size))
+
+        nbytes = args.rows*np.dtype(fct.h5.dataset.observations_dtype).itemsize
+        for validation in fct.h5.VALIDATION_LEVELS:
+            reader = fct.h5.ReaderV2(paths=[path], validation=validation)
+            dataset, seconds, copies = measure(lambda: next(reader.observations()), nbytes)
+            report(f"read observations ({validation})", seconds, copies)
+        _, seconds, _ = measure(dataset.pl)
+        report("observations to polars", seconds)
+        _, seconds, _ = measure(lambda: aggregator.aggregate(dataset))
+        report("aggregate", seconds)
+
+        frame = aggregator.rolling_windows(aggregator.bin_values(aggregator.clean_values(dataset.pl())))
+        nbytes = len(frame)*np.dtype(fct.h5.dataset.windows_dtype).itemsize
+        windows, seconds, copies = measure(lambda: fct.h5.Dataset("CG", "barcode", str(args.size), frame), nbytes)
+        report("windows from polars", seconds, copies)
+        _, seconds, copies = measure(windows.pl, nbytes)
+        report("windows to polars", seconds, copies)
+        names = (f"{args.size}_{i}" for i in itertools.count())
+        with fct.h5.WriteSession(path, compression=None, compression_opts=None) as session:
+            _, seconds, copies = measure(lambda: session.write(dc.replace(windows, name=next(names))), nbytes)
+        report("write windows", seconds, copies)
+
+if __name__ == "__main__":
+    main()
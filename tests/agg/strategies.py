@@ -67,4 +67,17 @@ def dense_uniform_observations(draw):
         print("--------------------")
         raise
 
-    return state
\ No newline at end of file
+    return state
+
+@st.composite
+def sparse_observations(draw):
+    chroms = draw(st.lists(st.sampled_from(["chr1", "chr2", "chr10", "chrX"]), min_size=0, max_size=50))
+    positions = draw(st.lists(st.integers(min_value=-100, max_value=10000), min_size=len(chroms), max_size=len(chroms)))
+    c = draw(st.lists(st.integers(min_value=0, max_value=5), min_size=len(chroms), max_size=len(chroms)))
+    t = draw(st.lists(st.integers(min_value=0, max_value=5), min_size=len(chroms), max_size=len(chroms)))
+    observations = pl.DataFrame(
+        {"chr": chroms, "pos": positions, "c": c, "t": t},
+        schema={"chr": pl.String, "pos": pl.Int64, "c": pl.Int64, "t": pl.Int64}
+    )
+    observations = observations.unique(["chr", "pos"]).sort("chr", "pos")
+    return observations
@@ -244,4 +244,94 @@ def test_variable_windows_aggregator_e2e(cleanup_temp):
     for windows in windows:
         values = windows.pl()
         values = values.cast({"chr": pl.String})
-        assert values.equals(expected), f"{values} != {expected}"
\ No newline at end of file
+        assert values.equals(expected), f"{values} != {expected}"
+
+def test_agg_nproc_matches_serial_e2e(cleanup_temp):
+    temp = Path("tests/assets/temp")
+    observations = observations_data2()
+    contexts = ["CG", "CH"]
+    barcodes = ["barcode1", "barcode2", "barcode3", "barcode4"]
+    names = ["1"]
+    paths = [temp / "file1.h5"]
+
+    write_h5_observations(contexts=contexts, barcodes=barcodes, names=names, datas=[observations], paths=paths)
+
+    runner = CliRunner()
+    path_strings = [str(p) for p in paths]
+    outputs = []
+    for nproc in [1, 2]:
+        h5_out = temp / f"output_nproc{nproc}.h5"
+        result = runner.invoke(facet, ["agg", "-u", "2:1+1", "-u", "3", "-p", str(nproc), "--h5-out", str(h5_out), *path_strings])
+        if result.exception:
+            raise result.exception
+        outputs.append(h5_out.read_bytes())
+        windows = list(fct.h5.ReaderV2(paths=[h5_out]).windows())
+        assert len(windows) == 2*len(contexts)*len(barcodes)*len(names)
+
+    assert outputs[0] == outputs[1], "Output of facet agg -p 2 differs from serial output"
+
+def test_agg_from_windows_e2e(cleanup_temp):
+    temp = Path("tests/assets/temp")
+    contexts = ["CG", "CH"]
+    barcodes = ["barcode1", "barcode2"]
+    paths = [temp / "file1.h5"]
+    write_h5_observations(contexts=contexts, barcodes=barcodes, names=["1"], datas=[observations_data2()], paths=paths)
+
+    runner = CliRunner()
+    direct = str(temp / "direct.h5")
+    derived = str(temp / "derived.h5")
+    for args in [
+        ["-u", "2", str(paths[0])],
+        ["-u", "4", "-u", "8:2", "--h5-out", direct, str(paths[0])],
+        ["-u", "4", "-u", "8:2", "--from-windows", "2:2+1", "--h5-out", derived, str(paths[0])],
+    ]:
+        result = runner.invoke(facet, ["agg", *args])
+        if result.exception:
+            raise result.exception
+
+    expected = {it.h5path: it for it in fct.h5.ReaderV2(paths=[direct]).windows()}
+    windows = list(fct.h5.ReaderV2(paths=[derived]).windows())
+    assert len(windows) == len(expected) == 2*len(contexts)*len(barcodes)
+    for it in windows:
+        assert it == expected[it.h5path]
+        assert it.attrs == expected[it.h5path].attrs
+
+def test_agg_max_rows_in_memory_e2e(cleanup_temp):
+    temp = Path("tests/assets/temp")
+    contexts = ["CG", "CH"]
+    barcodes = ["barcode1", "barcode2"]
+    paths = [temp / "file1.h5"]
+    write_h5_observations(contexts=contexts, barcodes=barcodes, names=["1"], datas=[observations_data2()], paths=paths)
+
+    runner = CliRunner()
+    whole = str(temp / "whole.h5")
+    result = runner.invoke(facet, ["agg", "-u", "4:2", "-u", "2", "--h5-out", whole, str(paths[0])])
+    if result.exception:
+        raise result.exception
+    expected = {it.h5path: it for it in fct.h5.ReaderV2(paths=[whole]).windows()}
+
+    for nproc in ["1", "2"]:
+        streamed = str(temp / f"streamed_nproc{nproc}.h5")
+        result = runner.invoke(facet, ["agg", "-u", "4:2", "-u", "2", "--max-rows-in-memory", "5", "-p", nproc, "--h5-out", streamed, str(paths[0])])
+        if result.exception:
+            raise result.exception
+        windows = list(fct.h5.ReaderV2(paths=[streamed]).windows())
+        assert len(windows) == len(expected) == 2*len(contexts)*len(barcodes)
+        for it in windows:
+            assert it == expected[it.h5path]
+
+def test_agg_max_rows_in_memory_rerun_e2e(cleanup_temp):
+    temp = Path("tests/assets/temp")
+    paths = [temp / "file1.h5"]
+    write_h5_observations(contexts=["CG"], barcodes=["barcode1"], names=["1"], datas=[observations_data2()], paths=paths)
+
+    runner = CliRunner()
+    result = runner.invoke(facet, ["agg", "-u", "2", "--max-rows-in-memory", "3", str(paths[0])])
+    if result.exception:
+        raise result.exception
+    before = list(fct.h5.ReaderV2(paths=paths).windows())
+
+    # Rerunning must not append the same windows to the datasets of the first run.
+    result = runner.invoke(facet, ["agg", "-u", "2", "--max-rows-in-memory", "3", str(paths[0])])
+    assert isinstance(result.exception, ValueError) and "already exists" in str(result.exception)
+    assert list(fct.h5.ReaderV2(paths=paths).windows()) == before
@@ -0,0 +1,62 @@
+import pytest
+import polars as pl
+
+import amethyst_facet as fct
+
+def test_multi_windows_aggregator_matches_individual():
+    windows = pl.DataFrame({"chr": ["1", "2"], "start": [0, 6], "end": [5, 12]})
+    chr =       [ 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2,  2,  2,  2,  2]
+    positions = [-1, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13]
+    c =         [ 1, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3,   3,  4,  4]
+    t =         [ 1, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3,   3,  4,  4]
+    values = pl.DataFrame({"chr": chr, "pos": positions, "c": c, "t": t})
+    values = values.cast({"chr": pl.String})
+    observations = fct.h5.Dataset("CG", "barcode1", "1", values)
+
+    aggregators = [
+        fct.windows.VariableWindowsAggregator(name="test", windows=windows),
+        fct.windows.UniformWindowsAggregator(size=2, step=1, offset=1),
+        fct.windows.UniformWindowsAggregator(size=4),
+    ]
+    results = fct.windows.MultiWindowsAggregator(aggregators).aggregate(observations)
+    assert [it.name for it in results] == [it.name for it in aggregators]
+    for aggregator, result in zip(aggregators, results):
+        assert result == aggregator.aggregate(observations)
+
+def test_multi_windows_aggregator_pyramid():
+    chr =       [ 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2,  2,  2,  2,  2]
+    positions = [-1, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13]
+    c =         [ 1, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3,   3,  4,  4]
+    t =         [ 1, 0, 0, 1, 1, 0, 1, 2, 0, 2, 3, 3,   0,  4,  4]
+    values = pl.DataFrame({"chr": chr, "pos": positions, "c": c, "t": t})
+    values = values.cast({"chr": pl.String})
+    observations = fct.h5.Dataset("CG", "barcode1", "1", values)
+
+    aggregators = [
+        fct.windows.UniformWindowsAggregator(size=8, step=4, offset=1),
+        fct.windows.UniformWindowsAggregator(size=2, offset=1),
+        fct.windows.UniformWindowsAggregator(size=4, offset=3),
+        fct.windows.UniformWindowsAggregator(size=3, offset=1),
+        fct.windows.UniformWindowsAggregator(size=12, offset=1),
+    ]
+    multi = fct.windows.MultiWindowsAggregator(aggregators)
+    sources = {aggregator.name: source for aggregator, source in multi.plan}
+    assert sources == {
+        "2:2+1": None,
+        "3:3+1": None,
+        "4:4+3": "2:2+1",
+        "8:4+1": "2:2+1",
+        "12:12+1": "3:3+1",
+    }
+
+    results = multi.aggregate(observations)
+    for aggregator, result in zip(aggregators, results):
+        assert result == aggregator.aggregate(observations)
+
+    windows = fct.h5.Dataset("CG", "barcode1", "2:2+1", results[1].data, attrs = results[1].attrs)
+    coarse = fct.windows.MultiWindowsAggregator([aggregators[0], aggregators[4]])
+    for aggregator, result in zip(coarse.aggregators, coarse.aggregate_windows(windows)):
+        assert result == aggregator.aggregate(observations)
+
+    with pytest.raises(fct.windows.multi_windows_aggregator.NotDerivable):
+        fct.windows.MultiWindowsAggregator([aggregators[3]]).aggregate_windows(windows)
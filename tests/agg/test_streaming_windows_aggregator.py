@@ -0,0 +1,46 @@
+from hypothesis import given, settings, strategies as st
+import polars as pl
+
+import amethyst_facet as fct
+from .strategies import sparse_observations
+
+def slices(observations: pl.DataFrame, max_rows: int):
+    for start in range(0, max(len(observations), 1), max_rows):
+        data = observations[start:start + max_rows]
+        boundary = None
+        if start + max_rows < len(observations):
+            row = observations.row(start + max_rows, named=True)
+            boundary = (row["chr"], row["pos"])
+        yield fct.h5.Dataset("CG", "barcode1", "1", data), boundary
+
+@settings(deadline=None)
+@given(
+    observations=sparse_observations(),
+    max_rows=st.integers(min_value=1, max_value=20),
+    step=st.integers(min_value=1, max_value=500),
+    steps_per_window=st.integers(min_value=1, max_value=4)
+)
+def test_streaming_matches_whole(observations, max_rows, step, steps_per_window):
+    windows = pl.DataFrame({
+        "chr": ["chr1", "chr1", "chr1", "chr2", "chrX"],
+        "start": [0, 100, 5000, -50, 0],
+        "end": [10000, 300, 5100, 8000, 20]
+    })
+    aggregators = [
+        fct.windows.UniformWindowsAggregator(step*steps_per_window, step),
+        fct.windows.UniformWindowsAggregator(step*steps_per_window*2, step*steps_per_window, 0),
+        fct.windows.VariableWindowsAggregator(name="variable", windows=windows)
+    ]
+    aggregator = fct.windows.MultiWindowsAggregator(aggregators)
+    streaming = fct.windows.StreamingWindowsAggregator(aggregator)
+
+    merged = {it.name: [] for it in aggregators}
+    for item in slices(observations, max_rows):
+        for result in streaming.merge(streaming.aggregate(item)):
+            merged[result.name].append(result.pl())
+    assert not streaming.held
+
+    whole = aggregator.aggregate(fct.h5.Dataset("CG", "barcode1", "1", observations))
+    for expected in whole:
+        result = pl.concat(merged[expected.name])
+        assert result.equals(expected.pl()), f"{result} != {expected.pl()}"
@@ -1,4 +1,4 @@
-from hypothesis import given, strategies as st
+from hypothesis import given, settings, strategies as st
 import polars as pl
 
 import amethyst_facet as fct
@@ -20,6 +20,39 @@ def test_dense_uniform_observations(state):
     result = agg.aggregate(observations).pl()
     assert result.equals(state["expected"]), f"{result} != {state['expected']}"
 
+def shifted_copies_aggregate(observations: pl.DataFrame, size: int, step: int, offset: int) -> pl.DataFrame:
+    """Reference implementation concatenating one copy of the observations per stride"""
+    strides = []
+    for stride in range(0, size, step):
+        stride_offset = offset + stride
+        windowed = observations.with_columns(
+            start = (pl.col.pos - stride_offset) // size * size + stride_offset
+        )
+        windowed = windowed.with_columns(end = pl.col.start + size)
+        strides.append(windowed.select("chr", "start", "end", "c", "t"))
+    values = pl.concat(strides)
+    values = values.with_columns(
+        c_nz = (pl.col.c > 0).cast(pl.Int64),
+        t_nz = (pl.col.t > 0).cast(pl.Int64)
+    )
+    values = values.group_by("chr", "start", "end").agg(pl.sum("c", "t", "c_nz", "t_nz"))
+    return values.sort("chr", "start", "end")
+
+@settings(deadline=None)
+@given(
+    observations=sparse_observations(),
+    step=st.integers(min_value=1, max_value=50),
+    steps_per_window=st.integers(min_value=1, max_value=10),
+    offset=st.integers(min_value=-100, max_value=100)
+)
+def test_rolling_windows_match_shifted_copies(observations, step, steps_per_window, offset):
+    size = step*steps_per_window
+    agg = fct.windows.UniformWindowsAggregator(size, step, offset)
+    dataset = fct.h5.Dataset("CG", "barcode1", "1", observations)
+    result = agg.aggregate(dataset).pl().cast({"chr": pl.String})
+    expected = shifted_copies_aggregate(observations, size, step, offset)
+    assert result.equals(expected), f"{result} != {expected}"
+
 def test_uniform_windows_aggregator_basic():
 
     chr =       [ 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2,  2,  2,  2,  2]
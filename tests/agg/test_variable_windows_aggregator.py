@@ -1,6 +1,8 @@
+from hypothesis import given, settings, strategies as st
 import polars as pl
 
 import amethyst_facet as fct
+from .strategies import sparse_observations
 
 def test_variable_windows_aggregator_basic():
     chr =    ["1", "1", "2", "2"]
@@ -29,3 +31,46 @@ def test_variable_windows_aggregator_basic():
     })
     assert result.equals(expected), f"{result} != {expected}"
 
+def join_where_aggregate(observations: pl.DataFrame, windows: pl.DataFrame) -> pl.DataFrame:
+    """Reference implementation using a non-equi join of windows and observations"""
+    values = windows.join_where(
+        observations,
+        pl.col("chr") == pl.col("chr_right"),
+        pl.col("start") <= pl.col("pos"),
+        pl.col("end") > pl.col("pos")
+    )
+    values = values.with_columns(
+        c_nz = (pl.col.c > 0).cast(pl.Int64),
+        t_nz = (pl.col.t > 0).cast(pl.Int64)
+    )
+    values = values.group_by("chr", "start", "end").agg(pl.sum("c", "t", "c_nz", "t_nz"))
+    return values.sort("chr", "start", "end")
+
+@settings(deadline=None)
+@given(
+    observations=sparse_observations(),
+    windows=st.lists(
+        st.tuples(
+            st.sampled_from(["chr1", "chr2", "chr10", "chr3"]),
+            st.integers(min_value=-200, max_value=10000),
+            st.integers(min_value=1, max_value=3000)
+        ),
+        min_size=1,
+        max_size=30,
+        unique_by=lambda it: it[:2]
+    )
+)
+def test_overlapping_variable_windows_match_join(observations, windows):
+    windows = pl.DataFrame(
+        {
+            "chr": [it[0] for it in windows],
+            "start": [it[1] for it in windows],
+            "end": [it[1] + it[2] for it in windows]
+        },
+        schema={"chr": pl.String, "start": pl.Int64, "end": pl.Int64}
+    )
+    aggregator = fct.windows.VariableWindowsAggregator(name="test", windows=windows)
+    dataset = fct.h5.Dataset("CG", "barcode1", "1", observations)
+    result = aggregator.aggregate(dataset).pl().cast({"chr": pl.String})
+    expected = join_where_aggregate(observations, windows)
+    assert result.equals(expected), f"{result} != {expected}"
@@ -41,4 +41,18 @@ def test_cli_options_parser_invalid_compression_opts():
     compression = "gzip"
     compression_opts = "invalid"
     with pytest.raises(fct.cli.InvalidCompressionArgs):
-        parser.parse_h5py_compression(compression, compression_opts)
\ No newline at end of file
+        parser.parse_h5py_compression(compression, compression_opts)
+
+def test_cli_options_parser_compression_level():
+    parser = fct.cli.CLIOptionsParser()
+    compression, compression_opts = parser.parse_h5py_compression("gzip:4", "6")
+    assert compression == "gzip" and compression_opts == 4
+
+def test_cli_options_parser_plugin_compression():
+    parser = fct.cli.CLIOptionsParser()
+    if fct.h5.compression.hdf5plugin is None:
+        with pytest.raises(fct.h5.MissingCompressionPlugin):
+            parser.parse_h5py_compression("zstd:3", "6")
+    else:
+        compression, compression_opts = parser.parse_h5py_compression("zstd:3", "6")
+        assert compression == fct.h5.ZSTD_FILTER and compression_opts == (3,)
\ No newline at end of file
@@ -0,0 +1,160 @@
+from pathlib import Path
+import gzip
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import pytest
+import polars as pl
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+TEMP = Path("tests/assets/temp")
+PARSE = ["--parse", f"{TEMP}/{{barcode}}.{{context}}.cov", "--parse", f"{TEMP}/{{barcode}}.parquet"]
+
+def calls(nrows, seed):
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame({
+        "chr": rng.choice(["chr1", "chr2", "chr10"], nrows),
+        "pos": rng.integers(0, 1_000_000, nrows),
+        "methylated": rng.integers(0, 3, nrows),
+        "unmethylated": rng.integers(0, 30, nrows),
+        "context": rng.choice(["CG", "CH"], nrows)
+    }).unique(["chr", "pos", "context"])
+
+def write_sources(n = 6):
+    """ScaleMethyl .parquet files for even cells and CG .cov files for odd cells"""
+    sources = []
+    for i in range(n):
+        data = calls(500, i)
+        if i % 2 == 0:
+            path = TEMP/f"cell{i}.parquet"
+            data.write_parquet(path)
+        else:
+            path = TEMP/f"cell{i}.CG.cov"
+            data = data.filter(pl.col.context == "CG").with_columns(pct = 100*pl.col.methylated/(pl.col.methylated + pl.col.unmethylated).clip(1))
+            data.select("chr", "pos", "pct", "unmethylated", "methylated").write_csv(path, separator="\t", include_header=False)
+        sources.append(str(path))
+    return sources
+
+def written(path):
+    with h5py.File(path) as file:
+        catalog = fct.h5.read_catalog(file)
+        return [(h5path, file[h5path][:]) for h5path in catalog["context", "barcode", "name"].map_rows(lambda it: "/" + "/".join(it))["map"]]
+
+def test_calls2h5_nproc_matches_serial(cleanup_temp):
+    sources = write_sources()
+    runner = CliRunner()
+    outputs = []
+    for nproc in ["1", "3"]:
+        path = TEMP/f"cells{nproc}.h5"
+        result = runner.invoke(facet, ["calls2h5", "-p", nproc, *PARSE, str(path), *sources])
+        assert result.exit_code == 0, result.output
+        outputs.append(written(path))
+    assert len(outputs[0]) == 9
+    assert [h5path for h5path, _ in outputs[0]] == [h5path for h5path, _ in outputs[1]]
+    assert all(np.array_equal(serial, parallel) for (_, serial), (_, parallel) in zip(*outputs))
+    assert all(np.array_equal(data, np.sort(data, order=["chr", "pos"])) for _, data in outputs[1])
+
+def test_calls2h5_nproc_conflicts(cleanup_temp):
+    sources = write_sources(4)
+    path = TEMP/"cells.h5"
+    runner = CliRunner()
+    result = runner.invoke(facet, ["calls2h5", *PARSE, str(path), sources[0]])
+    assert result.exit_code == 0, result.output
+    before = dict(written(path))
+
+    result = runner.invoke(facet, ["calls2h5", "-p", "2", "--append", *PARSE, str(path), *sources])
+    assert isinstance(result.exception, ValueError) and "/CG/cell0/1" in str(result.exception)
+    assert len(written(path)) == 2
+
+    new = calls(10, 99).filter(pl.col.context == "CG")
+    new.write_parquet(sources[0])
+    result = runner.invoke(facet, [
+        "calls2h5", "-p", "2", "--append", "--source-target-dataset-name-conflict-handler", "SKIP", *PARSE, str(path), *sources
+    ])
+    assert result.exit_code == 0, result.output
+    after = dict(written(path))
+    assert len(after) == 6
+    assert all(np.array_equal(after[h5path], data) for h5path, data in before.items())
+
+def test_calls2h5_plan_reused(cleanup_temp):
+    from amethyst_facet.cli.commands.calls2h5 import (
+        AmethystH5Inserter, AmethystSourceCombiner, ConflictHandler, CovSource, ScaleMethylParquetSource, target_dataset_names
+    )
+    parquet, cov = write_sources(2)
+    inserter = AmethystH5Inserter(source_combiner = AmethystSourceCombiner(sources = [
+        ScaleMethylParquetSource(path = parquet, barcode = "cell0", name = "1"),
+        CovSource(path = cov, context = "CG", barcode = "cell1", name = "1")
+    ]))
+    path = TEMP/"cells.h5"
+    inserter.insert_from_sources(path, layout = "consolidated")
+    assert [sorted(it) for it in inserter.plan()] == [["/CG/cell0/1", "/CH/cell0/1"], ["/CG/cell1/1"]]
+    assert target_dataset_names(path) == {"/CG/cell0/1", "/CH/cell0/1", "/CG/cell1/1"}
+
+    # The cached plan skips both sources, so their now unreadable files are never opened.
+    for source in [parquet, cov]:
+        Path(source).write_text("not calls")
+    inserter.insert_from_sources(path, source_target_dataset_name_conflict_handler = ConflictHandler.SKIP)
+    with pytest.raises(ValueError, match = "/CG/cell0/1"):
+        inserter.insert_from_sources(path)
+
+def test_calls2h5_memory_budget(cleanup_temp):
+    data = calls(20_000, 7).filter(pl.col.context == "CG").with_columns(pct = pl.lit(50.0))
+    path = TEMP/"big.CG.cov"
+    data.select("chr", "pos", "pct", "unmethylated", "methylated").write_csv(path, separator="\t", include_header=False)
+    with open(path, "rb") as source, gzip.open(TEMP/"big.CG.cov.gz", "wb") as target:
+        target.write(source.read())
+
+    runner = CliRunner()
+    outputs = []
+    for source, budget in [(path, []), (path, ["--memory-budget-mb", "0.1"]), (TEMP/"big.CG.cov.gz", ["--memory-budget-mb", "0.1"])]:
+        h5 = TEMP/f"cells{len(outputs)}.h5"
+        parse = ["--parse", f"{TEMP}/{{barcode}}.{{context}}.cov", "--parse", f"{TEMP}/{{barcode}}.{{context}}.cov.gz"]
+        result = runner.invoke(facet, ["calls2h5", *budget, "--spill-dir", str(TEMP), *parse, str(h5), str(source)])
+        assert result.exit_code == 0, result.output
+        outputs.append(written(h5))
+    assert [h5path for h5path, _ in outputs[0]] == ["/CG/big/1"]
+    assert all(np.array_equal(outputs[0][0][1], output[0][1]) for output in outputs[1:])
+    assert list(TEMP.glob("facet_spill_*")) == []
+
+    result = runner.invoke(facet, ["calls2h5", "--memory-budget-mb", "0.1", "--layout", "columnar", *PARSE, str(TEMP/"cells.h5"), str(path)])
+    assert isinstance(result.exception, ValueError) and "'rows' layout" in str(result.exception)
+
+def test_calls2h5_plugin_compression(cleanup_temp):
+    pytest.importorskip("hdf5plugin")
+    sources = write_sources(2)
+    runner = CliRunner()
+    result = runner.invoke(facet, ["calls2h5", *PARSE, str(TEMP/"gzip.h5"), *sources])
+    assert result.exit_code == 0, result.output
+    expected = written(TEMP/"gzip.h5")
+    for codec, filter_id in [("zstd:3", fct.h5.ZSTD_FILTER), ("lz4", fct.h5.LZ4_FILTER), ("blosc", fct.h5.BLOSC_FILTER)]:
+        path = TEMP/f"{codec.replace(':', '')}.h5"
+        result = runner.invoke(facet, ["calls2h5", "--compression", codec, *PARSE, str(path), *sources])
+        assert result.exit_code == 0, result.output
+        with h5py.File(path) as file:
+            assert str(filter_id) in file["/CG/cell1/1"]._filters
+        assert all(np.array_equal(data, other) for (_, data), (_, other) in zip(written(path), expected))
+
+def test_calls2h5_overwrite_consolidated(cleanup_temp):
+    sources = write_sources(4)
+    path = TEMP/"cells.h5"
+    runner = CliRunner()
+    result = runner.invoke(facet, ["calls2h5", "--layout", "consolidated", *PARSE, str(path), *sources])
+    assert result.exit_code == 0, result.output
+    before = {it.h5path: it.data for it in fct.h5.ReaderV2(paths=[path]).observations()}
+
+    calls(10, 99).write_parquet(sources[0])
+    result = runner.invoke(facet, [
+        "calls2h5", "--append", "--layout", "consolidated", "--source-target-dataset-name-conflict-handler", "OVERWRITE",
+        *PARSE, str(path), sources[0]
+    ])
+    assert result.exit_code == 0, result.output
+    after = {it.h5path: it.data for it in fct.h5.ReaderV2(paths=[path]).observations()}
+    assert after.keys() == before.keys()
+    for h5path, data in after.items():
+        if "/cell0/" in h5path:
+            assert len(data) < 10 and not np.array_equal(data, before[h5path])
+        else:
+            assert np.array_equal(data, before[h5path])
@@ -0,0 +1,86 @@
+import dataclasses as dc
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import polars as pl
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def observations(context, barcode):
+    data = np.array(
+        [("1", 1, 0, 1), ("1", 5, 1, 1), ("2", 3, 2, 0)],
+        dtype=fct.h5.dataset.observations_dtype
+    )
+    return fct.h5.Dataset(context, barcode, "1", data)
+
+def write_cells(path):
+    for context in ["CG", "CH"]:
+        for barcode in ["barcode1", "barcode2"]:
+            dataset = observations(context, barcode)
+            dataset.writev2(path)
+            fct.windows.UniformWindowsAggregator(size=4, step=2, name="4").aggregate(dataset).writev2(path)
+
+def test_writev2_catalog(cleanup_temp):
+    path = Path("tests/assets/temp/catalog.h5")
+    write_cells(path)
+    with h5py.File(path) as file:
+        catalog = fct.h5.read_catalog(file)
+    assert catalog.height == 8
+    assert catalog.filter(pl.col.kind == "observations")["nrows"].to_list() == [3]*4
+    windows = catalog.filter(pl.col.kind == "windows")
+    assert windows.select("size", "step", "offset").unique().rows() == [(4, 2, 1)]
+    assert catalog["sorted"].all()
+
+def test_appendv2_catalog(cleanup_temp):
+    path = Path("tests/assets/temp/appended.h5")
+    dataset = observations("CG", "barcode1")
+    other = observations("CG", "barcode2")
+    for start in range(3):
+        dc.replace(dataset, data=dataset.data[start:start + 1]).appendv2(path)
+        dc.replace(other, data=other.data[start:start + 1]).appendv2(path)
+    dc.replace(dataset, data=dataset.data[:1]).appendv2(path)
+    with h5py.File(path) as file:
+        assert file[fct.h5.CATALOG_PATH].shape[0] == 2
+        catalog = fct.h5.read_catalog(file)
+    assert catalog.select("barcode", "nrows", "sorted").rows() == [("barcode1", 4, False), ("barcode2", 3, True)]
+
+def test_reader_uses_catalog(cleanup_temp):
+    path = Path("tests/assets/temp/catalog.h5")
+    write_cells(path)
+    reader = fct.h5.ReaderV2(paths=[path], only={"contexts": {"CG"}}, skip={"barcodes": {"barcode2"}})
+    cataloged = [it.h5path for it in reader.observations()] + [it.h5path for it in reader.windows()]
+    assert cataloged == ["/CG/barcode1/1", "/CG/barcode1/4"]
+
+    # Without a catalog, the reader traverses the file and selects the same datasets.
+    with h5py.File(path, "a") as file:
+        del file[fct.h5.CATALOG_PATH]
+    traversed = [it.h5path for it in reader.observations()] + [it.h5path for it in reader.windows()]
+    assert traversed == cataloged
+
+def test_delete_catalog_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/catalog.h5")
+    write_cells(path)
+    runner = CliRunner()
+    result = runner.invoke(facet, ["delete", "barcode", "barcode1", str(path)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(facet, ["delete", "dataset", "4", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        catalog = fct.h5.read_catalog(file)
+        assert "/CG/barcode1" not in file and "/CG/barcode2/4" not in file
+    assert catalog.select("context", "barcode", "name").rows() == [("CG", "barcode2", "1"), ("CH", "barcode2", "1")]
+
+def test_catalog_rebuild_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/catalog.h5")
+    write_cells(path)
+    with h5py.File(path, "a") as file:
+        expected = fct.h5.read_catalog(file)
+        del file[fct.h5.CATALOG_PATH]
+    runner = CliRunner()
+    result = runner.invoke(facet, ["catalog", "rebuild", "--max-rows-in-memory", "2", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert fct.h5.read_catalog(file).equals(expected)
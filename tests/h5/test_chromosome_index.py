@@ -0,0 +1,63 @@
+import dataclasses as dc
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def observations():
+    data = np.array(
+        [("1", 1, 0, 1), ("1", 5, 1, 1), ("2", 3, 2, 0), ("10", 2, 1, 0), ("10", 4, 0, 0), ("10", 9, 3, 1)],
+        dtype=fct.h5.dataset.observations_dtype
+    )
+    return fct.h5.Dataset("CG", "barcode1", "1", data)
+
+def test_writev2_chromosome_index(cleanup_temp):
+    path = Path("tests/assets/temp/indexed.h5")
+    dataset = observations()
+    dataset.writev2(path)
+    with h5py.File(path) as file:
+        h5_dataset = file[dataset.h5path]
+        assert fct.h5.read_chromosome_index(h5_dataset) == {"1": (0, 2), "2": (2, 3), "10": (3, 6)}
+        assert np.array_equal(fct.h5.read_chromosome(h5_dataset, "10"), dataset.data[3:6])
+        assert len(fct.h5.read_chromosome(h5_dataset, "missing")) == 0
+    assert dataset.chromosome_index == {"1": (0, 2), "2": (2, 3), "10": (3, 6)}
+
+def test_appendv2_chromosome_index(cleanup_temp):
+    path = Path("tests/assets/temp/appended.h5")
+    dataset = observations()
+    for start, end in [(0, 1), (1, 4), (4, 5), (5, 5), (5, 6)]:
+        dc.replace(dataset, data=dataset.data[start:end]).appendv2(path)
+    with h5py.File(path) as file:
+        assert fct.h5.read_chromosome_index(file[dataset.h5path]) == dataset.chromosome_index
+
+def test_unsorted_chromosomes_not_indexed(cleanup_temp):
+    path = Path("tests/assets/temp/unsorted.h5")
+    dataset = observations()
+    dataset.data = dataset.data[[0, 2, 1]]
+    dataset.writev2(path)
+    with h5py.File(path) as file:
+        h5_dataset = file[dataset.h5path]
+        assert fct.h5.read_chromosome_index(h5_dataset) is None
+        try:
+            fct.h5.read_chromosome(h5_dataset, "1")
+            assert False
+        except fct.h5.MissingChromosomeIndex:
+            pass
+
+def test_index_backfill_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/backfill.h5")
+    dataset = observations()
+    dataset.writev2(path)
+    with h5py.File(path, "a") as file:
+        for key in [fct.h5.CHROMOSOME_INDEX_NAMES, fct.h5.CHROMOSOME_INDEX_OFFSETS]:
+            del file[dataset.h5path].attrs[key]
+
+    runner = CliRunner()
+    result = runner.invoke(facet, ["index", "--max-rows-in-memory", "2", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert fct.h5.read_chromosome_index(file[dataset.h5path]) == dataset.chromosome_index
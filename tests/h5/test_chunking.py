@@ -0,0 +1,76 @@
+import dataclasses as dc
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import pytest
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def test_chunk_rows_policy():
+    dtype = np.dtype(fct.h5.dataset.observations_dtype)
+    full = fct.h5.CHUNK_BYTES // dtype.itemsize
+    assert fct.h5.chunk_rows(10, dtype) == 10
+    assert fct.h5.chunk_rows(0, dtype) == 1
+    assert fct.h5.chunk_rows(10*full, dtype) == full
+    assert fct.h5.chunk_rows(None, dtype) == full
+    assert fct.h5.chunk_rows(10*full, dtype, 1000) == 1000
+    assert fct.h5.chunk_rows(10, dtype, 1000) == 10
+    with pytest.raises(fct.h5.InvalidChunkRows):
+        fct.h5.chunk_rows(10, dtype, 0)
+
+def test_write_chunks(cleanup_temp):
+    path = Path("tests/assets/temp/chunks.h5")
+    random_observations(100).writev2(path)
+    dc.replace(random_observations(100), name="2").writev2(path, chunk_rows=30)
+    dc.replace(random_observations(40), name="3").appendv2(path, chunk_rows=30)
+    with h5py.File(path) as file:
+        assert file["/CG/barcode1/1"].chunks == (100,)
+        assert file["/CG/barcode1/2"].chunks == (30,)
+        assert file["/CG/barcode1/3"].chunks == (30,)
+        assert file["/CG/barcode1/3"].maxshape == (None,)
+
+def test_chunk_cache():
+    default = dict(fct.h5.chunk_cache)
+    try:
+        fct.h5.set_chunk_cache(64)
+        assert fct.h5.chunk_cache["rdcc_nbytes"] == 64*2**20
+        fct.h5.set_chunk_cache(None)
+        assert fct.h5.chunk_cache["rdcc_nbytes"] == 64*2**20
+        with pytest.raises(fct.h5.InvalidChunkCache):
+            fct.h5.set_chunk_cache(-1)
+    finally:
+        fct.h5.chunk_cache.update(default)
+
+def test_agg_chunk_rows_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/chunks.h5")
+    out = Path("tests/assets/temp/chunks_out.h5")
+    random_observations(100).writev2(path)
+    default = dict(fct.h5.chunk_cache)
+    try:
+        result = CliRunner().invoke(
+            facet,
+            ["agg", "-u", "test=10", "--chunk-rows", "4", "--chunk-cache-mb", "8", "-o", str(out), str(path)]
+        )
+        assert result.exit_code == 0, result.output
+    finally:
+        fct.h5.chunk_cache.update(default)
+    with h5py.File(out) as file:
+        assert file["/CG/barcode1/test"].chunks == (4,)
+
+def test_recompress_chunk_cache_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/chunks.h5")
+    random_observations(100).writev2(path)
+    default = dict(fct.h5.chunk_cache)
+    try:
+        result = CliRunner().invoke(facet, ["recompress", "--chunk-rows", "8", "--chunk-cache-mb", "8", str(path)])
+        assert result.exit_code == 0, result.output
+        for command in [["index"], ["catalog", "rebuild"]]:
+            result = CliRunner().invoke(facet, [*command, "--chunk-cache-mb", "8", str(path)])
+            assert result.exit_code == 0, result.output
+    finally:
+        fct.h5.chunk_cache.update(default)
+    with h5py.File(path) as file:
+        assert file["/CG/barcode1/1"].chunks == (8,)
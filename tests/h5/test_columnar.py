@@ -0,0 +1,86 @@
+import dataclasses as dc
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def observations(nrows, seed=0):
+    return random_observations(nrows, seed, chrom_sizes={"chr1": 2_000_000, "chr2": 1_000_000}, counts=(3, 300))
+
+def test_columnar_roundtrip(cleanup_temp):
+    path = Path("tests/assets/temp/columnar.h5")
+    dataset = observations(10_000)
+    unsorted = dc.replace(dataset, name="unsorted", data=dataset.data[::-1].copy())
+    dataset.writev2(path, layout="columnar")
+    unsorted.writev2(path, layout="columnar")
+    with h5py.File(path) as file:
+        group = file["/CG/barcode1/1"]
+        assert fct.h5.is_columnar(group)
+        assert group["pos"].dtype == np.uint16 and group["c"].dtype == np.uint8
+        columnar = fct.h5.as_dataset(group)
+        data = dataset.data
+        assert columnar.dtype == data.dtype and columnar.shape == data.shape
+        assert np.array_equal(columnar[:], data)
+        for start in [0, 1, 4095, 4096, 6666, 6667, 9999]:
+            assert np.array_equal(columnar[start:start + 5000], data[start:start + 5000])
+            assert columnar[start] == data[start]
+        assert columnar[-1] == data[-1]
+        assert np.array_equal(columnar.fields("pos")[100:200], data["pos"][100:200])
+        assert np.array_equal(columnar.fields(["chr", "t"])[5:9], data[["chr", "t"]][5:9])
+        assert np.array_equal(fct.h5.as_dataset(file["/CG/barcode1/unsorted"])[:], unsorted.data)
+
+def test_columnar_reader(cleanup_temp):
+    path = Path("tests/assets/temp/columnar.h5")
+    dataset = observations(10_000)
+    dataset.writev2(path, layout="columnar")
+    dc.replace(dataset, barcode="barcode2").writev2(path)
+    reader = fct.h5.ReaderV2(paths=[path])
+    columnar, rows = sorted(reader.observations(), key=lambda it: it.barcode)
+    assert np.array_equal(columnar.data, rows.data) and columnar.attrs == rows.attrs
+    columnar, rows = sorted(reader.query("chr2:1000-50000"), key=lambda it: it.barcode)
+    assert len(columnar.data) and np.array_equal(columnar.data, rows.data)
+    lazy = next(it for it in reader.observations(lazy=True) if it.barcode == "barcode1")
+    assert np.array_equal(lazy.read(["pos"], slice(10, 20)), dataset.data[["pos"]][10:20])
+    for slices in reader.observation_slices(3000):
+        assert np.array_equal(np.concatenate([it.data for it, _ in slices]), dataset.data)
+    with h5py.File(path) as file:
+        assert fct.h5.read_catalog(file)["sorted"].all()
+
+def test_columnar_append(cleanup_temp):
+    path = Path("tests/assets/temp/columnar.h5")
+    dataset = observations(100)
+    dc.replace(dataset, data=dataset.data[:60], attrs={"note": "x"}).appendv2(path, layout="columnar")
+    dc.replace(dataset, data=dataset.data[60:]).appendv2(path)
+    with h5py.File(path) as file:
+        group = file["/CG/barcode1/1"]
+        assert fct.h5.is_columnar(group) and group.attrs["note"] == "x"
+        assert np.array_equal(fct.h5.as_dataset(group)[:], dataset.data)
+        assert fct.h5.read_catalog(file)["nrows"].to_list() == [100]
+
+def test_recompress_layout_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    dataset = observations(1000)
+    dataset.writev2(path)
+    fct.windows.UniformWindowsAggregator(size=1000, step=1000, name="1000").aggregate(dataset).writev2(path)
+    runner = CliRunner()
+    result = runner.invoke(facet, ["recompress", "--layout", "columnar", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert fct.h5.is_columnar(file["/CG/barcode1/1"])
+        assert isinstance(file["/CG/barcode1/1000"], h5py.Dataset)
+
+    out = Path("tests/assets/temp/windows.h5")
+    result = runner.invoke(facet, ["agg", "-u", "test=100", "-o", str(out), str(path)])
+    assert result.exit_code == 0, result.output
+    expected = fct.windows.UniformWindowsAggregator(size=100, step=100, name="test").aggregate(dataset)
+    assert np.array_equal(next(fct.h5.ReaderV2(paths=[out]).windows()).data, expected.data)
+
+    result = runner.invoke(facet, ["recompress", "--layout", "rows", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert np.array_equal(file["/CG/barcode1/1"][:], dataset.data)
+        assert "layout" not in file["/CG/barcode1/1"].attrs
@@ -0,0 +1,61 @@
+import dataclasses as dc
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def windows(nrows, start=0, c=1):
+    data = np.zeros(nrows, dtype=fct.h5.dataset.windows_dtype)
+    data["chr"] = b"chr1"
+    data["start"] = start + np.arange(nrows)*100
+    data["end"] = data["start"] + 100
+    data["c"] = c
+    data["t"] = np.arange(nrows) % 7
+    return fct.h5.Dataset("CG", "barcode1", "100", data)
+
+def test_compact_write(cleanup_temp):
+    path = Path("tests/assets/temp/compact.h5")
+    dataset = windows(100)
+    dataset.writev2(path, compact_dtypes=True)
+    with h5py.File(path) as file:
+        stored = file["/CG/barcode1/100"]
+        assert stored.dtype["start"] == np.uint16 and stored.dtype["c"] == np.uint8
+        assert list(stored.attrs["compact_dtypes"]) == ["start", "end", "c", "t", "c_nz", "t_nz"]
+        assert fct.h5.read_catalog(file)["dtype"][0] == str(stored.dtype)
+    read = next(fct.h5.ReaderV2(paths=[path]).windows())
+    assert read.data.dtype == fct.h5.dataset.windows_dtype and np.array_equal(read.data, dataset.data)
+    assert "compact_dtypes" not in read.attrs
+
+def test_compact_append_widens(cleanup_temp):
+    path = Path("tests/assets/temp/compact.h5")
+    first, second = windows(10), windows(10, start=1000, c=100_000)
+    dc.replace(first, attrs={"note": "x"}).appendv2(path, compact_dtypes=True)
+    second.appendv2(path)
+    with h5py.File(path) as file:
+        stored = file["/CG/barcode1/100"]
+        assert stored.dtype["c"] == np.uint32 and stored.attrs["note"] == "x"
+        assert fct.h5.read_catalog(file)["nrows"].to_list()[-1] == 20
+    read = next(fct.h5.ReaderV2(paths=[path]).windows())
+    assert np.array_equal(read.data, np.concatenate([first.data, second.data]))
+
+def test_compact_recompress_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/compact.h5")
+    dataset = windows(1000)
+    dataset.writev2(path)
+    runner = CliRunner()
+    result = runner.invoke(facet, ["recompress", "--compact-dtypes", "--max-rows-in-memory", "300", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert file["/CG/barcode1/100"].dtype["end"] == np.uint32
+        assert fct.h5.read_catalog(file)["dtype"].to_list()[-1] == str(file["/CG/barcode1/100"].dtype)
+    assert np.array_equal(next(fct.h5.ReaderV2(paths=[path]).windows()).data, dataset.data)
+
+    result = runner.invoke(facet, ["recompress", "--full-dtypes", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert file["/CG/barcode1/100"].dtype == fct.h5.dataset.windows_dtype
+        assert "compact_dtypes" not in file["/CG/barcode1/100"].attrs
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import pytest
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def write_cells(path, compression="gzip", compression_opts=6):
+    data = np.zeros(100, dtype=fct.h5.dataset.observations_dtype)
+    data["chr"] = "1"
+    data["pos"] = np.arange(100)
+    data["c"] = np.arange(100) % 3
+    with fct.h5.WriteSession(path, compression, compression_opts) as session:
+        for barcode in ["barcode1", "barcode2"]:
+            dataset = fct.h5.Dataset("CG", barcode, "1", data)
+            session.write(dataset)
+            session.write(fct.windows.UniformWindowsAggregator(size=10, step=10, name="10").aggregate(dataset))
+    return data
+
+def test_shuffled_write(cleanup_temp):
+    path = Path("tests/assets/temp/lzf.h5")
+    data = write_cells(path, "lzf")
+    with h5py.File(path) as file:
+        dataset = file["/CG/barcode1/1"]
+        assert dataset.compression == "lzf" and dataset.shuffle
+        assert np.array_equal(dataset[:], data)
+
+def test_zstd_roundtrip(cleanup_temp):
+    pytest.importorskip("hdf5plugin")
+    path = Path("tests/assets/temp/zstd.h5")
+    data = write_cells(path, *fct.h5.parse_compression("zstd:3", None))
+    reader = fct.h5.ReaderV2(paths=[path])
+    assert all(np.array_equal(it.data, data) for it in reader.observations())
+
+def test_recompress_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    out_dir = Path("tests/assets/temp/recompressed")
+    write_cells(path)
+    with h5py.File(path) as file:
+        expected = {it: (file[it][:], dict(file[it].attrs)) for it in ["/CG/barcode1/1", "/CG/barcode2/10"]}
+        catalog = fct.h5.read_catalog(file)
+
+    runner = CliRunner()
+    result = runner.invoke(facet, ["recompress", "--compression", "lzf", "--chunk-rows", "16", "-o", str(out_dir), str(path)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(facet, ["recompress", "--compression", "gzip:1", "-p", "2", str(path)])
+    assert result.exit_code == 0, result.output
+
+    for recompressed, compression in [(out_dir / path.name, "lzf"), (path, "gzip")]:
+        with h5py.File(recompressed) as file:
+            for h5path, (data, attrs) in expected.items():
+                assert file[h5path].compression == compression
+                assert np.array_equal(file[h5path][:], data)
+                assert {k: str(v) for k, v in file[h5path].attrs.items()} == {k: str(v) for k, v in attrs.items()}
+            assert fct.h5.read_catalog(file).equals(catalog)
+            assert file["/metadata/version"][()].decode() == fct.h5.version
+    with h5py.File(out_dir / path.name) as file:
+        assert file["/CG/barcode1/1"].chunks == (16,)
+    assert not list(path.parent.glob("*.recompress"))
+
+def test_cli_compression_defaults():
+    pytest.importorskip("hdf5plugin")
+    from amethyst_facet.cli.parse.cli_options_parser import CLIOptionsParser, InvalidCompressionArgs
+    parser = CLIOptionsParser()
+    assert parser.parse_h5py_compression("gzip", None) == ("gzip", 6)
+    assert parser.parse_h5py_compression("gzip", "9") == ("gzip", 9)
+    # Plugin codecs use their own default level unless one is given.
+    for codec in ["zstd", "blosc"]:
+        assert parser.parse_h5py_compression(codec, None) == fct.h5.parse_compression(codec, None)
+        assert parser.parse_h5py_compression(codec, "6") == fct.h5.parse_compression(f"{codec}:6", None)
+    with pytest.raises(InvalidCompressionArgs):
+        parser.parse_h5py_compression("blosc-zstd:22", None)
+    with pytest.raises(fct.h5.InvalidCompressionLevel):
+        parser.parse_h5py_compression("zstd:high", None)
@@ -0,0 +1,108 @@
+import dataclasses as dc
+import os
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+from .test_columnar import observations
+
+def barcodes(n, nrows=1000):
+    return [dc.replace(observations(nrows, seed=i), barcode=f"barcode{i}") for i in range(n)]
+
+def test_consolidated_reader(cleanup_temp):
+    path = Path("tests/assets/temp/consolidated.h5")
+    datasets = barcodes(3)
+    with fct.h5.WriteSession(path, layout="consolidated", chunk_rows=500) as session:
+        for it in datasets:
+            session.write(it)
+    with h5py.File(path) as file:
+        assert "/CG" not in file
+        store = fct.h5.ConsolidatedStore.open(file, "CG", "1")
+        assert store.barcodes == ["barcode0", "barcode1", "barcode2"]
+        assert file[store.path]["offsets"][:].tolist() == [0, 1000, 2000, 3000]
+        assert file[store.path]["chr"].dtype == fct.h5.chr_code_dtype
+        block = store.dataset("barcode1")
+        assert block.name == "/CG/barcode1/1" and block.dtype == datasets[1].data.dtype
+        assert np.array_equal(block[:], datasets[1].data)
+        assert np.array_equal(block.fields("pos")[10:20], datasets[1].data["pos"][10:20])
+        assert block[-1] == datasets[1].data[-1]
+        assert len(fct.h5.read_catalog(file)) == 0
+
+    reader = fct.h5.ReaderV2(paths=[path], only={"barcodes": {"barcode0", "barcode2"}})
+    read = list(reader.observations())
+    assert [it.barcode for it in read] == ["barcode0", "barcode2"]
+    assert all(np.array_equal(it.data, datasets[int(it.barcode[-1])].data) for it in read)
+    lazy = next(reader.observations(lazy=True))
+    assert np.array_equal(lazy.read(["pos"], slice(10, 20)), datasets[0].data[["pos"]][10:20])
+    for slices in reader.observation_slices(300):
+        expected = datasets[int(slices.barcode[-1])].data
+        assert np.array_equal(np.concatenate([it.data for it, _ in slices]), expected)
+    queried = next(reader.query("chr2:1000-50000"))
+    data = datasets[0].data
+    assert np.array_equal(queried.data, data[(data["chr"] == b"chr2") & (data["pos"] >= 1000) & (data["pos"] < 50000)])
+
+def test_consolidated_rewritten_file(cleanup_temp):
+    path = Path("tests/assets/temp/consolidated.h5")
+    for nrows in [1000, 100]:
+        # The file is replaced by one with the same barcodes but fewer rows, which must not reuse the cached offsets.
+        written = path.with_name(f"written{nrows}.h5")
+        datasets = barcodes(3, nrows)
+        with fct.h5.WriteSession(written, layout="consolidated") as session:
+            for it in datasets:
+                session.write(it)
+        os.replace(written, path)
+        read = list(fct.h5.ReaderV2(paths=[path]).observations())
+        assert all(np.array_equal(it.data, datasets[int(it.barcode[-1])].data) for it in read)
+
+def test_consolidate_recompress_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    datasets = barcodes(3)
+    for it in datasets:
+        it.writev2(path)
+    runner = CliRunner()
+    result = runner.invoke(facet, ["recompress", "--layout", "consolidated", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert "/CG" not in file and len(fct.h5.read_catalog(file)) == 0
+        assert fct.h5.ConsolidatedStore.open(file, "CG", "1").barcodes == ["barcode0", "barcode1", "barcode2"]
+
+    result = runner.invoke(facet, ["agg", "-u", "test=1000", str(path)])
+    assert result.exit_code == 0, result.output
+    aggregator = fct.windows.UniformWindowsAggregator(size=1000, step=1000, name="test")
+    for windows in fct.h5.ReaderV2(paths=[path]).windows():
+        assert np.array_equal(windows.data, aggregator.aggregate(datasets[int(windows.barcode[-1])]).data)
+
+    result = runner.invoke(facet, ["recompress", "--layout", "rows", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert fct.h5.OBSERVATIONS_PATH not in file
+        for it in datasets:
+            assert np.array_equal(file[it.h5path][:], it.data)
+        catalog = fct.h5.read_catalog(file)
+        assert catalog.filter(catalog["kind"] == "observations")["barcode"].to_list() == ["barcode0", "barcode1", "barcode2"]
+
+def test_consolidated_calls2h5_delete(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    datasets = barcodes(3, 100)
+    sources = []
+    for it in datasets:
+        source = Path(f"tests/assets/temp/{it.barcode}.CG.cov")
+        data = it.data
+        pct = 100*data["c"]/np.maximum(data["c"] + data["t"], 1)
+        np.savetxt(source, np.column_stack([data["chr"].astype(str), data["pos"], pct, data["t"], data["c"]]), fmt="%s", delimiter="\t")
+        sources.append(str(source))
+    runner = CliRunner()
+    result = runner.invoke(facet, ["calls2h5", "--layout", "consolidated", "--parse", "tests/assets/temp/{barcode}.{context}.cov", str(path), *sources])
+    assert result.exit_code == 0, result.output
+    reader = fct.h5.ReaderV2(paths=[path])
+    assert sorted(it.barcode for it in reader.observations()) == ["barcode0", "barcode1", "barcode2"]
+
+    result = runner.invoke(facet, ["delete", "barcode", "barcode1", str(path)])
+    assert result.exit_code == 0, result.output
+    read = {it.barcode: it for it in reader.observations()}
+    assert list(read) == ["barcode0", "barcode2"]
+    assert np.array_equal(read["barcode2"].data["pos"], datasets[2].data["pos"])
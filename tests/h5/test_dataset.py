@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import amethyst_facet as fct
+from ..util import *
+from .test_columnar import observations
+
+def test_dataset_from_frame():
+    expected = observations(1000)
+    c = expected.data["c"].astype(np.float64)
+    c[7] = np.nan
+    frame = pl.from_numpy(expected.data).with_columns(pl.col.chr.cast(pl.String), c=c)
+    expected.data["c"][7] = 0
+    dataset = fct.h5.Dataset("CG", "barcode1", "1", frame)
+    assert dataset.data.dtype == np.dtype(fct.h5.dataset.observations_v2_dtype)
+    assert np.array_equal(dataset.data, expected.data)
+    assert dataset.pl() is dataset.pl()
+    assert dataset.pl().equals(expected.pl())
+    assert dataset.datav2 is dataset.data
+
+    dataset.data = dataset.data[::-1]
+    assert dataset.pl().equals(expected.pl().reverse())
+
+def test_dataset_read_zero_copy(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    expected = observations(1000)
+    expected.writev2(path)
+    dataset = next(fct.h5.ReaderV2(paths=[path]).observations())
+    with fct.h5.open(path, "r") as file:
+        read = file[dataset.h5path][:]
+    data = read.copy()
+    assert dataset.data.dtype == read.dtype
+    assert fct.h5.Dataset("CG", "barcode1", "1", read).data is read
+    assert fct.h5.Dataset("CG", "barcode1", "1", read).datav2 is read
+    assert np.array_equal(read, data)
+
+def test_dataset_validation(cleanup_temp):
+    expected = observations(1000)
+    dtype = [(name, "<f8" if name == "c" else dtype) for name, dtype in fct.h5.dataset.observations_dtype]
+    data = expected.data.astype(dtype)
+    data["c"][7] = np.nan
+    expected.data["c"][7] = 0
+    for validation in ["full", "fast"]:
+        dataset = fct.h5.Dataset("CG", "barcode1", "1", data.copy(), validation=validation)
+        assert np.array_equal(dataset.data, expected.data)
+    read = expected.data.copy()
+    assert fct.h5.Dataset("CG", "barcode1", "1", read, validation="fast").data is read
+    with pytest.raises(fct.h5.InvalidValidationLevel):
+        fct.h5.Dataset("CG", "barcode1", "1", read, validation="none")
+
+    path = Path("tests/assets/temp/cells.h5")
+    expected.writev2(path)
+    reader = fct.h5.ReaderV2(paths=[path], validation="trust")
+    assert next(reader.observations()).validation == "trust"
+    assert next(reader.observations(lazy=True)).load().validation == "trust"
+    slices = reader.observation_slices(100)
+    assert next(iter(next(slices)))[0].validation == "trust"
+    with pytest.raises(fct.h5.InvalidValidationLevel):
+        fct.h5.ReaderV2(paths=[path], validation="none")
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import pytest
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+CHROM_SIZES = {"chr1": 20_000, "chr2": 5_500}
+
+def test_window_grid():
+    scheme = fct.windows.UniformWindowsAggregator(size=1000, step=500, offset=1)
+    grid = fct.windows.WindowGrid.from_aggregator(scheme, CHROM_SIZES)
+    coordinates = grid.coordinates()
+    assert len(grid) == len(coordinates) == 42 + 13
+    assert np.array_equal(grid.columns(coordinates["chr"], coordinates["start"]), np.arange(len(grid)))
+    assert list(grid.columns(np.array([b"chrX", b"chr1", b"chr1"]), np.array([1, 2, 1_000_001]))) == [-1, -1, -1]
+    # Every window computed from observations on the chromosomes is on the grid.
+    windows = scheme.aggregate(random_observations(500, 0, "barcode1", CHROM_SIZES, split=0.8)).data
+    assert (grid.columns(windows["chr"], windows["start"]) >= 0).all()
+    region = grid.chromosome_columns("chr1", 1200, 1600)
+    assert [tuple(it)[1:] for it in grid.coordinates(region)] == [(501, 1501), (1001, 2001), (1501, 2501)]
+
+def test_matrix_agg_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    out = Path("tests/assets/temp/matrix.h5")
+    sizes = Path("tests/assets/temp/chrom.sizes")
+    sizes.write_text("".join(f"{name}\t{length}\n" for name, length in CHROM_SIZES.items()))
+    expected = {}
+    with fct.h5.WriteSession(path) as session:
+        for i in range(40):
+            dataset = random_observations(500, i, f"barcode{i}", CHROM_SIZES, split=0.8)
+            session.write(dataset)
+            expected[dataset.barcode] = fct.windows.UniformWindowsAggregator(size=1000, name="1000").aggregate(dataset).data
+
+    runner = CliRunner()
+    for args in [["-p", "2", "-o", str(out)], ["--matrix-nz", "--max-rows-in-memory", "150", "-o", str(out.with_name("streamed.h5"))]]:
+        result = runner.invoke(facet, ["agg", "-u", "1000=1000", "--matrix", "--chrom-sizes", str(sizes), *args, str(path)])
+        assert result.exit_code == 0, result.output
+
+    for h5, columns in [(out, ["c", "t"]), (out.with_name("streamed.h5"), ["c", "t", "c_nz", "t_nz"])]:
+        with h5py.File(h5) as file:
+            store = fct.h5.MatrixStore.open(file, "CG", "1000")
+            assert "/CG" not in file and store.columns == columns
+            assert sorted(store.barcodes) == sorted(expected)
+            assert file["/metadata/matrices/CG/1000/c"].shape == (40, 28)
+            for barcode, windows in expected.items():
+                row = np.zeros(28, dtype=np.int64)
+                row[store.grid.columns(windows["chr"], windows["start"])] = windows["c"]
+                assert np.array_equal(store.read("c", [barcode])[0], row)
+            region = store.read("t", ["barcode3", "barcode1"], "chr2:1000-3000")
+            assert region.shape == (2, 3) and np.array_equal(store.coordinates("chr2:1000-3000")["start"], [1, 1001, 2001])
+            assert np.array_equal(region[1], store.read("t", ["barcode1"])[0, 22:25])
+            with pytest.raises(fct.h5.UnknownBarcodes):
+                store.read("c", ["missing"])
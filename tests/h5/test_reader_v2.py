@@ -1,6 +1,7 @@
 from pathlib import Path
 import numpy as np
 import polars as pl
+import pytest
 import amethyst_facet as fct
 from ..util import *
 
@@ -116,4 +117,92 @@ def test_reader_observations_windows(cleanup_temp):
     assert all(it.name == "o" for it in o)
     assert all(it.equals(expected_w) for it in w_df), "Window mismatch"
     assert all(it.equals(expected_o) for it in o_df), "Observations mismatch"
-    
\ No newline at end of file
+    
+def test_reader_observation_slices(cleanup_temp):
+    base = Path("tests/assets/temp")
+    data = np.array([("1", 1, 0, 0), ("1", 5, 1, 1), ("2", 1, 1, 0), ("2", 3, 0, 1), ("3", 2, 1, 1)], dtype=fct.h5.dataset.observations_dtype)
+    unsorted = data[[0, 2, 1, 3, 4]]
+    fct.h5.Dataset("CG", "sorted", "1", data).write(base / "file1.h5")
+    fct.h5.Dataset("CG", "unsorted", "1", unsorted).write(base / "file1.h5")
+
+    reader = fct.h5.ReaderV2(paths=[base / "file1.h5"], only={"barcodes": {"sorted"}})
+    items = [item for slices in reader.observation_slices(2) for item in slices]
+    assert [boundary for _, boundary in items] == [("2", 1), ("3", 2), None]
+    assert np.array_equal(np.concatenate([it.data for it, _ in items]), data)
+
+    reader = fct.h5.ReaderV2(paths=[base / "file1.h5"], only={"barcodes": {"unsorted"}})
+    with pytest.raises(fct.h5.slices.UnsortedObservations):
+        for slices in reader.observation_slices(2):
+            list(slices)
+
+def test_reader_query(cleanup_temp):
+    base = Path("tests/assets/temp")
+    rng = np.random.default_rng(0)
+    chroms = np.repeat(["1", "2", "10"], [300, 5, 200])
+    pos = np.concatenate([np.sort(rng.choice(5000, size, replace=False)) for size in [300, 5, 200]])
+    data = np.zeros(len(pos), dtype=fct.h5.dataset.observations_dtype)
+    data["chr"], data["pos"], data["c"], data["t"] = chroms, pos, rng.integers(0, 3, len(pos)), rng.integers(0, 3, len(pos))
+    observations = fct.h5.Dataset("CG", "barcode1", "1", data)
+    observations.write(base / "query.h5")
+    fct.h5.Dataset("CG", "barcode2", "1", data[::2]).write(base / "query.h5")
+    windows = fct.windows.UniformWindowsAggregator(size=100, step=25, offset=1, name="100").aggregate(observations)
+    windows.write(base / "query.h5")
+    variable = fct.windows.VariableWindowsAggregator(
+        name="variable",
+        windows=pl.DataFrame({"chr": ["1", "1", "1", "10"], "start": [0, 50, 1000, 300], "end": [4000, 60, 1200, 301]})
+    ).aggregate(observations)
+    variable.write(base / "query.h5")
+
+    reader = fct.h5.ReaderV2(paths=[base / "query.h5"])
+    for region in ["1:1000-2000", "10:0-50", "2", "1:4990-", "X:1-100", "1:3000-3000"]:
+        parsed = fct.h5.Region.parse(region)
+        results = list(reader.query(region, barcodes=["barcode1"]))
+        assert sorted(it.name for it in results) == ["1", "100", "variable"]
+        for result, source in zip(sorted(results, key=lambda it: it.name), [observations, windows, variable]):
+            expected = source.data[parsed.overlaps(source.data)]
+            assert np.array_equal(result.data, expected)
+
+    results = list(reader.query("1:1000-2000", names=["1"]))
+    assert sorted(it.barcode for it in results) == ["barcode1", "barcode2"]
+    with pytest.raises(fct.h5.InvalidRegion):
+        list(reader.query("1:2000-1000"))
+
+def test_reader_query_unsorted_block(cleanup_temp):
+    base = Path("tests/assets/temp")
+    rng = np.random.default_rng(0)
+    data = np.zeros(400, dtype=fct.h5.dataset.observations_dtype)
+    data["chr"], data["pos"] = np.repeat(["1", "2"], 200), rng.permutation(np.arange(400)*10)
+    data["c"], data["t"] = rng.integers(0, 3, 400), rng.integers(0, 3, 400)
+    observations = fct.h5.Dataset("CG", "barcode1", "1", data)
+    observations.write(base / "query.h5")
+    ordered = np.sort(data, order=["chr", "pos"])
+    fct.h5.Dataset("CG", "barcode2", "1", ordered).write(base / "query.h5")
+
+    # Chromosomes are contiguous but positions are not sorted, so the blocks cannot be bisected.
+    region = fct.h5.Region.parse("1:1000-2000")
+    with fct.h5.open(base / "query.h5", "r") as file:
+        assert region.rows(file["/CG/barcode1/1"]) is None
+        assert region.rows(file["/CG/barcode1/1"], ordered=True) is not None
+        lo, hi = region.rows(file["/CG/barcode2/1"])
+        assert np.array_equal(ordered[lo:hi], ordered[region.overlaps(ordered)])
+    result = next(fct.h5.ReaderV2(paths=[base / "query.h5"]).query(region, barcodes=["barcode1"]))
+    assert np.array_equal(result.data, data[region.overlaps(data)])
+    assert len(result.data) > 0
+
+def test_reader_lazy(cleanup_temp):
+    base = Path("tests/assets/temp")
+    data = np.array([("1", 1, 0, 0), ("2", 1, 1, 1)], dtype=fct.h5.dataset.observations_dtype)
+    fct.h5.Dataset("CG", "barcode1", "1", data).write(base / "lazy.h5")
+    fct.h5.Dataset("CH", "barcode2", "1", data).write(base / "lazy.h5")
+    reader = fct.h5.ReaderV2(paths=[base / "lazy.h5"])
+
+    lazy = list(reader.observations(lazy=True))
+    eager = list(reader.observations())
+    assert all(it.loaded is None for it in lazy)
+    assert [(it.context, it.barcode, it.name, len(it), it.format) for it in lazy] == [
+        (it.context, it.barcode, it.name, len(it.data), it.format) for it in eager
+    ]
+    assert np.array_equal(lazy[0].read(["chr", "pos"]), data[["chr", "pos"]])
+    assert lazy[0].loaded is None
+    assert all(it.load() == expected for it, expected in zip(lazy, eager))
+    assert lazy[0].pl().equals(eager[0].pl())
@@ -0,0 +1,85 @@
+import dataclasses as dc
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+
+def test_shared_windows_roundtrip(cleanup_temp):
+    path = Path("tests/assets/temp/shared.h5")
+    aggregator = fct.windows.UniformWindowsAggregator(size=1000, step=1000, name="1000")
+    expected = [aggregator.aggregate(random_observations(3000, i, f"barcode{i}")) for i in range(3)]
+    with fct.h5.WriteSession(path, shared_windows=True) as session:
+        for windows in expected:
+            session.write(dc.replace(windows, attrs={"size": 1000}))
+    with h5py.File(path) as file:
+        table = file["/metadata/windows/1000"]
+        stored = file["/CG/barcode1/1000"]
+        assert stored.dtype.names == ("window_index", "c", "t", "c_nz", "t_nz")
+        assert stored.attrs["coordinates"] == table.name
+        assert len(table) == len(np.unique(np.concatenate([it.data[["chr", "start", "end"]] for it in expected])))
+        catalog = fct.h5.read_catalog(file)
+        assert catalog["kind"].to_list() == ["windows"]*3 and catalog["sorted"].all()
+
+    reader = fct.h5.ReaderV2(paths=[path])
+    read = sorted(reader.windows(), key=lambda it: it.barcode)
+    for windows, expect in zip(read, expected):
+        assert np.array_equal(windows.data, expect.data) and windows.attrs == {"size": 1000}
+    region = next(it for it in reader.query("chr2:10000-20000") if it.barcode == "barcode2")
+    assert np.array_equal(region.data, expected[2].data[(expected[2].data["chr"] == b"chr2") & (expected[2].data["start"] < 20000) & (expected[2].data["end"] > 10000)])
+    lazy = next(it for it in reader.windows(lazy=True) if it.barcode == "barcode0")
+    assert np.array_equal(lazy.read(["start", "c"], slice(5, 10)), expected[0].data[["start", "c"]][5:10])
+
+def test_shared_windows_append(cleanup_temp):
+    path = Path("tests/assets/temp/shared.h5")
+    windows = fct.windows.UniformWindowsAggregator(size=1000, step=1000, name="1000").aggregate(random_observations(3000, 0, "barcode1"))
+    half = len(windows.data)//2
+    dc.replace(windows, data=windows.data[:half]).appendv2(path, shared_windows=True, compact_dtypes=True)
+    dc.replace(windows, data=windows.data[half:]).appendv2(path)
+    with h5py.File(path) as file:
+        assert fct.h5.is_shared(file["/CG/barcode1/1000"])
+        assert fct.h5.read_catalog(file)["sorted"].to_list()[-1]
+    assert np.array_equal(next(fct.h5.ReaderV2(paths=[path]).windows()).data, windows.data)
+
+def test_shared_windows_recreated_table(cleanup_temp):
+    path = Path("tests/assets/temp/shared.h5")
+    dtype = np.dtype([("chr", "S10"), ("start", "<i8"), ("end", "<i8")])
+    tables = []
+    for start in [0, 5000]:
+        windows = np.array([(b"chr1", start + i*10, start + i*10 + 10) for i in range(4)], dtype=dtype)
+        with fct.h5.open(path, "a") as file:
+            if "/metadata/windows/10" in file:
+                del file["/metadata/windows/10"]
+            table = fct.h5.WindowsTable(file, "10")
+            table.indices(windows, dtype)
+            # Tables of the same length recreated at the same path are not served from the cache.
+            tables.append(fct.h5.read_coordinates(file["/metadata/windows/10"]))
+        assert np.array_equal(tables[-1], windows)
+    assert not np.array_equal(*tables)
+
+def test_shared_windows_agg_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    with fct.h5.WriteSession(path) as session:
+        for i in range(2):
+            session.write(random_observations(3000, i, f"barcode{i}"))
+    runner = CliRunner()
+    result = runner.invoke(facet, ["agg", "-u", "1000=1000", "--shared-windows", str(path)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(facet, ["agg", "-u", "10000=10000", "--from-windows", "1000", "--shared-windows", str(path)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(facet, ["recompress", "--compression", "lzf", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert set(file["/metadata/windows"]) == {"1000", "10000"}
+        assert fct.h5.is_shared(file["/CG/barcode0/10000"])
+    for windows in fct.h5.ReaderV2(paths=[path], only={"windows": {"10000"}}).windows():
+        observed = next(it for it in fct.h5.ReaderV2(paths=[path]).observations() if it.barcode == windows.barcode)
+        expected = fct.windows.UniformWindowsAggregator(size=10000, step=10000, name="10000").aggregate(observed)
+        assert np.array_equal(windows.data, expected.data)
+    result = runner.invoke(facet, ["delete", "dataset", "1000", str(path)])
+    assert result.exit_code == 0, result.output
+    with h5py.File(path) as file:
+        assert set(file["/metadata/windows"]) == {"10000"}
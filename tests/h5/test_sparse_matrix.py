@@ -0,0 +1,85 @@
+from pathlib import Path
+
+from click.testing import CliRunner
+import h5py
+import numpy as np
+import amethyst_facet as fct
+from amethyst_facet.cli.commands.facet import facet
+from ..util import *
+from .test_matrix import CHROM_SIZES
+
+def dense(data, indices, indptr, shape):
+    matrix = np.zeros(shape, dtype=data.dtype)
+    for row in range(shape[0]):
+        matrix[row, indices[indptr[row]:indptr[row + 1]]] = data[indptr[row]:indptr[row + 1]]
+    return matrix
+
+def write_cells(path):
+    expected = {}
+    with fct.h5.WriteSession(path, chunk_rows=16) as session:
+        for i in range(30):
+            dataset = random_observations(500, i, f"barcode{i}", CHROM_SIZES, split=0.8)
+            session.write(dataset)
+            windows = fct.windows.UniformWindowsAggregator(size=1000, name="1000").aggregate(dataset)
+            session.write(windows)
+            expected[dataset.barcode] = windows.data
+    return expected
+
+def test_sparse_matrix_h5_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    out = Path("tests/assets/temp/matrices.h5")
+    expected = write_cells(path)
+    result = CliRunner().invoke(facet, ["matrix", "--chunk-rows", "64", "1000", str(out), str(path)])
+    assert result.exit_code == 0, result.output
+
+    with h5py.File(out) as file:
+        group = file["CG"]
+        barcodes = list(group["barcodes"].asstr()[:])
+        windows = group["windows"][:]
+        assert sorted(barcodes) == sorted(expected)
+        assert np.array_equal(windows, np.sort(windows, order=["chr", "start", "end"]))
+        assert group["c"].attrs["encoding-type"] == "csr_matrix"
+        assert group["t"]["indices"].id == group["c"]["indices"].id
+        matrices = {
+            name: dense(group[name]["data"][:], group[name]["indices"][:], group[name]["indptr"][:], tuple(group[name].attrs["shape"]))
+            for name in fct.h5.SPARSE_MATRICES
+        }
+    lookup = fct.h5.WindowColumns(windows)
+    for row, barcode in enumerate(barcodes):
+        data = expected[barcode]
+        columns = lookup.columns(data)
+        assert (columns >= 0).all() and (matrices["c"][row] > 0).sum() == (data["c"] > 0).sum()
+        assert np.array_equal(matrices["c"][row, columns], data["c"])
+        assert np.array_equal(matrices["t"][row, columns], data["t"])
+        assert np.allclose(matrices["frac"][row, columns], data["c"]/np.maximum(data["c"] + data["t"], 1))
+
+def test_sparse_matrix_npz_grid_e2e(cleanup_temp):
+    path = Path("tests/assets/temp/cells.h5")
+    sizes = Path("tests/assets/temp/chrom.sizes")
+    sizes.write_text("".join(f"{name}\t{length}\n" for name, length in CHROM_SIZES.items()))
+    expected = write_cells(path)
+    out = Path("tests/assets/temp/cells.npz")
+    result = CliRunner().invoke(facet, ["matrix", "--chrom-sizes", str(sizes), "1000", str(out), str(path)])
+    assert result.exit_code == 0, result.output
+    assert not out.with_name("cells.npz.tmp.h5").exists()
+
+    grid = fct.windows.WindowGrid(1000, 1000, 1, CHROM_SIZES)
+    with np.load(out.with_name("cells.CG.t.npz")) as loaded:
+        assert loaded["format"].item() == b"csr"
+        assert loaded["shape"].tolist() == [30, len(grid)]
+        assert np.array_equal(loaded["start"], grid.coordinates()["start"])
+        t = dense(loaded["data"], loaded["indices"], loaded["indptr"], tuple(loaded["shape"]))
+        for row, barcode in enumerate(loaded["barcodes"]):
+            data = expected[barcode]
+            assert np.array_equal(t[row, grid.columns(data["chr"], data["start"])], data["t"])
+
+def test_window_union_deduplicates_incrementally():
+    aggregator = fct.windows.UniformWindowsAggregator(size=1000, name="1000")
+    windows = [aggregator.aggregate(random_observations(500, i, f"barcode{i}", CHROM_SIZES, split=0.8)).data for i in range(10)]
+    union = fct.h5.WindowUnion(max_rows=100)
+    for data in windows:
+        union.add(data)
+        assert union.rows < 100
+    expected = np.unique(np.concatenate([data[["chr", "start", "end"]] for data in windows]))
+    columns = union.columns().coordinates
+    assert np.array_equal(columns, expected.astype(columns.dtype))
@@ -0,0 +1,50 @@
+from pathlib import Path
+import time
+
+import numpy as np
+import pytest
+import amethyst_facet as fct
+from ..util import *
+
+def datasets():
+    data = np.array([("1", 1, 0, 1), ("1", 5, 1, 1), ("2", 3, 2, 0)], dtype=fct.h5.dataset.observations_dtype)
+    return [
+        fct.h5.Dataset(context, f"barcode{i}", "1", data[:i + 1])
+        for context in ["CG", "CH"]
+        for i in range(3)
+    ]
+
+def test_dataset_writer_process_matches_in_process(cleanup_temp):
+    temp = Path("tests/assets/temp")
+    outputs = []
+    for process in [False, True]:
+        path = temp / f"writer_{process}.h5"
+        with fct.parallel.DatasetWriter(path, max_queued=1, process=process) as writer:
+            for dataset in datasets():
+                writer.write(dataset)
+        outputs.append(path.read_bytes())
+        written = list(fct.h5.ReaderV2(paths=[path]).observations())
+        assert sorted(written, key=lambda it: it.h5path) == datasets()
+    assert outputs[0] == outputs[1]
+
+def test_dataset_writer_failure(cleanup_temp):
+    path = Path("tests/assets/temp/writer.h5")
+    dataset = datasets()[0]
+    with pytest.raises(fct.parallel.WriterFailed):
+        with fct.parallel.DatasetWriter(path) as writer:
+            # Writing the same dataset twice fails in the writer process.
+            for _ in range(3):
+                writer.write(dataset)
+
+def test_dataset_writer_failure_keeps_caller_error(cleanup_temp):
+    path = Path("tests/assets/temp/writer.h5")
+    dataset = datasets()[0]
+    with pytest.raises(RuntimeError, match="caller"):
+        with fct.parallel.DatasetWriter(path) as writer:
+            writer.write(dataset)
+            writer.write(dataset)
+            while writer.errors.empty():
+                time.sleep(0.05)
+            raise RuntimeError("caller")
+    # The writer process was stopped and joined despite its failure.
+    assert writer.writer is None
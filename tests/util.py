@@ -2,7 +2,9 @@ import logging
 import os
 import shutil
 import sys
+import numpy as np
 import pytest
+import amethyst_facet as fct
 
 @pytest.fixture
 def cleanup_temp():
@@ -24,4 +26,20 @@ def cleanup_temp():
 
 def log(level):
     root = logging.getLogger()
-    root.setLevel(level)
\ No newline at end of file
+    root.setLevel(level)
+
+def random_observations(
+        nrows, seed=0, barcode="barcode1", chrom_sizes={"chr1": 200_000, "chr2": 200_000},
+        split=2/3, counts=(3, 3), context="CG", name="1"
+    ):
+    """Dataset of nrows random sites, the first split of them on the first chromosome of chrom_sizes
+    and the rest on the second, sorted by chr then pos. c and t are below the two counts."""
+    rng = np.random.default_rng(seed)
+    (chr1, size1), (chr2, size2) = chrom_sizes.items()
+    first = np.arange(nrows) < int(nrows*split)
+    data = np.zeros(nrows, dtype=fct.h5.dataset.observations_dtype)
+    data["chr"] = np.where(first, chr1.encode(), chr2.encode())
+    data["pos"] = np.where(first, rng.integers(1, size1, nrows), rng.integers(1, size2, nrows))
+    data["c"] = rng.integers(0, counts[0], nrows)
+    data["t"] = rng.integers(0, counts[1], nrows)
+    return fct.h5.Dataset(context, barcode, name, np.sort(data, order=["chr", "pos"]))